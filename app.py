@@ -1,16 +1,70 @@
+from html import escape
+
 import gradio as gr
 
-from src.core.diff import text2diff, diff2html, apply_diff
+from src.core.merge import merge_replacements
+from src.core.render import iter_html
+from src.core.replacements import ReplacementSet
+from src.core.session import SessionStore
+from src.core.stream import text2diff_stream_async
+
+# 预览只显示每处修改前后的若干行，长文档不必把全文发送到浏览器
+PREVIEW_CONTEXT_LINES = 3
+
+# 所有用户的编辑历史保存在服务端，gr.State 中只保存会话 ID 和待确认的修改
+SESSIONS = SessionStore()
+
+EXPIRED = "<p>会话已过期，请重新点击“AI修订”</p>"
+
+
+def _session(origin_text, session_id):
+    # 原文框的内容与会话当前版本不同（用户改了原文或会话已过期）时开始新会话
+    if session_id in SESSIONS:
+        if SESSIONS.text(session_id) == origin_text:
+            return session_id
+        SESSIONS.close(session_id)
+    return SESSIONS.create(origin_text)
+
+
+def _history(session_id):
+    _, can_undo, can_redo = SESSIONS.version(session_id)
+    return gr.update(interactive=can_undo), gr.update(interactive=can_redo)
+
+
+async def process(origin_text, text_input, session_id):
+    # 大模型每输出一条修改就刷新一次预览
+    session_id = _session(origin_text, session_id)
+    diff = ReplacementSet()
+    yield f"<pre>{escape(origin_text)}</pre>", session_id, diff
+    async for replacement in text2diff_stream_async(origin_text, text_input):
+        # 与已有修改重叠的丢弃，状态中保存排好序的 ReplacementSet
+        merged, conflicts = merge_replacements([diff, [replacement]])
+        if conflicts:
+            continue
+        diff = ReplacementSet(merged)
+        result = "".join(iter_html(origin_text, diff, context=PREVIEW_CONTEXT_LINES, by_lines=True))
+        yield f"<pre>{result}</pre>", session_id, diff
+
+
+def apply(session_id, diff):
+    # 应用后会话前进一个版本，原文框同步为新版本，可以继续下一轮修改
+    if session_id not in SESSIONS:
+        return EXPIRED, gr.update(), None, gr.update(interactive=False), gr.update(interactive=False)
+    text = SESSIONS.apply(session_id, diff or ())
+    return (f"<pre>{escape(text)}</pre>", text, None) + _history(session_id)
 
 
+def _move(step):
+    def move(session_id):
+        if session_id not in SESSIONS:
+            return EXPIRED, gr.update(), None, gr.update(interactive=False), gr.update(interactive=False)
+        text = step(session_id)
+        return (f"<pre>{escape(text)}</pre>", text, None) + _history(session_id)
+    return move
 
-def process(origin_text, text_input):
-    diff = text2diff(origin_text, text_input)
-    result = diff2html(origin_text, diff)
-    return f"<pre>{result}</pre>", origin_text, diff
 
-def apply(origin_text, diff):
-    return f"<pre>{apply_diff(origin_text, diff)}</pre>"
+undo = _move(SESSIONS.undo)
+redo = _move(SESSIONS.redo)
 
 
 # 示例数据
@@ -42,7 +96,7 @@ In the future, AI will work collaboratively with humans to create a better world
     ]
 
 with gr.Blocks() as demo:
-    origin_state = gr.State()
+    session_state = gr.State()
     diff_state = gr.State()
 
     with gr.Column():
@@ -53,7 +107,10 @@ with gr.Blocks() as demo:
                 origin_input = gr.Textbox(lines=30, show_label=False)
             with gr.TabItem("修订", id="h5_preview_tab"):
                 h5_preview = gr.HTML()
-                apply_btn = gr.Button("确认修改", variant="primary")
+                with gr.Row():
+                    apply_btn = gr.Button("确认修改", variant="primary")
+                    undo_btn = gr.Button("撤销", interactive=False)
+                    redo_btn = gr.Button("重做", interactive=False)
 
 
         gr.Markdown("## 第二步：描述你想要怎么修改, 再点击“AI修订”")
@@ -80,23 +137,26 @@ with gr.Blocks() as demo:
         queue=False  # 立即执行UI更新
     ).then(
         fn=process,
-        inputs=[origin_input, revision_input],
-        outputs=[h5_preview, origin_state, diff_state]
+        inputs=[origin_input, revision_input, session_state],
+        outputs=[h5_preview, session_state, diff_state]
     ).then(
         lambda: gr.update(interactive=True),
         inputs=None,
         outputs=apply_btn
     )
 
+    history_outputs = [h5_preview, origin_input, diff_state, undo_btn, redo_btn]
     apply_btn.click(
         fn=apply,
-        inputs=[origin_state, diff_state],
-        outputs=[h5_preview]
+        inputs=[session_state, diff_state],
+        outputs=history_outputs
     ).then(
         lambda: gr.update(interactive=False),
         inputs=None,
         outputs=apply_btn
     )
+    undo_btn.click(fn=undo, inputs=session_state, outputs=history_outputs)
+    redo_btn.click(fn=redo, inputs=session_state, outputs=history_outputs)
 
 
 
@@ -0,0 +1,161 @@
+"""
+text2diff 基准测试。
+
+用法（在仓库根目录运行）：
+    python -m benchmarks.run                          # 快速档：1KB ~ 1MB
+    python -m benchmarks.run --full                   # 完整档：1KB ~ 50MB，修改数 1 ~ 10k
+    python -m benchmarks.run --output bench.json --baseline old.json --threshold 1.2
+
+端到端的 text2diff 使用本地确定性的桩后端代替 text2diff_llm，不访问网络。
+结果写入 JSON；提供 --baseline 时与旧结果对比，任一项变慢超过阈值则以非零状态退出。
+"""
+import argparse
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+
+from benchmarks.corpus import make_corpus, make_revisions
+from src.core.diff import (
+    apply_diff,
+    diff2html,
+    diff2md,
+    exact_revision,
+    rebuild_text_with_positions,
+    split_text_by_sentences,
+    text2diff,
+)
+from src.core.providers import StubProvider, register_provider, use_provider
+
+QUICK_SIZES = [1024, 100 * 1024, 1024 * 1024]
+FULL_SIZES = [1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024]
+QUICK_EDITS = [1, 100]
+FULL_EDITS = [1, 100, 1000, 10000]
+CORPORA = ["zh", "en", "mixed"]
+
+MARKER_PATTERN = re.compile(r"‖start:(\d+)‖([^‖]{2})")
+
+
+def mock_responder(edits: int):
+    """
+    确定性的桩模型：从提示词中的位置标记里均匀挑选 edits 个句子，把每句开头两个字替换为“修订”。
+    """
+    def respond(system: str, user: str) -> str:
+        marks = MARKER_PATTERN.findall(user)
+        count = min(edits, len(marks))
+        step = len(marks) / count if count else 1
+        items = [
+            {"sentence_start": int(marks[int(i * step)][0]), "original": marks[int(i * step)][1], "content": "修订"}
+            for i in range(count)
+        ]
+        return json.dumps(items, ensure_ascii=False)
+    return respond
+
+
+def measure(fn, repeat: int) -> dict:
+    """
+    运行 fn repeat 次，返回最小值和中位数（秒）。
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def run_benchmarks(sizes, edit_counts, corpora, repeat: int, log=print) -> list:
+    results = []
+
+    def record(name, corpus, size, edits, fn):
+        # 大文本只跑一次，避免压测时间过长
+        stats = measure(fn, repeat if size <= 1024 * 1024 else 1)
+        results.append({"name": name, "corpus": corpus, "size": size, "edits": edits, **stats})
+        log(f"{name:<28} {corpus:<6} {size:>10}B edits={str(edits):<6} {stats['min'] * 1000:10.3f} ms")
+
+    for corpus in corpora:
+        for size in sizes:
+            text = make_corpus(corpus, size)
+            sentences = split_text_by_sentences(text)
+
+            record("split_text_by_sentences", corpus, size, None, lambda: split_text_by_sentences(text))
+            record("rebuild_text_with_positions", corpus, size, None, lambda: rebuild_text_with_positions(sentences))
+
+            for edits in edit_counts:
+                revisions = make_revisions(sentences, edits)
+                replacements = exact_revision(text, revisions)
+
+                record("exact_revision", corpus, size, edits, lambda: exact_revision(text, revisions))
+                record("apply_diff", corpus, size, edits, lambda: apply_diff(text, replacements))
+                record("diff2html", corpus, size, edits, lambda: diff2html(text, replacements))
+                record("diff2md", corpus, size, edits, lambda: diff2md(text, replacements))
+
+                register_provider("bench-mock", StubProvider(name="bench-mock", model="bench-mock", responder=mock_responder(edits)))
+                use_provider("bench-mock")
+                try:
+                    record("text2diff", corpus, size, edits, lambda: text2diff(text, "修改", use_cache=False))
+                finally:
+                    use_provider(None)
+
+    return results
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    与基线结果对比，返回变慢超过阈值的项。
+    """
+    def key(r):
+        return (r["name"], r["corpus"], r["size"], r["edits"])
+
+    old = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = old.get(key(r))
+        if base and base["min"] > 0 and r["min"] / base["min"] > threshold:
+            regressions.append({**r, "baseline_min": base["min"], "ratio": r["min"] / base["min"]})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="text2diff benchmarks")
+    parser.add_argument("--full", action="store_true", help="run sizes up to 50MB and up to 10k edits")
+    parser.add_argument("--corpus", choices=CORPORA, action="append", help="corpus kinds to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="previous result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = FULL_SIZES if args.full else QUICK_SIZES
+    edit_counts = FULL_EDITS if args.full else QUICK_EDITS
+    results = run_benchmarks(sizes, edit_counts, args.corpus or CORPORA, args.repeat)
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "full": args.full,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['name']} {r['corpus']} {r['size']}B edits={r['edits']}: "
+                  f"{r['baseline_min'] * 1000:.3f} ms -> {r['min'] * 1000:.3f} ms (x{r['ratio']:.2f})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
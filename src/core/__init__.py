@@ -1,35 +1,20 @@
-import os
-import openai
-import ell
-import sys
-
-#免费中文大模型
-MODEL_NAME = "glm-4-flash"
-api_key = os.getenv("ZHIPU_API_KEY")
-
-client = openai.OpenAI(
-    api_key=api_key,
-    base_url="https://open.bigmodel.cn/api/paas/v4/"
-) 
-ell.config.register_model(MODEL_NAME, client)
-
-# MODEL_NAME = "deepseek-chat"
-# api_key = os.getenv("DEEPSEEK_API_KEY")
-
-# client = openai.OpenAI(
-#     api_key=api_key,
-#     base_url="https://api.deepseek.com"
-# ) 
-# ell.config.register_model(MODEL_NAME, client)
-
-
-#有OPENAI API KEY的可以换成OPENAI的模型
-#由于默认client就是openai的，所以只需要修改MODEL_NAME即可，无需额外调用register_model
-
-# MODEL_NAME = "gpt-4o-mini"
-
-ell.init(store='./logdir', autocommit=True, verbose=True)
-
-#把当前可用的model打印出来
-print(f"ell init success, current model: {MODEL_NAME}")
-
+# 大模型后端在第一次使用时才初始化：导入 src.core 不会创建客户端、初始化 ell 或打印日志。
+# 后端的选择和配置见 src/core/providers.py，可以通过环境变量或 TEXT2DIFF_CONFIG 配置文件切换，例如：
+#
+#   export TEXT2DIFF_PROVIDER=deepseek     # 内置 zhipu（默认）/ deepseek / openai / pool / stub
+#   export TEXT2DIFF_MODEL=deepseek-chat   # 可选，覆盖默认模型名
+#
+# pool 把多个后端组成后端池，对慢请求发起对冲请求并熔断故障后端：
+#
+#   export TEXT2DIFF_PROVIDER=pool
+#   export TEXT2DIFF_BACKENDS=zhipu,deepseek
+
+
+def __getattr__(name):
+    # 兼容旧代码中的 from src.core import MODEL_NAME / client / async_client
+    from src.core.providers import get_provider
+    if name == "MODEL_NAME":
+        return get_provider().model
+    if name in ("client", "async_client"):
+        return getattr(get_provider(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
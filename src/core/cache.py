@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class DiffCache:
+    """
+    大模型返回结果的内容寻址缓存。
+
+    - 键是 (模型名, 提示词版本, 带位置标记的原文, 修改建议) 的 sha256
+    - 内存热层：按 LRU 保留最近使用的条目
+    - 磁盘层：每个条目一个文件，按模型名分目录存放，超出容量时按最近访问时间淘汰
+    - 多进程共享同一目录时，写入使用临时文件 + os.replace 原子替换，读取和淘汰容忍文件被其他进程删除
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, prompt_version: int,
+                 max_bytes: int = 256 * 1024 * 1024, memory_items: int = 256, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.enabled = enabled
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # 本进程估算的磁盘占用，None 表示尚未扫描
+        self._approx_bytes = None
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    @property
+    def model_dir(self) -> str:
+        # 模型名可能包含 "/" 等字符，替换后作为目录名
+        return os.path.join(self.cache_dir, re.sub(r"[^\w.-]", "_", self.model_name))
+
+    def key(self, text_with_pos: str, revision_text: str, variant: str = "") -> str:
+        """
+        计算缓存键，variant 用于区分同一模型下的不同提示词。
+        """
+        parts = [self.model_name, self.prompt_version, text_with_pos, revision_text]
+        if variant:
+            parts.append(variant)
+        payload = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.model_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存，先查内存再查磁盘，未命中返回 None。
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 刷新修改时间，供 LRU 淘汰使用
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        写入缓存，同时写入内存和磁盘。
+        """
+        with self._lock:
+            self._remember(key, value)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._disk_usage()
+            else:
+                self._approx_bytes += size
+            over = self._approx_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._iter_files())
+
+    def evict(self) -> None:
+        """
+        按最近访问时间淘汰磁盘条目，直到占用降到容量的 90% 以下。
+        """
+        entries = sorted(self._iter_files(), key=lambda x: x[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._approx_bytes = total
+
+    def invalidate(self) -> None:
+        """
+        清空当前模型的缓存（内存和磁盘），用于切换 MODEL_NAME 或提示词后手动失效。
+        """
+        with self._lock:
+            self._memory.clear()
+            self._approx_bytes = None
+        shutil.rmtree(self.model_dir, ignore_errors=True)
+
+    def clear(self) -> None:
+        """
+        清空整个缓存目录，包括其他模型的缓存。
+        """
+        with self._lock:
+            self._memory.clear()
+            self._approx_bytes = None
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        """
+        返回命中与未命中计数。
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from src.core.diff import (
+    _repair_call,
+    split_text_by_sentences,
+    rebuild_text_with_positions,
+    exact_revision,
+    text2diff_llm_cached,
+)
+from src.core.index import SentenceIndex
+from src.core.merge import merge_replacements
+from src.core.metrics import estimate_tokens, stage
+from src.core.repair import REPAIR_ATTEMPTS, parse_revisions, repair_revisions
+
+
+def split_windows(sentences: List[Tuple[int, str]], max_tokens: int = 2000, overlap: int = 1) -> List[List[Tuple[int, str]]]:
+    """
+    按 token 预算把句子列表切分为若干窗口，相邻窗口之间重叠 overlap 个句子。
+    单个句子超过预算时独占一个窗口。
+
+    Args:
+        sentences (List[Tuple[int, str]]): split_text_by_sentences 的输出
+        max_tokens (int): 每个窗口的 token 预算
+        overlap (int): 相邻窗口重叠的句子数
+
+    Returns:
+        List[List[Tuple[int, str]]]: 窗口列表，每个窗口是连续的句子
+    """
+    windows = []
+    i = 0
+    while i < len(sentences):
+        j = i
+        tokens = 0
+        while j < len(sentences):
+            cost = estimate_tokens(sentences[j][1])
+            if j > i and tokens + cost > max_tokens:
+                break
+            tokens += cost
+            j += 1
+        windows.append(sentences[i:j])
+        if j >= len(sentences):
+            break
+        # 下一个窗口回退 overlap 个句子，但必须保证向前推进
+        i = max(j - overlap, i + 1)
+    return windows
+
+
+def _text2diff_window(window: List[Tuple[int, str]], revision_text: str, use_cache: bool = True,
+                     repair_attempts: int = REPAIR_ATTEMPTS, stats: dict = None) -> List[Tuple[int, int, str]]:
+    """
+    对单个窗口调用大模型，并把窗口内的局部位置转换回全文位置。
+    输出完全无法解析时该窗口没有修改，不影响其他窗口；无法定位的修改在窗口内修复。
+    """
+    base = window[0][0]
+    local = [(start - base, chunk) for start, chunk in window]
+    window_text = "".join(chunk for _, chunk in window)
+    index = SentenceIndex(window_text, local)
+
+    resp = text2diff_llm_cached(rebuild_text_with_positions(local), revision_text, use_cache)
+    failed = []
+    try:
+        revisions = parse_revisions(resp, failed)
+    except ValueError:
+        if stats is not None:
+            stats["failed_windows"] = 1
+        return []
+
+    # 只在窗口内定位，避免匹配到窗口外的同名文本
+    replacements = exact_revision(window_text, revisions, index, failed)
+    if failed:
+        with stage("repair"):
+            replacements += repair_revisions(index, failed, replacements, _repair_call, repair_attempts, stats)
+    return [(start + base, end + base, content) for start, end, content in replacements]
+
+
+def text2diff_chunked(origin_text: str, revision_text: str, max_tokens: int = 2000, overlap: int = 1, max_workers: int = 4,
+                      use_cache: bool = True, repair_attempts: int = REPAIR_ATTEMPTS, stats: dict = None) -> List[Tuple[int, int, str]]:
+    """
+    分块并发版本的 text2diff，适用于长文档。
+    把文本按句子切成带重叠的窗口，并发调用大模型，再合并各窗口的结果。
+    单个窗口的输出无法解析时只丢弃该窗口。
+
+    Args:
+        origin_text (str): 原始文本
+        revision_text (str): 修改建议
+        max_tokens (int): 每个窗口的 token 预算
+        overlap (int): 相邻窗口重叠的句子数
+        max_workers (int): 并发调用大模型的最大线程数
+        use_cache (bool): 是否使用大模型结果缓存
+        repair_attempts (int): 每个窗口修复无法定位的修改时最多请求大模型的次数，0 表示不修复
+        stats (dict): 可选，写入各窗口之和：failed_windows（输出无法解析的窗口数）、repair_attempts / repaired / unrepaired
+
+    Returns:
+        List[Tuple[int, int, str]]: 按 start 升序排列的替换列表
+    """
+    windows = split_windows(split_text_by_sentences(origin_text), max_tokens, overlap)
+    window_stats = [{} for _ in windows]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda window, ws: _text2diff_window(window, revision_text, use_cache, repair_attempts, ws),
+                                windows, window_stats))
+
+    if stats is not None:
+        for key in ("failed_windows", "repair_attempts", "repaired", "unrepaired"):
+            stats[key] = sum(ws.get(key, 0) for ws in window_stats)
+
+    # 合并结果，去掉重叠区域重复命中的修改；不同窗口给出的相互重叠的修改只保留先出现的
+    merged, _ = merge_replacements(results)
+    return merged
@@ -0,0 +1,339 @@
+"""
+text2diff 批量修订命令行工具。
+
+用法（安装后，或在仓库根目录用 python -m src.core.cli 运行）：
+    text2diff jobs.jsonl --output results.jsonl --output-dir revised/ --render html \\
+        --workers 4 --concurrency 16 --rate 10
+
+任务文件每行一个 JSON：{"id"?, "path", "instruction", "output"?}，path 和 output 为相对任务文件所在目录的路径；
+也可以传入一个目录，依次读取其中所有的 .jsonl 文件。
+
+- 分句、规则匹配、定位、应用修改和渲染在进程池中进行（--workers 0 时在当前进程中进行）
+- 大模型调用在主进程中以协程并发，受全局并发数（--concurrency）和每秒请求数（--rate）限制；
+  无法定位的修改只带相关句子重新询问（--repair-attempts），修复请求同样受这两个限制
+- 每个任务完成后立即向结果文件追加一行；再次运行时跳过结果文件中已成功的任务
+- 每次大模型调用能解析的返回都写入检查点文件（默认为结果文件加 .ckpt 后缀），
+  中断后重新运行会直接使用其中的结果，不会重复已经付费的调用；无法解析的返回不保存，下次运行重新调用
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Iterator, Optional
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+
+from src.core.diff import (
+    _prepare,
+    _repair_call_async,
+    apply_diff,
+    exact_revision,
+    get_llm_cache,
+    text2diff_llm_cached_async,
+)
+from src.core.index import SentenceIndex
+from src.core.merge import merge_replacements
+from src.core.metrics import stage
+from src.core.providers import use_provider
+from src.core.render import iter_html, iter_md
+from src.core.repair import REPAIR_ATTEMPTS, is_salvageable, parse_revisions, repair_revisions_async
+
+RENDER_SUFFIXES = {"html": ".html", "md": ".md"}
+
+
+class RateLimiter:
+    """
+    按固定间隔放行请求，rate 为每秒请求数，为 0 时不限速。
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _resolve(base: str, path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def iter_jobs(source: str) -> Iterator[dict]:
+    """
+    逐行读取任务，source 可以是 JSONL 文件或包含 JSONL 文件的目录。
+    未指定 id 的任务以 "文件名:行号" 作为 id，保证多次运行时相同。
+
+    Raises:
+        ValueError: 任务格式错误
+    """
+    if os.path.isdir(source):
+        files = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(".jsonl"))
+    else:
+        files = [source]
+    for file in files:
+        base = os.path.dirname(os.path.abspath(file))
+        with open(file, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                if not isinstance(job.get("path"), str) or not isinstance(job.get("instruction"), str):
+                    raise ValueError(f"{file}:{lineno}: job needs string 'path' and 'instruction'")
+                job["id"] = str(job.get("id") or f"{os.path.basename(file)}:{lineno}")
+                job["path"] = _resolve(base, job["path"])
+                if job.get("output"):
+                    job["output"] = _resolve(base, job["output"])
+                yield job
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def prepare_job(job: dict, use_rules: bool) -> dict:
+    """
+    进程池中的第一阶段：分句、构建句子索引、规则匹配，并构建剩余指令的提示词。
+    句子索引（含原文）随结果返回，后续阶段直接复用，不再重新读取文件和分句。
+    """
+    stats = {}
+    index, revisions, text_with_pos, leftover = _prepare(_read(job["path"]), job["instruction"], None, use_rules, stats)
+    return {"index": index, "revisions": revisions, "text_with_pos": text_with_pos, "leftover": leftover,
+            "stats": stats}
+
+
+def resolve_job(index: SentenceIndex, revisions: list, resp: Optional[str]) -> dict:
+    """
+    进程池中的第二阶段：解析大模型的输出并定位，返回定位成功的修改和需要修复的修改。
+    """
+    failed = []
+    if resp is not None:
+        revisions = revisions + parse_revisions(resp, failed)
+    return {"replacements": exact_revision(index.text, revisions, index, failed), "failed": failed}
+
+
+def finish_job(job: dict, index: SentenceIndex, replacements: list, unresolved: int, output_dir: Optional[str],
+               render: Optional[str]) -> dict:
+    """
+    进程池中的第三阶段：合并修改、应用并写出修订后的文本和渲染结果。
+    """
+    text = index.text
+    # 互相重叠的修改只保留先出现的
+    merged, conflicts = merge_replacements([replacements])
+    result = {
+        "id": job["id"],
+        "path": job["path"],
+        "replacements": [list(r) for r in merged],
+        "unresolved": unresolved,
+        "conflicts": len(conflicts),
+    }
+
+    output = job.get("output")
+    if not output and output_dir:
+        name = job["id"].replace(os.sep, "_").replace(":", "_")
+        output = os.path.join(output_dir, name + os.path.splitext(job["path"])[1])
+    if output:
+        _write(output, apply_diff(text, merged))
+        result["output"] = output
+        if render:
+            rendered = os.path.splitext(output)[0] + RENDER_SUFFIXES[render]
+            chunks = iter_html(text, merged) if render == "html" else iter_md(text, merged)
+            _write(rendered, "".join(chunks))
+            result["rendered"] = rendered
+    return result
+
+
+class _InlineExecutor(Executor):
+    """
+    --workers 0 时在当前进程中同步执行，便于调试。
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class JournalFile:
+    """
+    只追加的 JSONL 文件，每次写入后 flush 并 fsync。
+    打开时丢弃上次崩溃留下的不完整的最后一行。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = []
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            if len(complete) != len(data):
+                with open(path, "r+b") as f:
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8").splitlines():
+                if line.strip():
+                    self.records.append(json.loads(line))
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def run_jobs(jobs, output_path: str, checkpoint_path: Optional[str] = None, output_dir: Optional[str] = None,
+                   render: Optional[str] = None, workers: int = os.cpu_count() or 1, concurrency: int = 16,
+                   rate: float = 0.0, use_cache: bool = True, use_rules: bool = True,
+                   repair_attempts: int = REPAIR_ATTEMPTS) -> dict:
+    """
+    批量执行任务，返回汇总统计。
+
+    Args:
+        jobs: 任务的可迭代对象，见 iter_jobs
+        output_path (str): 结果文件（JSONL），每完成一个任务追加一行
+        checkpoint_path (Optional[str]): 大模型返回结果的检查点文件，默认为 output_path + ".ckpt"
+        output_dir (Optional[str]): 未指定 output 的任务的修订结果写入该目录
+        render (Optional[str]): "html" 或 "md"，与修订结果一同写出渲染后的差异
+        workers (int): 进程池大小，0 表示在当前进程中执行
+        concurrency (int): 同时进行的大模型调用数上限
+        rate (float): 每秒发起的大模型调用数上限，0 表示不限速
+        use_cache (bool): 是否使用大模型结果缓存
+        use_rules (bool): 是否先用规则处理能识别的指令
+        repair_attempts (int): 每个任务修复无法定位的修改时最多请求大模型的次数，0 表示不修复
+
+    Returns:
+        dict: {"done", "skipped", "failed", "llm_calls", "reused_responses"}
+    """
+    results = JournalFile(output_path)
+    checkpoint = JournalFile(checkpoint_path or output_path + ".ckpt")
+    completed = {r["id"] for r in results.records if "error" not in r}
+    responses = {(r["id"], r["key"]): r["response"] for r in checkpoint.records if is_salvageable(r["response"])}
+    summary = {"done": 0, "skipped": 0, "failed": 0, "llm_calls": 0, "reused_responses": 0}
+
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else _InlineExecutor()
+    llm_slots = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+    # 限制同时处理中的任务数，任务文件很大时也不会一次性读入所有文档
+    job_slots = asyncio.Semaphore(concurrency + 2 * max(workers, 1))
+
+    async def llm(job: dict, text_with_pos: str, leftover: str) -> str:
+        key = get_llm_cache().key(text_with_pos, leftover)
+        resp = responses.get((job["id"], key))
+        if resp is not None:
+            summary["reused_responses"] += 1
+            return resp
+        async with llm_slots:
+            await limiter.acquire()
+            resp = await text2diff_llm_cached_async(text_with_pos, leftover, use_cache)
+        summary["llm_calls"] += 1
+        # 与 cache_response 一样只保存能解析的结果，否则重新运行时会一直重放同一个错误的输出
+        if is_salvageable(str(resp)):
+            checkpoint.append({"id": job["id"], "key": key, "response": str(resp)})
+        return resp
+
+    async def repair_call(text_with_pos: str, revision_text: str) -> str:
+        async with llm_slots:
+            await limiter.acquire()
+            resp = await _repair_call_async(text_with_pos, revision_text)
+        summary["llm_calls"] += 1
+        return resp
+
+    async def process(job: dict) -> None:
+        try:
+            prepared = await loop.run_in_executor(executor, functools.partial(prepare_job, job, use_rules))
+            index, stats = prepared["index"], prepared["stats"]
+            resp = None
+            if prepared["text_with_pos"] is not None:
+                resp = await llm(job, prepared["text_with_pos"], prepared["leftover"])
+            resolved = await loop.run_in_executor(executor, functools.partial(
+                resolve_job, index, prepared["revisions"], resp))
+            replacements, failed = resolved["replacements"], resolved["failed"]
+            # 无法定位的修改在主进程中修复，和首次调用共用并发数和速率限制
+            if failed:
+                with stage("repair"):
+                    replacements = replacements + await repair_revisions_async(
+                        index, failed, replacements, repair_call, repair_attempts, stats)
+            result = await loop.run_in_executor(executor, functools.partial(
+                finish_job, job, index, replacements, stats.get("unrepaired", 0), output_dir, render))
+            result["stats"] = stats
+            summary["done"] += 1
+        except Exception as e:
+            result = {"id": job["id"], "path": job["path"], "error": f"{type(e).__name__}: {e}"}
+            summary["failed"] += 1
+        results.append(result)
+
+    tasks = set()
+    try:
+        for job in jobs:
+            if job["id"] in completed:
+                summary["skipped"] += 1
+                continue
+            await job_slots.acquire()
+            task = asyncio.create_task(process(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: job_slots.release())
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown()
+        results.close()
+        checkpoint.close()
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="text2diff", description="Revise documents in bulk with text2diff")
+    parser.add_argument("jobs", help="JSONL job file, or a directory of JSONL job files")
+    parser.add_argument("--output", "-o", help="results JSONL (default: <jobs>.results.jsonl)")
+    parser.add_argument("--checkpoint", help="LLM response checkpoint (default: <output>.ckpt)")
+    parser.add_argument("--output-dir", help="write revised documents here for jobs without an 'output'")
+    parser.add_argument("--render", choices=sorted(RENDER_SUFFIXES), help="also write the rendered diff")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="process pool size, 0 runs inline")
+    parser.add_argument("--concurrency", type=int, default=16, help="max concurrent LLM calls")
+    parser.add_argument("--rate", type=float, default=0.0, help="max LLM calls per second, 0 for unlimited")
+    parser.add_argument("--provider", help="backend name, see src/core/providers.py")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the LLM response cache")
+    parser.add_argument("--no-rules", action="store_true", help="send every instruction to the LLM")
+    parser.add_argument("--repair-attempts", type=int, default=REPAIR_ATTEMPTS,
+                        help="max LLM calls per job to repair revisions that cannot be located, 0 to disable")
+    args = parser.parse_args(argv)
+
+    if args.provider:
+        use_provider(args.provider)
+    output = args.output or os.path.splitext(args.jobs.rstrip("/\\"))[0] + ".results.jsonl"
+    summary = asyncio.run(run_jobs(
+        iter_jobs(args.jobs), output, args.checkpoint, args.output_dir, args.render, args.workers,
+        args.concurrency, args.rate, not args.no_cache, not args.no_rules, args.repair_attempts,
+    ))
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,44 @@
-from typing import List, Tuple
-import ell
-from src.core import MODEL_NAME
-
+from typing import Iterator, List, Tuple, Union
+from src.core.cache import DiffCache
+from src.core.document import Document
+from src.core.index import SentenceIndex
+from src.core.metrics import estimate_tokens, incr, stage
+from src.core.replacements import ReplacementSet, sort_replacements
+from src.core.providers import get_provider
+from src.core.repair import (REPAIR_ATTEMPTS, is_salvageable, parse_revisions, repair_revisions,
+                             repair_revisions_async, text2diff_repair_prompt)
+from src.core.render import iter_html, iter_md
+from src.core.rules import match_rules
+
+import functools
+import os
 import re
-import json
+import threading
+
+# 提示词版本号，修改 text2diff_prompt 的提示词后需要递增，使旧的缓存失效
+PROMPT_VERSION = 1
+
+_cache_lock = threading.Lock()
+_llm_caches = {}
+
+
+def get_llm_cache() -> DiffCache:
+    """
+    获取当前后端模型对应的结果缓存，第一次使用时创建。
+    """
+    model_name = get_provider().model
+    with _cache_lock:
+        cache = _llm_caches.get(model_name)
+        if cache is None:
+            cache = DiffCache(
+                cache_dir=os.getenv("TEXT2DIFF_CACHE_DIR", "./.text2diff_cache"),
+                model_name=model_name,
+                prompt_version=PROMPT_VERSION,
+                max_bytes=int(os.getenv("TEXT2DIFF_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+                enabled=os.getenv("TEXT2DIFF_CACHE", "1").lower() not in ("0", "off", "false"),
+            )
+            _llm_caches[model_name] = cache
+        return cache
 
 
 def rebuild_text_with_positions(chunks_with_starts: List[Tuple[str, int]]) -> str:
@@ -27,8 +62,7 @@ def rebuild_text_with_positions(chunks_with_starts: List[Tuple[str, int]]) -> st
 
 
 
-@ell.simple(model=MODEL_NAME)
-def text2diff_llm(text_with_pos:str, revision_text:str):
+def text2diff_prompt(text_with_pos:str, revision_text:str):
     """
 你的任务是基于原文和修改建议生成修改数据结构。
 
@@ -68,177 +102,304 @@ def text2diff_llm(text_with_pos:str, revision_text:str):
 2. 从目标文本往前追溯start标记符，不要往后找
 3. 位置标记符不是文本内容的一部分，不要将其包含在original中
 """
+    return build_user_prompt(text_with_pos, revision_text)
+
+
+def build_user_prompt(text_with_pos: str, revision_text: str) -> str:
+    """
+    构建发送给大模型的用户提示词，同步和异步调用共用。
+    """
     return f"现在请处理以下内容：\n原文：\n{text_with_pos}\n修改建议：\n{revision_text}"
 
-def apply_diff(origin_text: str, replacements: list) -> str:
+
+def text2diff_llm(text_with_pos: str, revision_text: str, prompt_fn=None) -> str:
+    """
+    通过当前后端调用大模型，系统提示词和用户提示词由 text2diff_prompt 给出。
+
+    Args:
+        text_with_pos (str): 带位置标记的原文
+        revision_text (str): 修改建议
+        prompt_fn (Callable): 可选，替换默认的提示词函数（如紧凑编码的提示词）
+
+    Returns:
+        str: 大模型返回的 JSON 字符串
+    """
+    prompt_fn = prompt_fn or text2diff_prompt
+    with stage("llm"):
+        resp = get_provider().call(prompt_fn, text_with_pos, revision_text)
+    _count_tokens(prompt_fn, text_with_pos, revision_text, resp)
+    return resp
+
+
+async def text2diff_llm_async(text_with_pos: str, revision_text: str, prompt_fn=None) -> str:
+    """
+    text2diff_llm 的异步版本，后端使用共享连接池的异步客户端，不占用线程等待网络返回。
+    """
+    prompt_fn = prompt_fn or text2diff_prompt
+    with stage("llm"):
+        resp = await get_provider().acall(prompt_fn, text_with_pos, revision_text)
+    _count_tokens(prompt_fn, text_with_pos, revision_text, resp)
+    return resp
+
+
+@functools.lru_cache(maxsize=None)
+def _prompt_overhead(prompt_fn) -> int:
+    # 系统提示词和用户提示词模板本身的 token 数，每个提示词函数只估算一次
+    return estimate_tokens(prompt_fn.__doc__ or "") + estimate_tokens(prompt_fn("", ""))
+
+
+def _count_tokens(prompt_fn, text_with_pos: str, revision_text: str, resp: str) -> None:
+    # 按 estimate_tokens 估算的 token 数，不重新拼接提示词；
+    # 后端返回的真实用量由 providers 记录为 prompt_tokens / completion_tokens
+    incr("llm_calls")
+    incr("prompt_tokens_estimated", _prompt_overhead(prompt_fn) + estimate_tokens(text_with_pos) + estimate_tokens(revision_text))
+    incr("completion_tokens_estimated", estimate_tokens(str(resp)))
+
+
+def text2diff_llm_stream(text_with_pos: str, revision_text: str):
+    """
+    流式调用大模型，逐段产出返回的文本。
+
+    Args:
+        text_with_pos (str): 带位置标记的原文
+        revision_text (str): 修改建议
+
+    Yields:
+        str: 大模型新生成的文本片段
+    """
+    # 与 text2diff_llm 记录相同的指标，llm 阶段的耗时从发起请求到最后一段输出
+    received = []
+    try:
+        with stage("llm"):
+            for chunk in get_provider().stream(text2diff_prompt, text_with_pos, revision_text):
+                received.append(chunk)
+                yield chunk
+    finally:
+        _count_tokens(text2diff_prompt, text_with_pos, revision_text, "".join(received))
+
+
+async def text2diff_llm_stream_async(text_with_pos: str, revision_text: str):
+    """
+    text2diff_llm_stream 的异步版本。
+    """
+    received = []
+    try:
+        with stage("llm"):
+            async for chunk in get_provider().astream(text2diff_prompt, text_with_pos, revision_text):
+                received.append(chunk)
+                yield chunk
+    finally:
+        _count_tokens(text2diff_prompt, text_with_pos, revision_text, "".join(received))
+
+
+def cache_response(key: str, resp: str) -> None:
+    """
+    只缓存能被解析的结果（与解析阶段一样容忍代码块包裹等），避免把一次错误的输出永久保存下来。
+    """
+    if not is_salvageable(resp):
+        return
+    get_llm_cache().set(key, str(resp))
+
+
+def _cache_key(llm_cache: DiffCache, text_with_pos: str, revision_text: str, prompt_fn) -> str:
+    # 非默认提示词的结果单独缓存
+    variant = prompt_fn.__name__ if prompt_fn and prompt_fn is not text2diff_prompt else ""
+    return llm_cache.key(text_with_pos, revision_text, variant)
+
+
+def _prompt_kwargs(prompt_fn) -> dict:
+    # 默认提示词时不传 prompt_fn，保持 text2diff_llm(text_with_pos, revision_text) 的调用方式
+    return {"prompt_fn": prompt_fn} if prompt_fn else {}
+
+
+def text2diff_llm_cached(text_with_pos: str, revision_text: str, use_cache: bool = True, prompt_fn=None) -> str:
+    """
+    带缓存的 text2diff_llm，相同的模型、提示词版本、原文和修改建议直接返回缓存结果。
+
+    Args:
+        text_with_pos (str): 带位置标记的原文
+        revision_text (str): 修改建议
+        use_cache (bool): 为 False 时绕过缓存，直接调用大模型
+        prompt_fn (Callable): 可选，替换默认的提示词函数
+
+    Returns:
+        str: 大模型返回的 JSON 字符串
+    """
+    llm_cache = get_llm_cache()
+    if not use_cache or not llm_cache.enabled:
+        return text2diff_llm(text_with_pos, revision_text, **_prompt_kwargs(prompt_fn))
+
+    key = _cache_key(llm_cache, text_with_pos, revision_text, prompt_fn)
+    resp = llm_cache.get(key)
+    incr("cache_hits" if resp is not None else "cache_misses")
+    if resp is None:
+        resp = text2diff_llm(text_with_pos, revision_text, **_prompt_kwargs(prompt_fn))
+        cache_response(key, resp)
+    return resp
+
+
+async def text2diff_llm_cached_async(text_with_pos: str, revision_text: str, use_cache: bool = True, prompt_fn=None) -> str:
+    """
+    text2diff_llm_cached 的异步版本。
+    """
+    llm_cache = get_llm_cache()
+    if not use_cache or not llm_cache.enabled:
+        return await text2diff_llm_async(text_with_pos, revision_text, **_prompt_kwargs(prompt_fn))
+
+    key = _cache_key(llm_cache, text_with_pos, revision_text, prompt_fn)
+    resp = llm_cache.get(key)
+    incr("cache_hits" if resp is not None else "cache_misses")
+    if resp is None:
+        resp = await text2diff_llm_async(text_with_pos, revision_text, **_prompt_kwargs(prompt_fn))
+        cache_response(key, resp)
+    return resp
+
+def apply_diff(origin_text: Union[str, Document], replacements: Union[list, ReplacementSet]) -> Union[str, Document]:
     """
     应用修改到原始文本。
+    传入 Document 时在文档上原地应用并返回该文档，传入 str 时返回新的字符串。
+    replacements 可以是 (start, end, content) 列表或 ReplacementSet。
     """
+    if isinstance(origin_text, Document):
+        return origin_text.apply(replacements)
 
-    # 1. 按照 start 位置降序排序，从后往前替换
-    sorted_replacements = sorted(replacements, key=lambda x: x[0], reverse=True)
-    
-    # 2. 依次应用每个修改
-    result = origin_text
+    # 1. 按照 start 位置升序排序，区间重叠时报错；ReplacementSet 已经排好序
+    sorted_replacements = sort_replacements(replacements)
+
+    # 2. 依次拼接未修改部分和修改内容，只在最后复制一次
+    parts = []
+    current_pos = 0
     for start, end, content in sorted_replacements:
-        result = result[:start] + content + result[end:]
-    
-    return result
+        parts.append(origin_text[current_pos:start])
+        parts.append(content)
+        current_pos = end
+    parts.append(origin_text[current_pos:])
+
+    return "".join(parts)
 
 
-def diff2md(origin_text: str, replacements: List[Tuple[int, int, str]]) -> str:
+def diff2md(origin_text: Union[str, Document], replacements: List[Tuple[int, int, str]]) -> str:
     """
     将修改信息渲染为Markdown格式
     
     Args:
-        origin_text (str): 原始文本
+        origin_text (Union[str, Document]): 原始文本
         revisions (List[Tuple[int, int, str]]): 修改列表，每个元素是 (start, end, content)
         
     Returns:
         str: Markdown格式的修改信息
     """
-    # 1. 按照start位置升序排序
-    sorted_replacements = sorted(replacements, key=lambda x: x[0])
-    
-    # 2. 构建Markdown内容
-    md_lines = []
-    current_pos = 0
-    
-    for start, end, content in sorted_replacements:
-        # 添加未修改部分
-        if current_pos < start:
-            md_lines.append(origin_text[current_pos:start])
-        
-        # 添加修改部分
-        original = origin_text[start:end]
-        md_lines.append(f"~~{original}~~ → **{content}**")
-        
-        current_pos = end
-    
-    # 添加最后未修改部分
-    if current_pos < len(origin_text):
-        md_lines.append(origin_text[current_pos:])
-    
-    return "".join(md_lines)
+    # 流式渲染、只输出修改附近上下文的版本见 src.core.render
+    with stage("render"):
+        return "".join(iter_md(origin_text, replacements))
 
-def diff2html(origin_text: str, replacements: List[Tuple[int, int, str]]) -> str:
+def diff2html(origin_text: Union[str, Document], replacements: List[Tuple[int, int, str]]) -> str:
     """
-    将修改信息渲染为HTML格式
+    将修改信息渲染为HTML格式（不转义，转义版本见 src.core.render.iter_html）
     
     Args:
-        origin_text (str): 原始文本
+        origin_text (Union[str, Document]): 原始文本
         replacements (List[Tuple[int, int, str]]): 修改列表，每个元素是 (start, end, content)
         
     Returns:
         str: HTML格式的修改信息
     """
-    # 1. 按照start位置升序排序
-    sorted_replacements = sorted(replacements, key=lambda x: x[0])
-    
-    # 2. 构建HTML内容
-    html_lines = []
-    current_pos = 0
-    
-    for start, end, content in sorted_replacements:
-        # 添加未修改部分
-        if current_pos < start:
-            html_lines.append(origin_text[current_pos:start])
-        
-        # 获取原始文本
-        original = origin_text[start:end]
-        
-        # 判断修改类型
-        if not content:  # 删除
-            html_lines.append(
-                f"<span style='color:red;text-decoration:line-through'>{original}</span>"
-            )
-        elif start == end:  # 新增
-            html_lines.append(
-                f"<span style='color:green;font-weight:bold'>{content}</span>"
-            )
-        elif original in content:  # 修改（包含原文）
-            # 找到原文在 new_content 中的位置
-            original_start = content.find(original)
-            original_end = original_start + len(original)
-            
-            # 添加新增部分（绿色）
-            if original_start > 0:
-                html_lines.append(
-                    f"<span style='color:green;font-weight:bold'>{content[:original_start]}</span>"
-                )
-            
-            # 添加原文部分（原格式）
-            html_lines.append(original)
-            
-            # 添加新增部分（绿色）
-            if original_end < len(content):
-                html_lines.append(
-                    f"<span style='color:green;font-weight:bold'>{content[original_end:]}</span>"
-                )
-        else:  # 完全修改
-            html_lines.append(
-                f"<span style='color:red;text-decoration:line-through'>{original}</span>"
-                f" → "
-                f"<span style='color:green;font-weight:bold'>{content}</span>"
-            )
-        
-        current_pos = end
-    
-    # 添加最后未修改部分
-    if current_pos < len(origin_text):
-        html_lines.append(origin_text[current_pos:])
-    
-    return "".join(html_lines)
+    with stage("render"):
+        return "".join(iter_html(origin_text, replacements, escape=False))
 
-def exact_revision(origin_text: str, revisions: dict) -> List[Tuple[int, int, str]]:
+def exact_revision(origin_text: str, revisions: dict, index: SentenceIndex = None,
+                   failed: list = None) -> List[Tuple[int, int, str]]:
     """
     获取精确的替换位置，返回一个列表，元素是 (start, end, content) 组成的元组。
+    只在 sentence_start 所在句子及其相邻句子内查找 original，避免匹配到远处的同名文本。
 
     Args:
         origin_text (str): 原始文本
         revisions (dict): 修改内容，包含 "revisions" 字段
+        index (SentenceIndex): 可选，预先构建好的句子索引，多次调用时可以复用
+        failed (list): 可选，收集找不到 original 的修改，交给修复阶段处理
 
     Returns:
         List[Tuple[int, int, str]]: 替换位置列表，每个元素是 (start, end, content)
     """
-    result = []
-    for rev in revisions:
-        start = rev["sentence_start"]
-        original = rev["original"]
-        content = rev["content"]
-        
-        # 从 start 位置开始搜索 original
-        match_pos = origin_text.find(original, start)
-        if match_pos != -1:
-            # 如果找到匹配的 original，记录替换位置
-            end = match_pos + len(original)
-            result.append((match_pos, end, content))
-    
+    if index is None:
+        index = build_sentence_index(origin_text)
+    with stage("resolve"):
+        result = index.resolve(revisions, failed)
+    # 在原文中找不到 original 的修改会被丢弃，交给修复阶段时由修复阶段计数
+    if failed is None and len(result) < len(revisions):
+        incr("dropped_revisions", len(revisions) - len(result))
     return result
 
 
+def build_sentence_index(text: str) -> SentenceIndex:
+    """
+    分句并构建句子索引。
+    """
+    return SentenceIndex(text, split_text_by_sentences(text))
+
+
 
 def build_text_with_pos(text):
     result = split_text_by_sentences(text)
     return rebuild_text_with_positions(result)
 
-def text2diff(origin_text:str, revision_text:str):
-    result = build_text_with_pos(origin_text)
-    resp = text2diff_llm(result, revision_text)
-    return exact_revision(origin_text, json.loads(resp))
+def _prepare(origin_text: str, revision_text: str, sentences, use_rules: bool, stats: dict):
+    # 分句、建索引、规则匹配，以及剩余指令的提示词构建，同步和异步版本共用
+    if sentences is None:
+        with stage("split"):
+            sentences = split_text_by_sentences(origin_text)
+    index = SentenceIndex(origin_text, sentences)
+    revisions = []
+    # 规则能识别的指令直接生成修改，只把剩余的指令交给大模型
+    if use_rules:
+        with stage("rules"):
+            revisions, revision_text = match_rules(origin_text, revision_text, index, stats)
+    text_with_pos = None
+    if revision_text.strip():
+        with stage("prompt"):
+            text_with_pos = rebuild_text_with_positions(sentences)
+    return index, revisions, text_with_pos, revision_text
+
+def _repair_call(text_with_pos: str, revision_text: str) -> str:
+    return text2diff_llm(text_with_pos, revision_text, prompt_fn=text2diff_repair_prompt)
+
+
+async def _repair_call_async(text_with_pos: str, revision_text: str) -> str:
+    return await text2diff_llm_async(text_with_pos, revision_text, prompt_fn=text2diff_repair_prompt)
+
+
+def text2diff(origin_text:str, revision_text:str, use_cache:bool=True, sentences:List[Tuple[int, str]]=None,
+              use_rules:bool=True, stats:dict=None, repair_attempts:int=REPAIR_ATTEMPTS):
+    # 多轮修改时可以传入增量分句器维护的句子列表，避免重新分割全文
+    index, revisions, text_with_pos, revision_text = _prepare(origin_text, revision_text, sentences, use_rules, stats)
+    failed = []
+    if text_with_pos is not None:
+        resp = text2diff_llm_cached(text_with_pos, revision_text, use_cache)
+        revisions += parse_revisions(resp, failed)
+    result = exact_revision(origin_text, revisions, index, failed)
+    # 格式无效或找不到 original 的修改只带相关句子重新询问，不重跑全文
+    if failed:
+        with stage("repair"):
+            result += repair_revisions(index, failed, result, _repair_call, repair_attempts, stats)
+    return result
+
+async def text2diff_async(origin_text:str, revision_text:str, use_cache:bool=True, sentences:List[Tuple[int, str]]=None,
+                          use_rules:bool=True, stats:dict=None, repair_attempts:int=REPAIR_ATTEMPTS):
+    index, revisions, text_with_pos, revision_text = _prepare(origin_text, revision_text, sentences, use_rules, stats)
+    failed = []
+    if text_with_pos is not None:
+        resp = await text2diff_llm_cached_async(text_with_pos, revision_text, use_cache)
+        revisions += parse_revisions(resp, failed)
+    result = exact_revision(origin_text, revisions, index, failed)
+    if failed:
+        with stage("repair"):
+            result += await repair_revisions_async(index, failed, result, _repair_call_async, repair_attempts, stats)
+    return result
 
 
-def split_text_by_sentences(text: str) -> List[Tuple[int, str]]:
-    """
-    按句子分割文本，返回每个句子及其起始位置。
-    保留句末标点，特殊处理邮箱和网址中的点号。
-    
-    Args:
-        text (str): 原始文本
-    Returns:
-        List[Tuple[int, str]]: 每句的起始位置和内容
-    """
-    separator_pattern = re.compile(r"""
+# 分句正则，split_text_by_sentences 与增量分句共用
+SENTENCE_PATTERN = re.compile(r"""
     # 核心内容：匹配非终止符部分（直到遇到终止符）
     [^。！？!?]+?                # 排除终止符，但允许句点（用于处理版本号等）
     # 终止符部分（支持连续多个终止符）
@@ -252,7 +413,18 @@ def split_text_by_sentences(text: str) -> List[Tuple[int, str]]:
     \s*                           
 """, re.VERBOSE)
 
-    matches = re.finditer(separator_pattern, text)
+def split_text_by_sentences(text: str) -> List[Tuple[int, str]]:
+    """
+    按句子分割文本，返回每个句子及其起始位置。
+    保留句末标点，特殊处理邮箱和网址中的点号。
+    
+    Args:
+        text (str): 原始文本
+    Returns:
+        List[Tuple[int, str]]: 每句的起始位置和内容
+    """
+
+    matches = re.finditer(SENTENCE_PATTERN, text)
     result = []
  
 
@@ -275,6 +447,98 @@ def split_text_by_sentences(text: str) -> List[Tuple[int, str]]:
     
     return result
 
+# 真正的句末（与 SENTENCE_PATTERN 的终止符部分一致），先用它线性扫描，找到之后才运行分句正则
+TERMINATOR_PATTERN = re.compile(r"""[。！？!?]|\.(?=\s|$|['"]\s)""")
+# 句子开头的终止符不能作为句子内容，分句正则会从其后开始匹配
+LEADING_TERMINATORS = re.compile(r"[。！？!?]*")
+
+
+def _read_buffers(source, buffer_size: int) -> Iterator[str]:
+    if isinstance(source, str):
+        for i in range(0, len(source), buffer_size):
+            yield source[i:i + buffer_size]
+    elif hasattr(source, "read"):
+        while True:
+            data = source.read(buffer_size)
+            if not data:
+                break
+            yield data
+    else:
+        yield from source
+
+
+def iter_sentences(source, buffer_size: int = 64 * 1024, max_sentence_len: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    流式分句：按固定大小的缓冲区读取文本，逐个产出 (起始位置, 句子)。
+    不设置 max_sentence_len 时输出与 split_text_by_sentences 完全一致；设置时等价于把其中的每句按最大长度切开。
+    只在出现真正的句末后才运行分句正则，没有句末的长文本（日志、代码）耗时与长度成线性关系。
+
+    Args:
+        source: 文本文件对象、字符串片段的迭代器或字符串
+        buffer_size (int): 每次读取的字符数
+        max_sentence_len (int): 可选，句子的最大长度，超过时强制切分，避免没有句末标点的长文本（日志、代码）变成一个超长句子
+    Yields:
+        Tuple[int, str]: 每句的起始位置和内容
+    """
+    buffers = _read_buffers(source, buffer_size)
+    buf = ""
+    pos = 0         # 当前句子在 buf 中的起始位置
+    offset = 0      # buf[0] 在全文中的位置
+    checked = 0     # buf[pos:checked] 内已确认没有可用的句末
+    at_end = False
+    emitted = False
+
+    def pieces(start, chunk):
+        # 超长的句子按最大长度切分
+        if not max_sentence_len:
+            yield start, chunk
+            return
+        for i in range(0, len(chunk), max_sentence_len):
+            yield start + i, chunk[i:i + max_sentence_len]
+
+    while True:
+        # 只从上次确认过的位置继续查找句末，不重新扫描整句；找到句末之前不运行分句正则，
+        # 避免日志、代码等带句点但没有句末的长文本反复回溯
+        first = LEADING_TERMINATORS.match(buf, pos).end()
+        term = TERMINATOR_PATTERN.search(buf, max(checked, first + 1))
+        limit = pos + max_sentence_len if max_sentence_len else None
+
+        # 超过最大长度时先强制切分，句末再远也只需要扫描一次
+        # 句末正好在切分处时不切分，否则终止符会被当作下一句的开头；切分处的句点要再看两个字符才能确定
+        if limit is not None and (term.start() > limit if term else len(buf) >= limit + 3):
+            yield offset + pos, buf[pos:limit]
+            emitted = True
+            pos = limit
+            checked = max(term.start() if term else len(buf) - 2, pos)
+            continue
+
+        match = SENTENCE_PATTERN.search(buf, pos) if term else None
+        # 句点的判断需要向后看两个字符，离缓冲区末尾太近的匹配可能不完整
+        if match and (at_end or match.end() <= len(buf) - 2):
+            yield from pieces(offset + pos, buf[pos:match.end()])
+            emitted = True
+            pos = checked = match.end()
+            continue
+        checked = term.start() if term else max(len(buf) - 2, pos)
+
+        if at_end:
+            # 末尾残留字符作为最后一句；空文本与 split_text_by_sentences 一样返回一个空句子
+            if pos < len(buf):
+                yield from pieces(offset + pos, buf[pos:])
+            elif not emitted:
+                yield 0, ""
+            return
+
+        data = next(buffers, None)
+        if data is None:
+            at_end = True
+            continue
+        # 丢弃已产出的部分，只保留当前句子
+        offset += pos
+        checked -= pos
+        buf = buf[pos:] + data
+        pos = 0
+
 if __name__ == "__main__":
 
     # 原文示例
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import asyncio
+import re
+
+from src.core.diff import split_text_by_sentences, text2diff, text2diff_async
+from src.core.merge import merge_replacements
+
+# 以序号开头的行（"1." "2、" "3)" 等）开始一条新指令
+NUMBERED_LINE = re.compile(r"^\s*\d+\s*[.、)）]")
+
+
+def split_instructions(revision_text: str) -> List[str]:
+    """
+    把修改建议拆分为相互独立的指令。
+    有编号时以编号行为界，没有编号的行归入上一条指令；完全没有编号时每个非空行是一条指令。
+
+    Args:
+        revision_text (str): 修改建议
+
+    Returns:
+        List[str]: 指令列表
+    """
+    lines = [line.strip() for line in revision_text.splitlines() if line.strip()]
+    if not any(NUMBERED_LINE.match(line) for line in lines):
+        return lines
+
+    instructions = []
+    for line in lines:
+        if NUMBERED_LINE.match(line) or not instructions:
+            instructions.append(line)
+        else:
+            instructions[-1] += "\n" + line
+    return instructions
+
+
+def text2diff_parallel(origin_text: str, revision_text: str, max_workers: int = 8, use_cache: bool = True,
+                       use_rules: bool = True, conflicts: Optional[list] = None) -> List[Tuple[int, int, str]]:
+    """
+    按指令并发调用大模型的 text2diff：每条指令单独请求，输出更短、互不等待，
+    再用区间树合并各指令的替换列表。
+
+    Args:
+        origin_text (str): 原始文本
+        revision_text (str): 修改建议
+        max_workers (int): 并发调用大模型的最大线程数
+        use_cache (bool): 是否使用大模型结果缓存
+        use_rules (bool): 是否先用规则处理能识别的指令
+        conflicts (Optional[list]): 传入时追加相互重叠而被丢弃的替换，格式见 merge_replacements
+
+    Returns:
+        List[Tuple[int, int, str]]: 按 (start, end) 升序排列、互不重叠的替换列表
+    """
+    instructions = split_instructions(revision_text)
+    if not instructions:
+        return []
+    sentences = split_text_by_sentences(origin_text)
+
+    def run(instruction):
+        return text2diff(origin_text, instruction, use_cache, sentences, use_rules)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(run, instructions))
+
+    merged, found = merge_replacements(results)
+    if conflicts is not None:
+        conflicts.extend(found)
+    return merged
+
+
+async def text2diff_parallel_async(origin_text: str, revision_text: str, max_concurrency: int = 8, use_cache: bool = True,
+                                   use_rules: bool = True, conflicts: Optional[list] = None) -> List[Tuple[int, int, str]]:
+    """
+    text2diff_parallel 的异步版本，用信号量限制同时进行的请求数。
+    """
+    instructions = split_instructions(revision_text)
+    if not instructions:
+        return []
+    sentences = split_text_by_sentences(origin_text)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(instruction):
+        async with semaphore:
+            return await text2diff_async(origin_text, instruction, use_cache, sentences, use_rules)
+
+    results = await asyncio.gather(*(run(instruction) for instruction in instructions))
+
+    merged, found = merge_replacements(results)
+    if conflicts is not None:
+        conflicts.extend(found)
+    return merged
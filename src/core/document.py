@@ -0,0 +1,146 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+from src.core.replacements import sort_replacements
+
+
+class Document:
+    """
+    基于 piece table 的文档模型，用于多轮 apply_diff。
+
+    文档由若干片段 (source, start, end) 组成，每个片段引用原文或某次替换内容的一段。
+    替换只修改片段列表，不复制文本；只有在需要时才拼接出完整字符串。
+    每次修改都会记录一个版本，任意旧版本的位置都可以映射到当前版本。
+
+    复杂度：定位片段用二分查找，为 O(log p)（p 为片段数，随修改次数增多）；但每个替换都要对片段列表
+    做一次 O(p) 的切片替换，每次 splice / apply 结束时 _reindex 还要 O(p) 地重算所有片段的起始位置，
+    因此修改的代价是 O(p) 的列表操作，而不是 O(log n)。多处修改应合并为一次 apply，只重建一次索引。
+    """
+
+    def __init__(self, text: str = ""):
+        self._pieces: List[Tuple[str, int, int]] = [(text, 0, len(text))] if text else []
+        # 每个片段在文档中的起始位置，与 _pieces 一一对应
+        self._starts: List[int] = [0] if text else []
+        self._length = len(text)
+        self._text = text
+        # 每个版本的修改记录：(旧 start 列表, 旧 end 列表, 新 start 列表, 新内容长度列表)
+        self._history = []
+
+    @property
+    def version(self) -> int:
+        """
+        当前版本号，初始为 0，每次 splice 或 apply 后加 1。
+        """
+        return len(self._history)
+
+    @property
+    def text(self) -> str:
+        """
+        拼接出完整文本，结果会缓存到下一次修改。
+        """
+        if self._text is None:
+            self._text = "".join(source[start:end] for source, start, end in self._pieces)
+        return self._text
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _split(self, pos: int, hi: int) -> int:
+        """
+        保证 pos 处是片段边界，返回以 pos 开始的片段下标。
+        只在 [0, hi) 范围内查找，hi 之后的片段起始位置可能已经过期。
+        """
+        i = bisect_right(self._starts, pos, 0, hi) - 1
+        if i < 0:
+            return 0
+        offset = pos - self._starts[i]
+        source, start, end = self._pieces[i]
+        if offset == 0:
+            return i
+        if start + offset >= end:
+            return i + 1
+        self._pieces[i:i + 1] = [(source, start, start + offset), (source, start + offset, end)]
+        self._starts.insert(i + 1, pos)
+        return i + 1
+
+    def _reindex(self) -> None:
+        """
+        重新计算每个片段的起始位置。
+        """
+        starts = []
+        pos = 0
+        for _, start, end in self._pieces:
+            starts.append(pos)
+            pos += end - start
+        self._starts = starts
+        self._length = pos
+
+    def splice(self, start: int, end: int, content: str) -> "Document":
+        """
+        把 [start, end) 替换为 content，作为一个新版本。
+        """
+        return self.apply([(start, end, content)])
+
+    def apply(self, replacements: List[Tuple[int, int, str]]) -> "Document":
+        """
+        批量应用替换，所有位置都基于当前版本，整批作为一个新版本。
+
+        Args:
+            replacements (List[Tuple[int, int, str]]): 修改列表或 ReplacementSet，每个元素是 (start, end, content)
+
+        Returns:
+            Document: 文档自身，便于链式调用
+        """
+        # 区间重叠时无法确定结果，直接报错而不是生成错乱的文本
+        sorted_replacements = sort_replacements(replacements)
+
+        # 从后往前修改片段列表，前面片段的起始位置保持有效，最后统一重新计算
+        hi = len(self._pieces)
+        for start, end, content in reversed(sorted_replacements):
+            count = len(self._pieces)
+            left = self._split(start, hi)
+            hi += len(self._pieces) - count
+            right = self._split(end, hi)
+            piece = [(content, 0, len(content))] if content else []
+            self._pieces[left:right] = piece
+            self._starts[left:right] = [start] * len(piece)
+            hi = left
+        self._reindex()
+
+        old_starts, old_ends, new_starts, new_lengths = [], [], [], []
+        delta = 0
+        for start, end, content in sorted_replacements:
+            old_starts.append(start)
+            old_ends.append(end)
+            new_starts.append(start + delta)
+            new_lengths.append(len(content))
+            delta += len(content) - (end - start)
+
+        self._history.append((old_starts, old_ends, new_starts, new_lengths))
+        self._text = None
+        return self
+
+    def map_offset(self, pos: int, from_version: int = 0) -> int:
+        """
+        把 from_version 版本中的位置映射到当前版本。
+        落在被替换区间内部的位置映射到替换内容中对应的位置（超出则截断到替换内容末尾）。
+
+        Args:
+            pos (int): from_version 版本中的位置
+            from_version (int): 位置所在的版本号
+
+        Returns:
+            int: 当前版本中的位置
+        """
+        for old_starts, old_ends, new_starts, new_lengths in self._history[from_version:]:
+            i = bisect_right(old_starts, pos) - 1
+            if i < 0:
+                continue
+            if pos >= old_ends[i]:
+                pos = new_starts[i] + new_lengths[i] + (pos - old_ends[i])
+            else:
+                pos = new_starts[i] + min(pos - old_starts[i], new_lengths[i])
+        return pos
@@ -0,0 +1,120 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Tuple, Union
+import mmap
+import os
+import shutil
+import tempfile
+
+from src.core.replacements import ReplacementSet, sort_replacements
+
+# UTF-8 续字节（0x80-0xBF）以外的所有字节，用于 bytes.translate 只保留续字节
+_NON_CONTINUATION = bytes(b for b in range(256) if not 0x80 <= b <= 0xBF)
+
+# 复制未修改区域时每次写入的字节数
+COPY_SIZE = 1024 * 1024
+
+
+class CodePointIndex:
+    """
+    UTF-8 字节串中字符位置到字节位置的稀疏索引。
+    每隔约 block_size 字节（对齐到字符边界）记录一个 (字符位置, 字节位置) 检查点，
+    查询时二分找到检查点，再只解码一个块内的内容。
+    """
+
+    def __init__(self, data: Union[bytes, mmap.mmap], block_size: int = 4096):
+        self.data = data
+        self.char_offsets = array("q", [0])
+        self.byte_offsets = array("q", [0])
+
+        size = len(data)
+        chars = 0
+        pos = 0
+        while pos < size:
+            end = min(pos + block_size, size)
+            # 块边界不能落在多字节字符中间
+            while end < size and 0x80 <= data[end] <= 0xBF:
+                end += 1
+            block = data[pos:end]
+            chars += len(block) - len(block.translate(None, _NON_CONTINUATION))
+            self.char_offsets.append(chars)
+            self.byte_offsets.append(end)
+            pos = end
+
+    def __len__(self) -> int:
+        """
+        字符总数。
+        """
+        return self.char_offsets[-1]
+
+    def byte_offset(self, pos: int) -> int:
+        """
+        把字符位置换算为字节位置。
+        """
+        if not 0 <= pos <= len(self):
+            raise ValueError(f"position {pos} is out of range [0, {len(self)}]")
+        i = bisect_right(self.char_offsets, pos) - 1
+        base = self.byte_offsets[i]
+        skip = pos - self.char_offsets[i]
+        if skip == 0:
+            return base
+        block = self.data[base:self.byte_offsets[i + 1]].decode("utf-8")
+        return base + len(block[:skip].encode("utf-8"))
+
+
+def apply_diff_file(src_path: str, dst_path: str,
+                    replacements: Union[ReplacementSet, Iterable[Tuple[int, int, str]]], block_size: int = 4096) -> int:
+    """
+    文件到文件的 apply_diff，适用于几百 MB 的 UTF-8 文本。
+    原文件通过 mmap 读取，未修改的区域按字节直接复制，替换内容编码后写入，只顺序扫描一遍；
+    内存占用与文件大小基本无关。结果先写入同目录下的临时文件，完成后原子替换 dst_path，
+    输出文件保留 dst_path 原有的权限，dst_path 不存在时与 src_path 相同。
+
+    Args:
+        src_path (str): 原文件路径（UTF-8）
+        dst_path (str): 输出文件路径，可以与 src_path 相同
+        replacements: (start, end, content) 列表或 ReplacementSet，位置为字符位置，与 apply_diff 相同
+        block_size (int): 字符位置索引的块大小（字节）
+
+    Returns:
+        int: 写入的字节数
+    """
+    sorted_replacements = sort_replacements(replacements)
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(dir=dst_dir, prefix=".tmp-")
+    written = 0
+    try:
+        with open(src_path, "rb") as src, os.fdopen(fd, "wb") as out:
+            size = os.fstat(src.fileno()).st_size
+            # 空文件不能 mmap
+            data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            try:
+                index = CodePointIndex(data, block_size)
+
+                def copy(start: int, end: int) -> int:
+                    for pos in range(start, end, COPY_SIZE):
+                        out.write(data[pos:min(pos + COPY_SIZE, end)])
+                    return end - start
+
+                current = 0
+                for start, end, content in sorted_replacements:
+                    byte_start = index.byte_offset(start)
+                    written += copy(current, byte_start)
+                    encoded = content.encode("utf-8")
+                    out.write(encoded)
+                    written += len(encoded)
+                    current = index.byte_offset(end)
+                written += copy(current, size)
+            finally:
+                if size:
+                    data.close()
+        # mkstemp 创建的文件权限为 0600，沿用被覆盖文件的权限，没有时沿用原文件的权限
+        shutil.copymode(dst_path if os.path.exists(dst_path) else src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return written
@@ -0,0 +1,79 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+
+class SentenceIndex:
+    """
+    句子索引：保存每个句子的起始位置，用二分查找定位句子，
+    并把 original 的查找范围限制在所引用的句子及其相邻句子内。
+    """
+
+    def __init__(self, text: str, sentences: List[Tuple[int, str]], radius: int = 1):
+        """
+        Args:
+            text (str): 原始文本
+            sentences (List[Tuple[int, str]]): split_text_by_sentences 的输出
+            radius (int): 向前、向后额外搜索的相邻句子数
+        """
+        self.text = text
+        self.starts = [start for start, _ in sentences] or [0]
+        self.radius = radius
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def locate(self, pos: int) -> int:
+        """
+        返回包含 pos 的句子下标。
+        """
+        i = bisect_right(self.starts, pos) - 1
+        return min(max(i, 0), len(self.starts) - 1)
+
+    def sentence_end(self, i: int) -> int:
+        """
+        返回第 i 个句子的结束位置（不含）。
+        """
+        return self.starts[i + 1] if i + 1 < len(self.starts) else len(self.text)
+
+    def find(self, original: str, sentence_start: int) -> int:
+        """
+        在 sentence_start 所在句子及其相邻句子内查找 original。
+        优先从 sentence_start 向后查找，找不到时再在整个范围内查找，
+        以容忍大模型给出的位置标记略有偏差。
+
+        Args:
+            original (str): 需要定位的原文
+            sentence_start (int): 大模型给出的位置标记
+
+        Returns:
+            int: original 的起始位置，找不到返回 -1
+        """
+        sentence_start = min(max(sentence_start, 0), len(self.text))
+        if not original:
+            return sentence_start
+        i = self.locate(sentence_start)
+        # original 可能跨越多个句子，结束句子按 original 的长度推算
+        j = self.locate(sentence_start + len(original))
+
+        lo = self.starts[max(i - self.radius, 0)]
+        hi = self.sentence_end(min(j + self.radius, len(self.starts) - 1))
+
+        pos = self.text.find(original, sentence_start, hi)
+        if pos == -1:
+            pos = self.text.find(original, lo, hi)
+        return pos
+
+    def resolve(self, revisions: List[dict], failed: list = None) -> List[Tuple[int, int, str]]:
+        """
+        批量定位一组修改，返回 (start, end, content) 列表，找不到的修改会被丢弃。
+        传入 failed 列表时，找不到的修改会追加到其中。
+        """
+        result = []
+        for rev in revisions:
+            original = rev["original"]
+            match_pos = self.find(original, rev["sentence_start"])
+            if match_pos != -1:
+                result.append((match_pos, match_pos + len(original), rev["content"]))
+            elif failed is not None:
+                failed.append(rev)
+        return result
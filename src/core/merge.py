@@ -0,0 +1,159 @@
+from typing import Any, Iterator, List, Optional, Tuple
+import random
+
+
+class _Node:
+    __slots__ = ("start", "end", "value", "priority", "left", "right", "max_end")
+
+    def __init__(self, start: int, end: int, value: Any, priority: float):
+        self.start = start
+        self.end = end
+        self.value = value
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+def _update(node: _Node) -> None:
+    node.max_end = max(
+        node.end,
+        node.left.max_end if node.left else node.end,
+        node.right.max_end if node.right else node.end,
+    )
+
+
+class IntervalTree:
+    """
+    区间树：以 start 为键的 treap，每个节点额外记录子树内最大的 end，
+    插入和重叠查询的期望复杂度为 O(log n + 命中数)。区间均为左闭右开 [start, end)。
+    """
+
+    def __init__(self, seed: int = 0):
+        self._root = None
+        self._size = 0
+        # 固定种子，保证树的形状（以及查询结果的顺序）可复现
+        self._rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, start: int, end: int, value: Any = None) -> None:
+        """
+        插入区间 [start, end)，value 随查询结果一起返回。
+        """
+        self._root = self._insert(self._root, _Node(start, end, value, self._rng.random()))
+        self._size += 1
+
+    def _insert(self, node: Optional[_Node], new: _Node) -> _Node:
+        if node is None:
+            return new
+        if (new.start, new.end) < (node.start, node.end):
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        _update(node)
+        return node
+
+    @staticmethod
+    def _rotate_right(node: _Node) -> _Node:
+        left = node.left
+        node.left = left.right
+        left.right = node
+        _update(node)
+        _update(left)
+        return left
+
+    @staticmethod
+    def _rotate_left(node: _Node) -> _Node:
+        right = node.right
+        node.right = right.left
+        right.left = node
+        _update(node)
+        _update(right)
+        return right
+
+    def overlap(self, start: int, end: int) -> List[Tuple[int, int, Any]]:
+        """
+        返回与 [start, end) 相交的所有区间，按 (start, end) 升序。
+        空区间 [p, p) 与严格包含 p 的区间相交。
+        """
+        result = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            # 子树内所有区间都在查询区间之前结束
+            if node is None or node.max_end <= start:
+                continue
+            if node.start < end and start < node.end:
+                result.append((node.start, node.end, node.value))
+            stack.append(node.left)
+            # 右子树的起点都不小于 node.start
+            if node.start < end:
+                stack.append(node.right)
+        result.sort(key=lambda x: (x[0], x[1]))
+        return result
+
+    def __iter__(self) -> Iterator[Tuple[int, int, Any]]:
+        stack = []
+        node = self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.start, node.end, node.value
+            node = node.right
+
+
+def merge_replacements(groups: List[List[Tuple[int, int, str]]]) -> Tuple[List[Tuple[int, int, str]], List[dict]]:
+    """
+    合并多组替换列表。按组的顺序依次接受替换，与已接受的替换重叠的会被丢弃并记为冲突；
+    完全相同的替换只保留一份，同一位置的两个不同插入也算冲突（先后顺序无法确定）。
+
+    Args:
+        groups (List[List[Tuple[int, int, str]]]): 每条指令得到的替换列表
+
+    Returns:
+        Tuple[List[Tuple[int, int, str]], List[dict]]: 按 (start, end) 排序的合并结果，以及冲突列表，
+            每个冲突为 {"replacement", "group", "conflicts_with": [(replacement, group), ...]}
+    """
+    tree = IntervalTree()
+    accepted = set()
+    inserts = {}
+    conflicts = []
+    for group_id, replacements in enumerate(groups):
+        for replacement in replacements:
+            replacement = tuple(replacement)
+            if replacement in accepted:
+                continue
+            start, end, _ = replacement
+            hits = [value for _, _, value in tree.overlap(start, end)]
+            if start == end and start in inserts:
+                hits.append(inserts[start])
+            if hits:
+                conflicts.append({"replacement": replacement, "group": group_id, "conflicts_with": hits})
+                continue
+            tree.add(start, end, (replacement, group_id))
+            accepted.add(replacement)
+            if start == end:
+                inserts[start] = (replacement, group_id)
+    return [value[0] for _, _, value in tree], conflicts
+
+
+def check_overlaps(sorted_replacements: List[Tuple[int, int, str]]) -> None:
+    """
+    检查已按 (start, end) 排序的替换列表中是否有相互重叠的区间，有则抛出 ValueError。
+    """
+    max_end = None
+    previous = None
+    for replacement in sorted_replacements:
+        start, end = replacement[0], replacement[1]
+        if max_end is not None and start < max_end:
+            raise ValueError(f"overlapping replacements: {previous} and {tuple(replacement)}")
+        if max_end is None or end > max_end:
+            max_end, previous = end, tuple(replacement)
@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+import threading
+import time
+
+# 阶段耗时直方图的桶（秒）
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 指标名前缀
+PREFIX = "text2diff"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数。
+    非 ASCII 字符（中文等）按每字 1 个 token 计，ASCII 字符按每 4 个字符 1 个 token 计。
+
+    Args:
+        text (str): 待估算的文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4
+
+
+class Metrics:
+    """
+    进程内的指标记录：各阶段耗时（直方图）和计数器。
+    每次记录都会同步调用已注册的钩子，钩子签名为 hook(kind, name, value)，kind 为 "timing" 或 "counter"。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks: List[Callable[[str, str, float], None]] = []
+        self.counters: Dict[str, float] = {}
+        # 阶段名 -> [各桶计数..., 总次数, 总耗时]
+        self.timings: Dict[str, list] = {}
+
+    def add_hook(self, hook: Callable[[str, str, float], None]) -> None:
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, str, float], None]) -> None:
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """
+        计数器加 value。
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook("counter", name, value)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        记录一次阶段耗时。
+        """
+        with self._lock:
+            timing = self.timings.get(stage)
+            if timing is None:
+                timing = self.timings[stage] = [0] * len(BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timing[i] += 1
+            timing[-2] += 1
+            timing[-1] += seconds
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook("timing", stage, seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        统计 with 代码块的耗时，异常退出时同样记录。
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def snapshot(self) -> dict:
+        """
+        返回当前指标的副本：{"counters": {...}, "stages": {阶段: {"count", "sum"}}}。
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {name: {"count": t[-2], "sum": t[-1]} for name, t in self.timings.items()},
+            }
+
+    def export_prometheus(self) -> str:
+        """
+        导出为 Prometheus 文本格式。
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((name, list(t)) for name, t in self.timings.items())
+
+        lines = []
+        for name, value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:g}")
+        if timings:
+            metric = f"{PREFIX}_stage_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, timing in timings:
+                for bound, count in zip(BUCKETS, timing):
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {timing[-2]}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {timing[-1]:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {timing[-2]}')
+        return "\n".join(lines) + "\n"
+
+
+# 全局默认的指标记录，text2diff 各阶段都记录到这里
+METRICS = Metrics()
+
+stage = METRICS.stage
+incr = METRICS.incr
+add_hook = METRICS.add_hook
+remove_hook = METRICS.remove_hook
+export_prometheus = METRICS.export_prometheus
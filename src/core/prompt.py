@@ -0,0 +1,162 @@
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+import re
+
+from src.core.diff import (
+    _repair_call,
+    exact_revision,
+    rebuild_text_with_positions,
+    split_text_by_sentences,
+    text2diff_llm_cached,
+)
+from src.core.index import SentenceIndex
+from src.core.metrics import estimate_tokens, incr, stage
+from src.core.repair import REPAIR_ATTEMPTS, repair_revisions, salvage_json, validate_revisions
+
+# 修改建议中被引号包住的内容，用于预筛选相关句子
+QUOTED_PATTERN = re.compile(r'"([^"\n]+)"|“([^”\n]+)”|‘([^’\n]+)’|「([^」\n]+)」|『([^』\n]+)』')
+
+# 不连续的句子之间插入的省略标记
+GAP_MARKER = "\n…\n"
+
+
+def text2diff_compact_prompt(text_with_ids:str, revision_text:str):
+    """
+你的任务是基于原文和修改建议生成修改数据结构。
+
+原文中的‖数字‖是句子编号，标记了后续句子的编号，不是文本内容的一部分。…表示省略了无关内容。
+
+输出格式：
+[{"sentence_id": <original所在句子的编号>, "original": <需要修改的原文，不能为空>, "content": <修改后的内容>}]
+
+示例原文：
+‖0‖这是一个测试句子。‖1‖这是第二个测试句子。
+
+示例修改建议：
+把"第二个"改为"第三个"
+
+示例输出：
+[{"sentence_id": 1, "original": "第二个", "content": "第三个"}]
+"""
+    return f"原文：\n{text_with_ids}\n修改建议：\n{revision_text}"
+
+
+def extract_quoted(revision_text: str) -> List[str]:
+    """
+    提取修改建议中被引号包住的内容。
+    """
+    return [next(g for g in m.groups() if g) for m in QUOTED_PATTERN.finditer(revision_text)]
+
+
+def prefilter_sentences(text: str, sentences: List[Tuple[int, str]], revision_text: str, neighbours: int = 1) -> Optional[List[int]]:
+    """
+    根据修改建议中引号内的内容，选出包含这些内容的句子及其相邻句子。
+
+    Args:
+        text (str): 原始文本
+        sentences (List[Tuple[int, str]]): split_text_by_sentences 的输出
+        revision_text (str): 修改建议
+        neighbours (int): 额外保留的前后相邻句子数
+
+    Returns:
+        Optional[List[int]]: 选中句子的下标（升序）；没有任何引号内容出现在原文中时返回 None，表示需要发送全文
+    """
+    starts = [start for start, _ in sentences]
+    selected = set()
+    for quoted in extract_quoted(revision_text):
+        pos = text.find(quoted)
+        while pos != -1:
+            # 引号内容可能跨越多个句子
+            first = bisect_right(starts, pos) - 1
+            last = bisect_right(starts, pos + len(quoted) - 1) - 1
+            for i in range(max(first - neighbours, 0), min(last + neighbours, len(sentences) - 1) + 1):
+                selected.add(i)
+            pos = text.find(quoted, pos + 1)
+    return sorted(selected) if selected else None
+
+
+def rebuild_text_with_ids(sentences: List[Tuple[int, str]], selected: Optional[List[int]] = None) -> Tuple[str, List[int]]:
+    """
+    用短句子编号代替字符位置标记拼接原文，不连续的句子之间插入省略标记。
+
+    Args:
+        sentences (List[Tuple[int, str]]): split_text_by_sentences 的输出
+        selected (Optional[List[int]]): 需要发送的句子下标，默认全部
+
+    Returns:
+        Tuple[str, List[int]]: 拼接后的文本，以及编号到句子起始位置的映射
+    """
+    if selected is None:
+        selected = range(len(sentences))
+    result = []
+    starts = []
+    previous = None
+    for i in selected:
+        if previous is not None and i != previous + 1:
+            result.append(GAP_MARKER)
+        start, chunk = sentences[i]
+        result.append(f"‖{len(starts)}‖{chunk}")
+        starts.append(start)
+        previous = i
+    return "".join(result), starts
+
+
+def ids_to_revisions(revisions: List[dict], starts: List[int]) -> List[dict]:
+    """
+    把大模型返回的句子编号换算回起始位置，编号无效时 sentence_start 为 None，由 validate_revisions 交给修复。
+    """
+    result = []
+    for rev in revisions:
+        if not isinstance(rev, dict):
+            continue
+        sentence_id = rev.get("sentence_id")
+        valid = isinstance(sentence_id, int) and 0 <= sentence_id < len(starts)
+        result.append({"sentence_start": starts[sentence_id] if valid else None,
+                       "original": rev.get("original"), "content": rev.get("content")})
+    return result
+
+
+def text2diff_compact(origin_text: str, revision_text: str, prefilter: bool = False, use_cache: bool = True,
+                      stats: Optional[dict] = None, repair_attempts: int = REPAIR_ATTEMPTS) -> List[Tuple[int, int, str]]:
+    """
+    紧凑提示词版本的 text2diff：用短句子编号代替字符位置，可选只发送与引号内容相关的句子。
+
+    Args:
+        origin_text (str): 原始文本
+        revision_text (str): 修改建议
+        prefilter (bool): 是否根据引号内容预筛选句子
+        use_cache (bool): 是否使用大模型结果缓存
+        stats (Optional[dict]): 传入时写入 token 估算：full_tokens（原提示词）、compact_tokens（本次提示词），
+            以及修复的 repair_attempts / repaired / unrepaired
+        repair_attempts (int): 修复无法定位或编号无效的修改时最多请求大模型的次数，0 表示不修复
+
+    Returns:
+        List[Tuple[int, int, str]]: 替换列表
+    """
+    sentences = split_text_by_sentences(origin_text)
+    selected = prefilter_sentences(origin_text, sentences, revision_text) if prefilter else None
+    text_with_ids, starts = rebuild_text_with_ids(sentences, selected)
+
+    if stats is not None:
+        stats["full_tokens"] = estimate_tokens(rebuild_text_with_positions(sentences)) + estimate_tokens(revision_text)
+        stats["compact_tokens"] = estimate_tokens(text_with_ids) + estimate_tokens(revision_text)
+        stats["sentences"] = len(sentences)
+        stats["sent_sentences"] = len(starts)
+
+    resp = text2diff_llm_cached(text_with_ids, revision_text, use_cache, prompt_fn=text2diff_compact_prompt)
+    failed = []
+    with stage("parse"):
+        try:
+            items = salvage_json(resp)
+        except ValueError:
+            incr("parse_failures")
+            raise
+        revisions = validate_revisions(ids_to_revisions(items, starts), failed)
+
+    index = SentenceIndex(origin_text, sentences)
+    result = exact_revision(origin_text, revisions, index, failed)
+    # 修复时使用带位置标记的提示词，只发送相关句子
+    if failed:
+        with stage("repair"):
+            result += repair_revisions(index, failed, result, _repair_call, repair_attempts, stats)
+    return result
@@ -0,0 +1,758 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from src.core.metrics import incr
+from src.core.repair import is_salvageable
+
+# 内置后端的默认配置，可以被配置文件或环境变量覆盖
+BUILTIN_PROVIDERS = {
+    #免费中文大模型
+    "zhipu": {
+        "model": "glm-4-flash",
+        "base_url": "https://open.bigmodel.cn/api/paas/v4/",
+        "api_key_env": "ZHIPU_API_KEY",
+    },
+    "deepseek": {
+        "model": "deepseek-chat",
+        "base_url": "https://api.deepseek.com",
+        "api_key_env": "DEEPSEEK_API_KEY",
+        "stream_usage": True,
+    },
+    "openai": {
+        "model": "gpt-4o-mini",
+        "base_url": None,
+        "api_key_env": "OPENAI_API_KEY",
+        "stream_usage": True,
+    },
+    #多个后端组成的池：主后端慢于历史延迟分位数时向下一个后端发起对冲请求
+    "pool": {
+        "type": "pool",
+        "backends": ["zhipu", "deepseek"],
+    },
+    #本地桩后端，不访问网络，用于测试和压测
+    "stub": {
+        "type": "stub",
+        "model": "stub",
+    },
+}
+
+DEFAULT_PROVIDER = "zhipu"
+
+# 环境变量 -> 配置项，优先级高于配置文件
+ENV_OVERRIDES = {
+    "TEXT2DIFF_PROVIDER": "provider",
+    "TEXT2DIFF_MODEL": "model",
+    "TEXT2DIFF_BASE_URL": "base_url",
+    "TEXT2DIFF_API_KEY_ENV": "api_key_env",
+    "TEXT2DIFF_ELL_STORE": "ell_store",
+    "TEXT2DIFF_ELL_VERBOSE": "ell_verbose",
+    "TEXT2DIFF_ELL_SAMPLE_RATE": "ell_sample_rate",
+    "TEXT2DIFF_MAX_CONNECTIONS": "max_connections",
+    "TEXT2DIFF_MAX_KEEPALIVE_CONNECTIONS": "max_keepalive_connections",
+    "TEXT2DIFF_KEEPALIVE_EXPIRY": "keepalive_expiry",
+    "TEXT2DIFF_STUB_RESPONSE": "response",
+    "TEXT2DIFF_BACKENDS": "backends",
+    "TEXT2DIFF_HEDGE_PERCENTILE": "hedge_percentile",
+    "TEXT2DIFF_HEDGE_DELAY": "hedge_delay",
+}
+
+# 只作用于当前选中后端的配置项，其余顶层配置作用于所有后端
+PROVIDER_KEYS = ("type", "model", "base_url", "api_key_env", "response", "backends", "stream_usage")
+
+# 全局默认配置
+DEFAULT_SETTINGS = {
+    "ell_store": "./logdir",
+    "ell_verbose": True,
+    # 写入 ell 存储（并打印 verbose 日志）的同步调用比例，生产环境可以调低以减少记录开销
+    "ell_sample_rate": 1.0,
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30,
+}
+
+
+def load_config() -> dict:
+    """
+    读取后端配置。
+    先读取 TEXT2DIFF_CONFIG 指向的 JSON 配置文件，再用环境变量覆盖。
+
+    配置文件示例：
+    {
+        "provider": "deepseek",
+        "providers": {"my-vllm": {"model": "qwen2.5", "base_url": "http://127.0.0.1:8000/v1"}},
+        "ell_store": null
+    }
+
+    Returns:
+        dict: 配置
+    """
+    config = {}
+    path = os.getenv("TEXT2DIFF_CONFIG")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    for env, key in ENV_OVERRIDES.items():
+        value = os.getenv(env)
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.lower() not in ("0", "off", "false", "")
+    return bool(value)
+
+
+class Provider:
+    """
+    大模型后端的基类。
+    所有调用都以提示词函数为参数：函数的文档字符串是系统提示词，返回值是用户提示词，
+    与 ell.simple 的约定一致。
+    """
+
+    def __init__(self, name: str, model: str, settings: Optional[dict] = None):
+        self.name = name
+        self.model = model
+        self.settings = settings or {}
+
+    def build_messages(self, prompt_fn: Callable, *args) -> list:
+        return [
+            {"role": "system", "content": prompt_fn.__doc__},
+            {"role": "user", "content": prompt_fn(*args)},
+        ]
+
+    def call(self, prompt_fn: Callable, *args) -> str:
+        raise NotImplementedError
+
+    async def acall(self, prompt_fn: Callable, *args) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt_fn: Callable, *args):
+        yield self.call(prompt_fn, *args)
+
+    async def astream(self, prompt_fn: Callable, *args):
+        yield await self.acall(prompt_fn, *args)
+
+
+_ell_lock = threading.Lock()
+_ell_initialized = False
+
+
+def _init_ell(settings: dict, model: str) -> None:
+    """
+    第一次通过 ell 调用大模型时才初始化 ell 的存储。
+    """
+    global _ell_initialized
+    with _ell_lock:
+        if _ell_initialized:
+            return
+        import ell
+        ell.init(store=settings.get("ell_store"), autocommit=True, verbose=_as_bool(settings.get("ell_verbose")))
+        #把当前可用的model打印出来
+        print(f"ell init success, current model: {model}")
+        _ell_initialized = True
+
+
+def _record_usage(usage) -> None:
+    # 接口返回的真实 token 用量；ell 的同步调用拿不到 usage，只有 diff.py 中的估算值
+    if usage is None:
+        return
+    incr("prompt_tokens", usage.prompt_tokens or 0)
+    incr("completion_tokens", usage.completion_tokens or 0)
+
+
+class OpenAIProvider(Provider):
+    """
+    OpenAI 兼容接口的后端（智谱、DeepSeek、OpenAI 等）。
+    同步调用走 ell（记录调用日志），异步和流式调用直接使用 openai 客户端，并记录返回的 token 用量。
+    配置 stream_usage 时流式调用请求在最后一段返回用量（stream_options.include_usage，不是所有兼容接口都支持）。
+    客户端在第一次使用时才创建。
+    """
+
+    def __init__(self, name: str, model: str, settings: Optional[dict] = None):
+        super().__init__(name, model, settings)
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._lmps = {}
+
+    def _api_key(self) -> Optional[str]:
+        env = self.settings.get("api_key_env")
+        return os.getenv(env) if env else None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import openai
+                self._client = openai.OpenAI(api_key=self._api_key(), base_url=self.settings.get("base_url"))
+            return self._client
+
+    @property
+    def async_client(self):
+        """
+        异步客户端：所有协程共享同一个连接池，连接数和 keep-alive 时长可以配置。
+        """
+        with self._lock:
+            if self._async_client is None:
+                import httpx
+                import openai
+                self._async_client = openai.AsyncOpenAI(
+                    api_key=self._api_key(),
+                    base_url=self.settings.get("base_url"),
+                    http_client=openai.DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=int(self.settings["max_connections"]),
+                            max_keepalive_connections=int(self.settings["max_keepalive_connections"]),
+                            keepalive_expiry=float(self.settings["keepalive_expiry"]),
+                        )
+                    ),
+                )
+            return self._async_client
+
+    def _lmp(self, prompt_fn: Callable):
+        client = self.client
+        # 按采样率决定本次调用是否被 ell 记录，未采样的调用使用 exempt_from_tracking 的 lmp
+        tracked = random.random() < float(self.settings.get("ell_sample_rate", 1.0))
+        with self._lock:
+            lmp = self._lmps.get((prompt_fn, tracked))
+            if lmp is None:
+                import ell
+                _init_ell(self.settings, self.model)
+                lmp = ell.simple(model=self.model, client=client, exempt_from_tracking=not tracked)(prompt_fn)
+                self._lmps[(prompt_fn, tracked)] = lmp
+            return lmp
+
+    def call(self, prompt_fn: Callable, *args) -> str:
+        return self._lmp(prompt_fn)(*args)
+
+    async def acall(self, prompt_fn: Callable, *args) -> str:
+        resp = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(prompt_fn, *args),
+        )
+        _record_usage(getattr(resp, "usage", None))
+        return resp.choices[0].message.content
+
+    def _stream_kwargs(self) -> dict:
+        if _as_bool(self.settings.get("stream_usage", False)):
+            return {"stream_options": {"include_usage": True}}
+        return {}
+
+    def stream(self, prompt_fn: Callable, *args):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(prompt_fn, *args),
+            stream=True,
+            **self._stream_kwargs(),
+        )
+        for chunk in stream:
+            _record_usage(getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def astream(self, prompt_fn: Callable, *args):
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(prompt_fn, *args),
+            stream=True,
+            **self._stream_kwargs(),
+        )
+        async for chunk in stream:
+            _record_usage(getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubProvider(Provider):
+    """
+    本地桩后端，不访问网络。
+    responder 接收 (系统提示词, 用户提示词) 并返回模型输出；未提供时返回配置中的 response，默认为 "[]"。
+    """
+
+    def __init__(self, name: str = "stub", model: str = "stub", settings: Optional[dict] = None,
+                 responder: Optional[Callable[[str, str], str]] = None, chunk_size: int = 16):
+        super().__init__(name, model, settings)
+        self.responder = responder
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def _respond(self, prompt_fn: Callable, *args) -> str:
+        self.calls += 1
+        if self.responder is None:
+            return self.settings.get("response", "[]")
+        return self.responder(prompt_fn.__doc__, prompt_fn(*args))
+
+    def call(self, prompt_fn: Callable, *args) -> str:
+        # 配置中的 delay（秒）模拟网络延迟
+        time.sleep(float(self.settings.get("delay", 0)))
+        return self._respond(prompt_fn, *args)
+
+    async def acall(self, prompt_fn: Callable, *args) -> str:
+        await asyncio.sleep(float(self.settings.get("delay", 0)))
+        return self._respond(prompt_fn, *args)
+
+    def stream(self, prompt_fn: Callable, *args):
+        resp = self.call(prompt_fn, *args)
+        for i in range(0, len(resp), self.chunk_size):
+            yield resp[i:i + self.chunk_size]
+
+    async def astream(self, prompt_fn: Callable, *args):
+        for chunk in self.stream(prompt_fn, *args):
+            yield chunk
+
+
+class BackendHealth:
+    """
+    单个后端的健康状态：最近成功调用的延迟，以及熔断器。
+    连续失败 failure_threshold 次后熔断 cooldown 秒，期间不再使用该后端；
+    冷却结束后放行一次试探调用，成功则恢复，失败则再次熔断。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, window: int = 100,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self.opened_at >= self.cooldown else "open"
+
+    def available(self) -> bool:
+        """
+        是否可以向该后端发送请求，半开状态下同一时间只放行一个试探请求。
+        """
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def begin(self) -> None:
+        """
+        发送请求前调用，半开状态下占用试探名额。
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = True
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    incr("circuit_opened")
+                self.opened_at = self.clock()
+            self._probing = False
+
+    def release(self) -> None:
+        """
+        请求被取消（既不算成功也不算失败）时归还试探名额。
+        """
+        with self._lock:
+            self._probing = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+# 后端池的默认配置
+POOL_DEFAULTS = {
+    # 主后端超过其历史延迟的该分位数仍未返回时发起对冲请求
+    "hedge_percentile": 0.95,
+    # 延迟样本不足 hedge_min_samples 个时使用的固定对冲延迟（秒）
+    "hedge_delay": 2.0,
+    "hedge_min_samples": 20,
+    # 同时进行的请求数上限（主请求 + 对冲请求）
+    "max_parallel": 2,
+    "failure_threshold": 3,
+    "cooldown": 30.0,
+}
+
+
+class _Race:
+    """
+    一次对冲调用的状态，同步和异步版本共用。
+    """
+
+    def __init__(self, pool: "PoolProvider"):
+        self.pool = pool
+        self.backends = pool.candidates()
+        self.next = 0
+        self.hedged = False
+        self.fallback = None
+        self.error = None
+
+    def launchable(self, running: int) -> bool:
+        return self.next < len(self.backends) and running < self.pool.max_parallel
+
+    def take(self) -> Provider:
+        backend = self.backends[self.next]
+        self.next += 1
+        self.pool.health_of(backend).begin()
+        return backend
+
+    def timeout(self, running: int) -> Optional[float]:
+        # 每次调用只对冲一次；失败后的补发不需要等待
+        if self.hedged or not self.launchable(running):
+            return None
+        return self.pool.hedge_delay(self.backends[0])
+
+    def done(self, backend: Provider, started: float, resp=None, error: Exception = None) -> bool:
+        """
+        记录一次调用的结果，返回是否得到了有效结果。
+        """
+        health = self.pool.health_of(backend)
+        if error is None and self.pool.validate(resp):
+            health.record_success(time.perf_counter() - started)
+            if backend is not self.backends[0]:
+                incr("hedge_wins")
+            return True
+        health.record_failure()
+        incr("backend_failures")
+        if error is None:
+            # 无效的输出留作所有后端都失败时的返回值，后续的修复阶段还可以处理
+            self.fallback = resp
+        else:
+            self.error = error
+        return False
+
+    def result(self) -> str:
+        if self.fallback is not None:
+            return self.fallback
+        raise self.error or RuntimeError("no backend available")
+
+
+class PoolProvider(Provider):
+    """
+    由多个已注册后端组成的后端池，降低长尾延迟：
+
+    - 按配置顺序选择第一个未熔断的后端作为主后端
+    - 主后端超过其历史延迟的 hedge_percentile 分位数仍未返回时，向下一个后端发起对冲请求
+    - 最先返回有效结果（默认为 salvage_json 能解析出修改列表的输出）的请求胜出，其余请求被取消；
+      同步调用在线程池中进行，已经开始的请求无法中断，只是丢弃其结果
+    - 后端出错或返回无效结果时立即改用下一个后端，连续失败的后端被熔断
+    - 流式调用不对冲，只在第一段输出之前出错时改用下一个后端
+
+    配置示例：{"type": "pool", "backends": ["zhipu", "deepseek"], "hedge_percentile": 0.95}
+    """
+
+    def __init__(self, name: str, model: Optional[str] = None, settings: Optional[dict] = None,
+                 validate: Callable[[str], bool] = is_salvageable):
+        settings = {**POOL_DEFAULTS, **(settings or {})}
+        backends = settings.get("backends") or []
+        if isinstance(backends, str):
+            backends = [b.strip() for b in backends.split(",") if b.strip()]
+        if not backends:
+            raise ValueError(f"Provider '{name}' of type 'pool' needs a non-empty 'backends' list")
+        # 缓存按模型名区分，池的模型名由后端名组成
+        super().__init__(name, model or f"pool({','.join(backends)})", settings)
+        self.backend_names = list(backends)
+        self.validate = validate
+        self.max_parallel = int(settings["max_parallel"])
+        self.health = {
+            b: BackendHealth(int(settings["failure_threshold"]), float(settings["cooldown"]))
+            for b in self.backend_names
+        }
+        self._backends = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def backends(self) -> List[Provider]:
+        # 第一次使用时才获取各后端，避免在 get_provider 持有锁时递归调用
+        if self._backends is None:
+            self._backends = [get_provider(b) for b in self.backend_names]
+        return self._backends
+
+    def health_of(self, backend: Provider) -> BackendHealth:
+        # 注册名可能与后端实例的 name 不同，按配置中的位置对应
+        return self.health[self.backend_names[self.backends.index(backend)]]
+
+    def candidates(self) -> List[Provider]:
+        """
+        按配置顺序返回未熔断的后端；全部熔断时返回所有后端，尽力而为。
+        """
+        allowed = [b for b in self.backends if self.health_of(b).available()]
+        return allowed or list(self.backends)
+
+    def hedge_delay(self, backend: Provider) -> float:
+        health = self.health_of(backend)
+        if len(health.latencies) < int(self.settings["hedge_min_samples"]):
+            return float(self.settings["hedge_delay"])
+        return health.percentile(float(self.settings["hedge_percentile"]))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"text2diff-{self.name}")
+            return self._executor
+
+    def call(self, prompt_fn: Callable, *args) -> str:
+        race = _Race(self)
+        running = {}
+
+        def launch():
+            backend = race.take()
+            future = self.executor.submit(backend.call, prompt_fn, *args)
+            running[future] = (backend, time.perf_counter())
+
+        try:
+            while True:
+                if not running:
+                    if not race.launchable(0):
+                        return race.result()
+                    launch()
+                done, _ = wait(running, timeout=race.timeout(len(running)), return_when=FIRST_COMPLETED)
+                if not done:
+                    race.hedged = True
+                    incr("hedged_requests")
+                    launch()
+                    continue
+                for future in done:
+                    backend, started = running.pop(future)
+                    error = future.exception()
+                    if race.done(backend, started, None if error else future.result(), error):
+                        return future.result()
+                if race.launchable(len(running)):
+                    launch()
+        finally:
+            # 已经开始的同步调用无法中断，只是不再等待其结果
+            for future, (backend, _) in running.items():
+                future.cancel()
+                self.health_of(backend).release()
+
+    async def acall(self, prompt_fn: Callable, *args) -> str:
+        race = _Race(self)
+        running = {}
+
+        def launch():
+            backend = race.take()
+            task = asyncio.ensure_future(backend.acall(prompt_fn, *args))
+            running[task] = (backend, time.perf_counter())
+
+        try:
+            while True:
+                if not running:
+                    if not race.launchable(0):
+                        return race.result()
+                    launch()
+                done, _ = await asyncio.wait(running, timeout=race.timeout(len(running)),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    race.hedged = True
+                    incr("hedged_requests")
+                    launch()
+                    continue
+                for task in done:
+                    backend, started = running.pop(task)
+                    error = task.exception()
+                    if race.done(backend, started, None if error else task.result(), error):
+                        return task.result()
+                if race.launchable(len(running)):
+                    launch()
+        finally:
+            # 取消未完成的请求（包括调用方取消本协程的情况）
+            for task, (backend, _) in running.items():
+                task.cancel()
+                self.health_of(backend).release()
+
+    def _stream_failed(self, health: BackendHealth) -> None:
+        health.record_failure()
+        incr("backend_failures")
+
+    def _stream_finished(self, health: BackendHealth, started: float, received: list) -> None:
+        # 延迟从发起请求到最后一段输出；完整输出无效时已经无法换后端，只记为失败
+        if self.validate("".join(received)):
+            health.record_success(time.perf_counter() - started)
+        else:
+            self._stream_failed(health)
+
+    def stream(self, prompt_fn: Callable, *args):
+        """
+        流式输出不对冲：按顺序使用未熔断的后端，第一段输出之前出错时改用下一个后端；
+        已经产出内容之后出错则直接抛出。结果同样计入各后端的延迟和熔断状态。
+        """
+        error = None
+        for backend in self.candidates():
+            health = self.health_of(backend)
+            health.begin()
+            started = time.perf_counter()
+            chunks = backend.stream(prompt_fn, *args)
+            received = []
+            try:
+                try:
+                    first = next(chunks, None)
+                except Exception as e:
+                    self._stream_failed(health)
+                    error = e
+                    continue
+                if first is None:
+                    # 空输出同样在产出任何内容之前，可以改用下一个后端
+                    self._stream_failed(health)
+                    continue
+                received.append(first)
+                yield first
+                for chunk in chunks:
+                    received.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                # 调用方提前停止读取，既不算成功也不算失败
+                health.release()
+                raise
+            except Exception:
+                self._stream_failed(health)
+                raise
+            finally:
+                chunks.close()
+            self._stream_finished(health, started, received)
+            return
+        # 所有后端都出错时抛出最后一个错误，都只返回空输出时结束
+        if error is not None:
+            raise error
+
+    async def astream(self, prompt_fn: Callable, *args):
+        error = None
+        for backend in self.candidates():
+            health = self.health_of(backend)
+            health.begin()
+            started = time.perf_counter()
+            chunks = backend.astream(prompt_fn, *args)
+            received = []
+            try:
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    self._stream_failed(health)
+                    continue
+                except Exception as e:
+                    self._stream_failed(health)
+                    error = e
+                    continue
+                received.append(first)
+                yield first
+                async for chunk in chunks:
+                    received.append(chunk)
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                health.release()
+                raise
+            except Exception:
+                self._stream_failed(health)
+                raise
+            finally:
+                await chunks.aclose()
+            self._stream_finished(health, started, received)
+            return
+        # 所有后端都出错时抛出最后一个错误，都只返回空输出时结束
+        if error is not None:
+            raise error
+
+    def stats(self) -> dict:
+        """
+        各后端的熔断状态、连续失败次数和延迟分位数。
+        """
+        return {
+            name: {
+                "state": health.state,
+                "failures": health.failures,
+                "p50": health.percentile(0.5),
+                "p95": health.percentile(0.95),
+            }
+            for name, health in self.health.items()
+        }
+
+
+PROVIDER_TYPES = {
+    "openai": OpenAIProvider,
+    "stub": StubProvider,
+    "pool": PoolProvider,
+}
+
+_lock = threading.Lock()
+_providers: Dict[str, Provider] = {}
+_default_name: Optional[str] = None
+
+
+def register_provider(name: str, provider: Provider) -> None:
+    """
+    注册（或替换）一个后端实例。
+    """
+    with _lock:
+        _providers[name] = provider
+
+
+def use_provider(name: Optional[str]) -> None:
+    """
+    设置默认后端，传入 None 时恢复为配置中的默认值。
+    """
+    global _default_name
+    with _lock:
+        _default_name = name
+
+
+def get_provider(name: Optional[str] = None) -> Provider:
+    """
+    获取后端实例，第一次获取时根据配置创建。
+
+    Args:
+        name (Optional[str]): 后端名称，默认取 use_provider 设置的值或配置中的 provider
+
+    Returns:
+        Provider: 后端实例
+    """
+    config = None
+    if name is None:
+        name = _default_name
+    if name is None:
+        config = load_config()
+        name = config.get("provider", DEFAULT_PROVIDER)
+
+    with _lock:
+        provider = _providers.get(name)
+        if provider is not None:
+            return provider
+
+        if config is None:
+            config = load_config()
+        selected = config.get("provider", DEFAULT_PROVIDER)
+        settings = {**DEFAULT_SETTINGS, **BUILTIN_PROVIDERS.get(name, {}), **config.get("providers", {}).get(name, {})}
+        for key, value in config.items():
+            if key in ("provider", "providers"):
+                continue
+            # 顶层的模型相关配置只作用于当前选中的后端
+            if key in PROVIDER_KEYS and name != selected:
+                continue
+            settings[key] = value
+        if "model" not in settings and settings.get("type") != "pool":
+            raise ValueError(f"Unknown provider '{name}': configure its model and base_url in TEXT2DIFF_CONFIG")
+
+        provider_type = PROVIDER_TYPES[settings.get("type", "openai")]
+        provider = provider_type(name=name, model=settings.get("model"), settings=settings)
+        _providers[name] = provider
+        return provider
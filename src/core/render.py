@@ -0,0 +1,171 @@
+from html import escape as html_escape
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+from src.core.replacements import sort_replacements
+
+# 被折叠的未修改区域的提示
+COLLAPSED_HTML = "<span style='color:gray'>\n⋯ 省略 {count} 个字符 ⋯\n</span>"
+COLLAPSED_MD = "\n⋯ 省略 {count} 个字符 ⋯\n"
+
+
+def _context_start(text: str, pos: int, context: int, by_lines: bool) -> int:
+    if not by_lines:
+        return max(pos - context, 0)
+    # 向前找到 context 行之前的行首
+    for _ in range(context + 1):
+        pos = text.rfind("\n", 0, pos)
+        if pos == -1:
+            return 0
+    return pos + 1
+
+
+def _context_end(text: str, pos: int, context: int, by_lines: bool) -> int:
+    if not by_lines:
+        return min(pos + context, len(text))
+    # 向后找到 context 行之后的行尾（包含换行符）
+    for _ in range(context + 1):
+        pos = text.find("\n", pos)
+        if pos == -1:
+            return len(text)
+        pos += 1
+    return pos
+
+
+def iter_hunks(text: str, replacements: List[Tuple[int, int, str]], context: Optional[int] = None,
+               by_lines: bool = False) -> Iterator[Tuple[int, int, List[Tuple[int, int, str]]]]:
+    """
+    把修改按上下文窗口分组，类似 unified diff 的 hunk，相互重叠或相邻的窗口会合并。
+
+    Args:
+        text (str): 原始文本
+        replacements (List[Tuple[int, int, str]]): 修改列表
+        context (Optional[int]): 每个修改前后保留的上下文长度，None 表示保留全文
+        by_lines (bool): context 按行计算，否则按字符计算
+
+    Yields:
+        Tuple[int, int, List[Tuple[int, int, str]]]: (hunk 起始位置, hunk 结束位置, hunk 内的修改)
+    """
+    ordered = sort_replacements(replacements)
+    if context is None:
+        yield 0, len(text), ordered
+        return
+
+    hunk = None
+    for replacement in ordered:
+        start, end, _ = replacement
+        lo = _context_start(text, start, context, by_lines)
+        hi = max(_context_end(text, end, context, by_lines), end)
+        if hunk and lo <= hunk[1]:
+            hunk[1] = max(hunk[1], hi)
+            hunk[2].append(replacement)
+            continue
+        if hunk:
+            yield tuple(hunk)
+        hunk = [lo, hi, [replacement]]
+    if hunk:
+        yield tuple(hunk)
+
+
+def _render(text: str, replacements, context, by_lines, plain, mark, collapsed) -> Iterator[str]:
+    current_pos = 0
+    for lo, hi, hunk in iter_hunks(text, replacements, context, by_lines):
+        if current_pos < lo:
+            yield collapsed.format(count=lo - current_pos)
+            current_pos = lo
+        for start, end, content in hunk:
+            # 添加未修改部分
+            if current_pos < start:
+                yield plain(text[current_pos:start])
+            yield from mark(text[start:end], content, start, end)
+            current_pos = max(current_pos, end)
+        if current_pos < hi:
+            yield plain(text[current_pos:hi])
+            current_pos = hi
+    if current_pos < len(text):
+        yield collapsed.format(count=len(text) - current_pos)
+
+
+def _html_mark(escape: bool):
+    esc = html_escape if escape else str
+
+    def mark(original: str, content: str, start: int, end: int) -> Iterator[str]:
+        if not content:  # 删除
+            yield f"<span style='color:red;text-decoration:line-through'>{esc(original)}</span>"
+        elif start == end:  # 新增
+            yield f"<span style='color:green;font-weight:bold'>{esc(content)}</span>"
+        elif original in content:  # 修改（包含原文）
+            original_start = content.find(original)
+            original_end = original_start + len(original)
+            if original_start > 0:
+                yield f"<span style='color:green;font-weight:bold'>{esc(content[:original_start])}</span>"
+            yield esc(original)
+            if original_end < len(content):
+                yield f"<span style='color:green;font-weight:bold'>{esc(content[original_end:])}</span>"
+        else:  # 完全修改
+            yield (
+                f"<span style='color:red;text-decoration:line-through'>{esc(original)}</span>"
+                f" → "
+                f"<span style='color:green;font-weight:bold'>{esc(content)}</span>"
+            )
+    return mark
+
+
+def _md_mark(original: str, content: str, start: int, end: int) -> Iterator[str]:
+    yield f"~~{original}~~ → **{content}**"
+
+
+def iter_html(origin_text, replacements: List[Tuple[int, int, str]], context: Optional[int] = None,
+              by_lines: bool = False, escape: bool = True) -> Iterator[str]:
+    """
+    逐段产出 HTML 格式的修改信息，不在内存中拼接整个文档。
+
+    Args:
+        origin_text (Union[str, Document]): 原始文本
+        replacements (List[Tuple[int, int, str]]): 修改列表，每个元素是 (start, end, content)
+        context (Optional[int]): hunk 模式下每个修改前后保留的上下文长度，None 表示输出全文
+        by_lines (bool): context 按行计算，否则按字符计算
+        escape (bool): 是否对原文和修改内容做 HTML 转义
+
+    Yields:
+        str: HTML 片段
+    """
+    plain = html_escape if escape else str
+    yield from _render(str(origin_text), replacements, context, by_lines, plain, _html_mark(escape), COLLAPSED_HTML)
+
+
+def iter_md(origin_text, replacements: List[Tuple[int, int, str]], context: Optional[int] = None,
+            by_lines: bool = False) -> Iterator[str]:
+    """
+    逐段产出 Markdown 格式的修改信息，参数同 iter_html。
+    """
+    yield from _render(str(origin_text), replacements, context, by_lines, str, _md_mark, COLLAPSED_MD)
+
+
+def render_html(origin_text, replacements: List[Tuple[int, int, str]], sink: TextIO, context: Optional[int] = None,
+                by_lines: bool = False, escape: bool = True) -> int:
+    """
+    把 HTML 格式的修改信息逐段写入 sink（任何有 write 方法的对象）。
+
+    Returns:
+        int: 写入的字符数
+    """
+    written = 0
+    for chunk in iter_html(origin_text, replacements, context, by_lines, escape):
+        sink.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def render_md(origin_text, replacements: List[Tuple[int, int, str]], sink: TextIO, context: Optional[int] = None,
+              by_lines: bool = False) -> int:
+    """
+    把 Markdown 格式的修改信息逐段写入 sink。
+
+    Returns:
+        int: 写入的字符数
+    """
+    written = 0
+    for chunk in iter_md(origin_text, replacements, context, by_lines):
+        sink.write(chunk)
+        written += len(chunk)
+    return written
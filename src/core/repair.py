@@ -0,0 +1,302 @@
+from collections import Counter
+from typing import Awaitable, Callable, List, Optional, Tuple
+import json
+import re
+
+from src.core.index import SentenceIndex
+from src.core.merge import merge_replacements
+from src.core.metrics import incr, stage
+
+# 每次 text2diff 最多发起的修复请求数
+REPAIR_ATTEMPTS = 2
+
+# 修复上下文中不相邻的句子之间插入的省略标记
+GAP_MARKER = "\n…\n"
+
+# 模型有时会把 JSON 包在 Markdown 代码块里
+FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+# 从 original 中切出用于定位上下文的片段
+ANCHOR_SPLIT = re.compile(r"[\s，。！？、；：,.!?;:\"'“”‘’（）()]+")
+
+
+def text2diff_repair_prompt(text_with_pos: str, revision_text: str):
+    """
+你的任务是修正一组无法在原文中定位的修改。
+
+这些修改的 original 在原文中找不到（可能有错字、多余或缺少的标点和空格、措辞被改写），或者缺少 sentence_start。
+请对照给出的原文片段，把 original 改为与原文逐字一致的内容，并给出正确的 sentence_start，content 保持原意不变。
+
+关于位置标记：
+- 原文中的‖start:数字‖是位置标记符，标记了后续文本的起始位置
+- 在定位original内容时，使用该内容往前追溯的最近一个‖start:数字‖中的数字作为start值
+- 严格使用标记符中的数字，不要自行计算或估算位置
+- 原文片段之间单独一行的"…"表示省略了不相关的内容
+
+输出格式（每条修改输出一个元素，确实无法在片段中定位的修改不要输出）：
+[
+    {
+      "sentence_start": <使用original内容往前追溯的最近一个位置标记符里的数字>,
+      "original": <与原文逐字一致的需要修改的内容，不能为空字符串>,
+      "content": <修改后的内容>
+    }
+]
+"""
+    return f"现在请修正以下内容：\n原文片段：\n{text_with_pos}\n无法定位的修改：\n{revision_text}"
+
+
+def salvage_json(resp: str) -> list:
+    """
+    从大模型的输出中提取修改列表，容忍代码块包裹、外层对象包裹、截断和个别格式错误的元素。
+    整体无法解析时逐个解析完整的 JSON 对象。
+
+    Args:
+        resp (str): 大模型返回的文本
+
+    Returns:
+        list: 解析出的元素（未校验格式）
+
+    Raises:
+        ValueError: 输出中没有任何可以解析的 JSON
+    """
+    text = str(resp).strip()
+    if text.startswith("```"):
+        text = FENCE_PATTERN.match(text).group(1)
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    else:
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            # {"revisions": [...]} 这类外层对象
+            for value in data.values():
+                if isinstance(value, list):
+                    return value
+            return [data]
+        return []
+
+    decoder = json.JSONDecoder()
+    items = []
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            obj, end = decoder.raw_decode(text, pos)
+        except ValueError:
+            pos = text.find("{", pos + 1)
+            continue
+        if isinstance(obj, dict):
+            items.append(obj)
+        pos = text.find("{", end)
+    if not items:
+        raise ValueError(f"no JSON revisions found in response: {text[:80]!r}")
+    return items
+
+
+def is_salvageable(resp) -> bool:
+    """
+    salvage_json 能否从输出中提取出修改列表，用于判断结果是否值得缓存、保存或算作后端成功。
+    """
+    if not isinstance(resp, str):
+        return False
+    try:
+        salvage_json(resp)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_revisions(items: list, failed: list = None) -> List[dict]:
+    """
+    校验并规范化修改列表。
+    格式正确的返回；original 和 content 可用但 sentence_start 无效的，以 sentence_start=None 追加到 failed；
+    其余的丢弃。
+
+    Args:
+        items (list): salvage_json 的输出
+        failed (list): 可选，收集可以修复的无效修改
+
+    Returns:
+        List[dict]: {"sentence_start": int, "original": str, "content": str} 列表
+    """
+    valid = []
+    invalid = 0
+    for item in items:
+        original = item.get("original") if isinstance(item, dict) else None
+        content = item.get("content") if isinstance(item, dict) else None
+        if not isinstance(original, str) or not original or not isinstance(content, str):
+            invalid += 1
+            continue
+        try:
+            sentence_start = int(item.get("sentence_start"))
+        except (TypeError, ValueError):
+            invalid += 1
+            if failed is not None:
+                failed.append({"sentence_start": None, "original": original, "content": content})
+            continue
+        valid.append({"sentence_start": sentence_start, "original": original, "content": content})
+    if invalid:
+        incr("invalid_revisions", invalid)
+    return valid
+
+
+def parse_revisions(resp: str, failed: list = None) -> List[dict]:
+    """
+    容错版的 parse_response：提取并校验修改列表，可以修复的无效修改追加到 failed。
+    输出中没有任何可以解析的 JSON 时计数后抛出 ValueError。
+    """
+    with stage("parse"):
+        try:
+            items = salvage_json(resp)
+        except ValueError:
+            incr("parse_failures")
+            raise
+        return validate_revisions(items, failed)
+
+
+def _anchor_sentences(index: SentenceIndex, original: str, limit: int = 3) -> set:
+    # original 中较长的片段以及前后半段在原文中出现的句子
+    pieces = sorted((p for p in ANCHOR_SPLIT.split(original) if len(p) >= 2), key=len, reverse=True)[:3]
+    half = max(len(original) // 2, 2)
+    if len(original) > half:
+        pieces += [original[:half], original[-half:]]
+    hits = set()
+    for piece in pieces:
+        pos = index.text.find(piece)
+        for _ in range(limit):
+            if pos == -1:
+                break
+            hits.add(index.locate(pos))
+            pos = index.text.find(piece, pos + 1)
+    return hits
+
+
+def build_repair_context(index: SentenceIndex, items: List[dict], neighbours: int = 1) -> Optional[str]:
+    """
+    只取与待修复修改相关的句子（sentence_start 所在的句子、original 片段出现的句子及其相邻句子），
+    拼接为带位置标记的原文片段。没有相关句子时返回 None。
+    """
+    selected = set()
+    last = len(index) - 1
+    for item in items:
+        hits = _anchor_sentences(index, item["original"])
+        if item.get("sentence_start") is not None:
+            hits.add(index.locate(item["sentence_start"]))
+        for i in hits:
+            selected.update(range(max(i - neighbours, 0), min(i + neighbours, last) + 1))
+    if not selected:
+        return None
+
+    parts = []
+    previous = None
+    for i in sorted(selected):
+        if previous is not None and i != previous + 1:
+            parts.append(GAP_MARKER)
+        start = index.starts[i]
+        parts.append(f"‖start:{start}‖{index.text[start:index.sentence_end(i)]}")
+        previous = i
+    return "".join(parts)
+
+
+class _Repair:
+    """
+    修复过程的状态，同步和异步版本共用：next_request 给出下一次请求的参数，update 处理返回结果。
+    """
+
+    def __init__(self, index: SentenceIndex, failed: List[dict], max_attempts: int):
+        self.index = index
+        self.pending = list(failed)
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.repaired = []
+
+    def next_request(self) -> Optional[Tuple[str, str]]:
+        if not self.pending or self.attempts >= self.max_attempts:
+            return None
+        text_with_pos = build_repair_context(self.index, self.pending)
+        if text_with_pos is None:
+            return None
+        self.attempts += 1
+        incr("repair_calls")
+        return text_with_pos, json.dumps(self.pending, ensure_ascii=False)
+
+    def update(self, resp: str) -> None:
+        try:
+            revisions = parse_revisions(resp)
+        except ValueError:
+            return
+        unresolved = []
+        self.repaired += self.index.resolve(revisions, unresolved)
+        # 模型会保持 content 不变，按 content 判断哪些待修复的修改已经有了结果
+        unresolved_ids = set(map(id, unresolved))
+        answered = Counter(rev["content"] for rev in revisions if id(rev) not in unresolved_ids)
+        pending = []
+        for item in self.pending:
+            if answered[item["content"]]:
+                answered[item["content"]] -= 1
+            else:
+                pending.append(item)
+        self.pending = pending
+
+    def finish(self, accepted: List[Tuple[int, int, str]], stats: dict = None) -> List[Tuple[int, int, str]]:
+        # 与已有修改重叠或重复的修复结果丢弃
+        existing = set(map(tuple, accepted))
+        _, conflicts = merge_replacements([accepted, self.repaired])
+        rejected = {c["replacement"] for c in conflicts if c["group"] == 1}
+        result = []
+        for replacement in self.repaired:
+            if replacement not in existing and replacement not in rejected:
+                existing.add(replacement)
+                result.append(replacement)
+
+        if result:
+            incr("repaired_revisions", len(result))
+        if self.pending:
+            incr("dropped_revisions", len(self.pending))
+        if stats is not None:
+            stats["repair_attempts"] = self.attempts
+            stats["repaired"] = len(result)
+            stats["unrepaired"] = len(self.pending)
+        return result
+
+
+def repair_revisions(index: SentenceIndex, failed: List[dict], accepted: List[Tuple[int, int, str]],
+                     call: Callable[[str, str], str], max_attempts: int = REPAIR_ATTEMPTS,
+                     stats: dict = None) -> List[Tuple[int, int, str]]:
+    """
+    只针对无法定位或格式无效的修改重新询问大模型，上下文只包含相关的句子，最多请求 max_attempts 次。
+
+    Args:
+        index (SentenceIndex): 原文的句子索引
+        failed (List[dict]): 待修复的修改，元素为 {"sentence_start", "original", "content"}
+        accepted (List[Tuple[int, int, str]]): 已经定位成功的修改，与之重叠的修复结果会被丢弃
+        call (Callable[[str, str], str]): 调用大模型的函数，参数为 (原文片段, 待修复修改的 JSON)，
+            提示词为 text2diff_repair_prompt
+        max_attempts (int): 最多请求次数
+        stats (dict): 可选，写入 repair_attempts / repaired / unrepaired
+
+    Returns:
+        List[Tuple[int, int, str]]: 修复后新增的 (start, end, content) 列表
+    """
+    repair = _Repair(index, failed, max_attempts)
+    request = repair.next_request()
+    while request is not None:
+        repair.update(call(*request))
+        request = repair.next_request()
+    return repair.finish(accepted, stats)
+
+
+async def repair_revisions_async(index: SentenceIndex, failed: List[dict], accepted: List[Tuple[int, int, str]],
+                                 call: Callable[[str, str], Awaitable[str]], max_attempts: int = REPAIR_ATTEMPTS,
+                                 stats: dict = None) -> List[Tuple[int, int, str]]:
+    """
+    repair_revisions 的异步版本，call 为异步函数。
+    """
+    repair = _Repair(index, failed, max_attempts)
+    request = repair.next_request()
+    while request is not None:
+        repair.update(await call(*request))
+        request = repair.next_request()
+    return repair.finish(accepted, stats)
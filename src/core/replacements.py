@@ -0,0 +1,178 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Sequence, Tuple, Union
+import struct
+import sys
+
+from src.core.merge import check_overlaps
+
+# 二进制格式：魔数、格式版本、整数数组类型码、替换数量，之后依次是 starts、ends、内容字节长度和 UTF-8 内容
+MAGIC = b"T2DR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBcQ")
+
+
+class ReplacementSet:
+    """
+    列式存储的替换列表：start、end 存放在紧凑的整数数组中，内容单独存放在列表里。
+    构造时排序一次并检查区间不重叠，之后 apply_diff、渲染等函数直接按顺序使用，不再重复排序。
+    迭代时产出 (start, end, content)，可以替代原来的元组列表。
+    """
+
+    def __init__(self, replacements: Iterable[Tuple[int, int, str]] = ()):
+        ordered = sorted((tuple(r) for r in replacements), key=lambda x: (x[0], x[1]))
+        check_overlaps(ordered)
+        self.starts = array("q", (r[0] for r in ordered))
+        self.ends = array("q", (r[1] for r in ordered))
+        self.contents: List[str] = [r[2] for r in ordered]
+        self._new_starts = None
+
+    @classmethod
+    def _from_columns(cls, starts: array, ends: array, contents: List[str]) -> "ReplacementSet":
+        self = cls.__new__(cls)
+        self.starts = starts
+        self.ends = ends
+        self.contents = contents
+        self._new_starts = None
+        return self
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __getitem__(self, i: int) -> Tuple[int, int, str]:
+        return self.starts[i], self.ends[i], self.contents[i]
+
+    def __iter__(self) -> Iterator[Tuple[int, int, str]]:
+        return zip(self.starts, self.ends, self.contents)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ReplacementSet):
+            return self.starts == other.starts and self.ends == other.ends and self.contents == other.contents
+        if isinstance(other, (list, tuple)):
+            return list(self) == [tuple(r) for r in other]
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ReplacementSet({list(self)!r})"
+
+    def to_list(self) -> List[Tuple[int, int, str]]:
+        return list(self)
+
+    @property
+    def delta(self) -> int:
+        """
+        应用全部替换后文本长度的变化量。
+        """
+        return sum(len(c) for c in self.contents) - sum(self.ends) + sum(self.starts)
+
+    def _mapping(self) -> array:
+        # 每个替换在新文本中的起始位置，首次映射时计算一次
+        if self._new_starts is None:
+            new_starts = array("q")
+            delta = 0
+            for start, end, content in self:
+                new_starts.append(start + delta)
+                delta += len(content) - (end - start)
+            self._new_starts = new_starts
+        return self._new_starts
+
+    def map_position(self, pos: int) -> int:
+        """
+        把旧文本中的位置映射到应用替换后的新文本，规则与 Document.map_offset 相同：
+        落在被替换区间内部的位置映射到替换内容中对应的位置（超出则截断到替换内容末尾）。
+        """
+        new_starts = self._mapping()
+        i = bisect_right(self.starts, pos) - 1
+        if i < 0:
+            return pos
+        length = len(self.contents[i])
+        if pos >= self.ends[i]:
+            return new_starts[i] + length + (pos - self.ends[i])
+        return new_starts[i] + min(pos - self.starts[i], length)
+
+    def map_positions(self, positions: Sequence[int]) -> array:
+        """
+        批量映射位置（光标、批注等），返回与输入顺序一致的整数数组。
+        输入已排序时用一次线性归并完成，否则逐个二分查找。
+        """
+        if any(positions[k] > positions[k + 1] for k in range(len(positions) - 1)):
+            return array("q", (self.map_position(pos) for pos in positions))
+
+        new_starts = self._mapping()
+        starts, ends, contents = self.starts, self.ends, self.contents
+        result = array("q")
+        i = -1
+        for pos in positions:
+            while i + 1 < len(starts) and starts[i + 1] <= pos:
+                i += 1
+            if i < 0:
+                result.append(pos)
+            elif pos >= ends[i]:
+                result.append(new_starts[i] + len(contents[i]) + (pos - ends[i]))
+            else:
+                result.append(new_starts[i] + min(pos - starts[i], len(contents[i])))
+        return result
+
+    def to_bytes(self) -> bytes:
+        """
+        序列化为紧凑的二进制格式，位置都能用 32 位表示时使用 32 位整数。
+        """
+        typecode = "i" if max(self.ends, default=0) < 2 ** 31 else "q"
+        encoded = [c.encode("utf-8") for c in self.contents]
+        columns = [array(typecode, self.starts), array(typecode, self.ends), array(typecode, map(len, encoded))]
+        if sys.byteorder == "big":
+            for column in columns:
+                column.byteswap()
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, typecode.encode("ascii"), len(self))
+        return b"".join([header, *(column.tobytes() for column in columns), *encoded])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ReplacementSet":
+        """
+        从 to_bytes 的输出恢复，数据不合法时抛出 ValueError。
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("truncated replacement set")
+        magic, version, typecode, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION or typecode not in (b"i", b"q"):
+            raise ValueError("not a serialized replacement set")
+        typecode = typecode.decode("ascii")
+
+        columns = []
+        offset = HEADER.size
+        itemsize = array(typecode).itemsize
+        for _ in range(3):
+            column = array(typecode)
+            column.frombytes(data[offset:offset + count * itemsize])
+            if len(column) != count:
+                raise ValueError("truncated replacement set")
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+            offset += count * itemsize
+        starts, ends, lengths = columns
+
+        contents = []
+        for length in lengths:
+            contents.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        if offset != len(data):
+            raise ValueError("truncated replacement set")
+
+        # 来自外部的数据同样需要满足有序、不重叠
+        for k in range(count):
+            if starts[k] > ends[k] or (k and (starts[k - 1], ends[k - 1]) > (starts[k], ends[k])):
+                raise ValueError("replacement set is not sorted")
+        check_overlaps(zip(starts, ends))
+        return cls._from_columns(array("q", starts), array("q", ends), contents)
+
+
+def sort_replacements(replacements: Union[ReplacementSet, Iterable[Tuple[int, int, str]]]) -> Sequence[Tuple[int, int, str]]:
+    """
+    返回按 (start, end) 排序且不重叠的替换序列；ReplacementSet 已经排好序，直接返回。
+    """
+    if isinstance(replacements, ReplacementSet):
+        return replacements
+    ordered = sorted(replacements, key=lambda x: (x[0], x[1]))
+    check_overlaps(ordered)
+    return ordered
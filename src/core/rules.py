@@ -0,0 +1,117 @@
+from typing import Callable, List, Optional, Tuple
+import re
+
+from src.core.index import SentenceIndex
+
+# 引号内的内容，支持英文双引号、中文双引号和直角引号
+QUOTED = r'["“「『]({name}.+?)["”」』]'
+
+# 行首的序号（"1." "2、" "-" "*" 等）
+LINE_PREFIX = re.compile(r"^\s*(?:\d+\s*[.、)）]|[-*•])?\s*")
+
+# 行尾可以忽略的标点
+LINE_SUFFIX = re.compile(r"[\s。.;；,，!！]*$")
+
+# 已注册的规则：(名称, 正则, 构造函数)，按注册顺序依次尝试
+RULES: List[Tuple[str, "re.Pattern", Callable]] = []
+
+
+def register_rule(name: str, pattern: str, build: Callable[[re.Match], Tuple[str, str]]) -> None:
+    """
+    注册一条指令规则。
+
+    Args:
+        name (str): 规则名称
+        pattern (str): 匹配整行指令的正则，{q} 会被替换为引号内容的捕获组，{target}、{content} 为同名的命名捕获组
+        build (Callable): 接收匹配结果，返回 (original, content)
+    """
+    pattern = pattern.replace("{q}", QUOTED.format(name=""))
+    for group in ("target", "content"):
+        pattern = pattern.replace("{%s}" % group, QUOTED.format(name=f"?P<{group}>"))
+    RULES.append((name, re.compile(pattern, re.IGNORECASE), build))
+
+
+def _join(left: str, right: str) -> str:
+    # 英文单词之间补一个空格，例如 Add "advanced" before "medical diagnosis"
+    if left[-1:].isascii() and left[-1:].isalnum() and right[:1].isascii() and right[:1].isalnum():
+        return f"{left} {right}"
+    return left + right
+
+
+def _replace(m):
+    return m.group(1), m.group(2)
+
+
+def _insert_before(m):
+    target, content = m.group("target"), m.group("content")
+    return target, _join(content, target)
+
+
+def _insert_after(m):
+    target, content = m.group("target"), m.group("content")
+    return target, _join(target, content)
+
+
+def _delete(m):
+    return m.group(1), ""
+
+
+register_rule("replace", r"(?:把|将){q}\s*(?:改成|改为|替换为|替换成|换成)\s*{q}", _replace)
+register_rule("insert_before", r"在{target}\s*(?:前|之前|前面)\s*(?:添加|加上|插入|增加)\s*{content}", _insert_before)
+register_rule("insert_after", r"在{target}\s*(?:后|之后|后面)\s*(?:添加|加上|插入|增加)\s*{content}", _insert_after)
+register_rule("delete", r"(?:删除|删掉|去掉){q}", _delete)
+register_rule("replace_en", r"(?:change|replace)\s+{q}\s+(?:to|with)\s+{q}", _replace)
+register_rule("insert_before_en", r"(?:add|insert)\s+{content}\s+before\s+{target}", _insert_before)
+register_rule("insert_after_en", r"(?:add|insert)\s+{content}\s+after\s+{target}", _insert_after)
+register_rule("delete_en", r"(?:delete|remove)\s+{q}", _delete)
+
+
+def parse_instruction(line: str) -> Optional[Tuple[str, str, str]]:
+    """
+    用已注册的规则解析一行指令。
+
+    Returns:
+        Optional[Tuple[str, str, str]]: (规则名称, original, content)，没有规则匹配时返回 None
+    """
+    line = LINE_SUFFIX.sub("", LINE_PREFIX.sub("", line, count=1), count=1)
+    for name, pattern, build in RULES:
+        m = pattern.fullmatch(line)
+        if m:
+            original, content = build(m)
+            return name, original, content
+    return None
+
+
+def match_rules(origin_text: str, revision_text: str, index: SentenceIndex, stats: Optional[dict] = None) -> Tuple[List[dict], str]:
+    """
+    用规则处理修改建议中能识别的行，其余行留给大模型。
+    规则生成的修改与大模型输出格式相同，sentence_start 取 original 所在的句子，之后仍由 exact_revision 定位。
+    original 在原文中出现多次时无法确定要改哪一处，整行交给大模型判断。
+
+    Args:
+        origin_text (str): 原始文本
+        revision_text (str): 修改建议
+        index (SentenceIndex): 原文的句子索引
+        stats (Optional[dict]): 传入时写入 rule_lines、rule_hits、hit_rate
+
+    Returns:
+        Tuple[List[dict], str]: 规则生成的修改，以及需要交给大模型的剩余修改建议
+    """
+    revisions = []
+    leftover = []
+    lines = [line for line in revision_text.splitlines() if line.strip()]
+    for line in lines:
+        parsed = parse_instruction(line)
+        pos = origin_text.find(parsed[1]) if parsed and parsed[1] else -1
+        if pos == -1 or origin_text.find(parsed[1], pos + 1) != -1:
+            # 规则不认识、原文中找不到 original 或者 original 出现多次，交给大模型处理
+            leftover.append(line)
+            continue
+        _, original, content = parsed
+        revisions.append({"sentence_start": index.starts[index.locate(pos)], "original": original, "content": content})
+
+    if stats is not None:
+        stats["rule_lines"] = len(lines)
+        stats["rule_hits"] = len(revisions)
+        stats["hit_rate"] = len(revisions) / len(lines) if lines else 0.0
+    return revisions, "\n".join(leftover)
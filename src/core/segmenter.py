@@ -0,0 +1,113 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+from src.core.diff import SENTENCE_PATTERN, split_text_by_sentences
+
+
+class IncrementalSegmenter:
+    """
+    增量分句器：在多轮修改之间保留句子列表，每次修改只重新分割被修改的句子。
+
+    - 句子内容保存在 _chunks 中，起始位置 _starts 只保证前缀有效，后面的部分在需要时才重新计算
+    - 修改后从受影响句子的前一句开始重新匹配，直到某个句子边界与修改前的边界重合（重新同步）为止，
+      之后的句子与修改前完全一致，无需处理
+    """
+
+    def __init__(self, text: str):
+        self._chunks = [chunk for _, chunk in split_text_by_sentences(text)]
+        self._starts = []
+        self._text = text
+
+    @property
+    def text(self) -> str:
+        """
+        当前完整文本，结果会缓存到下一次修改。
+        """
+        if self._text is None:
+            self._text = "".join(self._chunks)
+        return self._text
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _extend(self, idx: int) -> None:
+        """
+        保证 _starts 至少覆盖到第 idx 个句子。
+        """
+        idx = min(idx, len(self._chunks) - 1)
+        while len(self._starts) <= idx:
+            n = len(self._starts)
+            self._starts.append(self._starts[-1] + len(self._chunks[n - 1]) if n else 0)
+
+    def _locate(self, pos: int) -> int:
+        """
+        返回包含 pos 的句子下标，只计算到所需的位置为止。
+        """
+        if not self._starts:
+            self._extend(0)
+        while len(self._starts) < len(self._chunks) and self._starts[-1] + len(self._chunks[len(self._starts) - 1]) <= pos:
+            self._extend(len(self._starts))
+        return max(bisect_right(self._starts, pos) - 1, 0)
+
+    def sentences(self) -> List[Tuple[int, str]]:
+        """
+        返回与 split_text_by_sentences(self.text) 相同格式的句子列表。
+        """
+        self._extend(len(self._chunks) - 1)
+        return list(zip(self._starts, self._chunks))
+
+    def apply(self, replacements: List[Tuple[int, int, str]]) -> None:
+        """
+        应用一组修改，位置基于修改前的文本。
+
+        Args:
+            replacements (List[Tuple[int, int, str]]): 修改列表，每个元素是 (start, end, content)
+        """
+        # 从后往前修改，前面句子的起始位置保持有效
+        for start, end, content in reversed(sorted(replacements, key=lambda x: (x[0], x[1]))):
+            self._splice(start, end, content)
+        self._text = None
+
+    def _splice(self, start: int, end: int, content: str) -> None:
+        i = self._locate(start)
+        j = self._locate(end)
+        # 修改可能影响前一句的结尾（如句末空白），从前一句开始重新匹配
+        i0 = max(i - 1, 0)
+        base = self._starts[i0]
+
+        region = "".join(self._chunks[i0:j + 1])
+        buf = region[:start - base] + content + region[end - base:]
+        # 修改之后的旧句子边界 -> 该边界之后第一个旧句子的下标，重新匹配到这些位置时即可停止
+        sync = {len(buf): j + 1}
+        k = j + 1
+
+        new_chunks = []
+        pos = 0
+        while True:
+            at_end = k >= len(self._chunks)
+            match = SENTENCE_PATTERN.search(buf, pos)
+            # 句点的判断需要向后看两个字符，离缓冲区末尾太近的匹配可能不完整
+            if match and (at_end or match.end() <= len(buf) - 2):
+                new_chunks.append(buf[pos:match.end()])
+                pos = match.end()
+                if pos in sync:
+                    k = sync[pos]
+                    break
+                if at_end and pos == len(buf):
+                    break
+                continue
+            if not at_end:
+                buf += self._chunks[k]
+                k += 1
+                sync[len(buf)] = k
+                continue
+            # 已到全文末尾，剩余部分作为最后一句
+            if pos < len(buf):
+                new_chunks.append(buf[pos:])
+            break
+
+        self._chunks[i0:k] = new_chunks
+        if not self._chunks:
+            self._chunks = [""]
+        # i0 之后的起始位置全部过期，下次需要时再计算
+        del self._starts[i0 + 1:]
@@ -0,0 +1,341 @@
+"""
+text2diff 的 JSON HTTP 服务，供其他服务以编程方式调用，不依赖 Gradio。
+
+用法（在仓库根目录运行）：
+    python -m src.core.server --host 0.0.0.0 --port 8000 --workers 8 --queue-size 64 --client-limit 4
+
+接口：
+    POST /v1/text2diff  {"text", "revision", "use_cache"?, "use_rules"?}      -> {"replacements", "stats"}
+    POST /v1/apply      {"text", "replacements"}                              -> {"text"}
+    POST /v1/render     {"text", "replacements", "format"?, "context"?, "by_lines"?, "escape"?} -> {"output"}
+    GET  /healthz       进程存活
+    GET  /readyz        工作线程正常且队列未满时返回 200，否则 503
+    GET  /metrics       Prometheus 文本格式的各阶段耗时和计数
+
+调用大模型的请求进入有界队列，由固定数量的工作线程处理；队列已满或同一客户端（X-Client-Id 请求头，
+默认取对端地址）的并发请求数超过上限时返回 429。服务本身无状态，可以在负载均衡后水平扩展。
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+import argparse
+import json
+import os
+import queue
+import threading
+
+from src.core.diff import apply_diff, text2diff
+from src.core.metrics import export_prometheus
+from src.core.render import iter_html, iter_md
+
+# 命令行参数的默认值可以用环境变量覆盖
+ENV_DEFAULTS = {
+    "workers": ("TEXT2DIFF_SERVER_WORKERS", 4),
+    "queue_size": ("TEXT2DIFF_SERVER_QUEUE_SIZE", 64),
+    "client_limit": ("TEXT2DIFF_SERVER_CLIENT_LIMIT", 4),
+    "timeout": ("TEXT2DIFF_SERVER_TIMEOUT", 120.0),
+    "max_body_bytes": ("TEXT2DIFF_SERVER_MAX_BODY_BYTES", 16 * 1024 * 1024),
+}
+
+
+class ServiceBusy(Exception):
+    """
+    队列已满或客户端并发数超过上限，对应 HTTP 429。
+    """
+
+
+class _Job:
+    __slots__ = ("fn", "args", "client", "done", "result", "error")
+
+    def __init__(self, fn: Callable, args: tuple, client: str):
+        self.fn = fn
+        self.args = args
+        self.client = client
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Text2DiffService:
+    """
+    大模型阶段的有界任务队列和工作线程池。
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 64, client_limit: int = 4, timeout: float = 120.0):
+        self.workers = workers
+        self.client_limit = client_limit
+        self.timeout = timeout
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stopping = False
+
+    def start(self) -> "Text2DiffService":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"text2diff-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        self._stopping = True
+        # 每个工作线程一个停止标记；队列满时阻塞的 put 可能一直等不到空位，
+        # 因此腾出位置，让还在排队的任务以 ServiceBusy 结束
+        pending = len(self._threads)
+        while pending:
+            try:
+                self.jobs.put_nowait(None)
+                pending -= 1
+                continue
+            except queue.Full:
+                pass
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                continue
+            if job is None:
+                pending += 1
+                continue
+            job.error = ServiceBusy("service is stopping")
+            self._release(job.client)
+            job.done.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def ready(self) -> bool:
+        return (not self._stopping and not self.jobs.full()
+                and len(self._threads) == self.workers and all(t.is_alive() for t in self._threads))
+
+    def _work(self) -> None:
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                job.result = job.fn(*job.args)
+            except Exception as e:
+                job.error = e
+            finally:
+                # 任务真正结束时才释放客户端的并发名额，超时返回的请求也计入
+                self._release(job.client)
+                job.done.set()
+
+    def _release(self, client: str) -> None:
+        with self._lock:
+            self._inflight[client] -= 1
+            if not self._inflight[client]:
+                del self._inflight[client]
+
+    def submit(self, client: str, fn: Callable, *args):
+        """
+        提交任务并等待结果。
+
+        Raises:
+            ServiceBusy: 队列已满或客户端并发数超过上限
+            TimeoutError: 等待超过 timeout
+        """
+        if self._stopping:
+            raise ServiceBusy("service is stopping")
+        with self._lock:
+            if self._inflight.get(client, 0) >= self.client_limit:
+                raise ServiceBusy(f"too many concurrent requests for client {client}")
+            self._inflight[client] = self._inflight.get(client, 0) + 1
+
+        job = _Job(fn, args, client)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self._release(client)
+            raise ServiceBusy("job queue is full")
+
+        if not job.done.wait(self.timeout):
+            raise TimeoutError("text2diff timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+
+class BadRequest(Exception):
+    """
+    请求格式错误，对应 HTTP 400。
+    """
+
+
+class UpstreamError(Exception):
+    """
+    大模型输出无法解析等上游错误，对应 HTTP 502。
+    """
+
+
+def _require(body: dict, key: str, kind: type):
+    value = body.get(key)
+    if not isinstance(value, kind):
+        raise BadRequest(f"'{key}' must be a {kind.__name__}")
+    return value
+
+
+def _replacements(body: dict) -> list:
+    items = _require(body, "replacements", list)
+    try:
+        return [(int(start), int(end), str(content)) for start, end, content in items]
+    except (TypeError, ValueError):
+        raise BadRequest("'replacements' must be a list of [start, end, content]")
+
+
+def _flag(body: dict, key: str, default: bool) -> bool:
+    value = body.get(key, default)
+    if not isinstance(value, bool):
+        raise BadRequest(f"'{key}' must be a bool")
+    return value
+
+
+def _text2diff(service: Text2DiffService, client: str, body: dict) -> dict:
+    # 提交前完成请求校验，任务中抛出的 ValueError 都来自大模型的输出
+    text = _require(body, "text", str)
+    revision = _require(body, "revision", str)
+    use_cache = _flag(body, "use_cache", True)
+    use_rules = _flag(body, "use_rules", True)
+    stats = {}
+    try:
+        replacements = service.submit(client, text2diff, text, revision, use_cache, None, use_rules, stats)
+    except ValueError as e:
+        raise UpstreamError(f"invalid LLM output: {e}") from e
+    return {"replacements": [list(r) for r in replacements], "stats": stats}
+
+
+def _apply(service: Text2DiffService, client: str, body: dict) -> dict:
+    return {"text": apply_diff(_require(body, "text", str), _replacements(body))}
+
+
+def _render(service: Text2DiffService, client: str, body: dict) -> dict:
+    text = _require(body, "text", str)
+    replacements = _replacements(body)
+    context = body.get("context")
+    if context is not None and (not isinstance(context, int) or isinstance(context, bool) or context < 0):
+        raise BadRequest("'context' must be a non-negative int")
+    by_lines = bool(body.get("by_lines", False))
+    fmt = body.get("format", "html")
+    if fmt == "html":
+        chunks = iter_html(text, replacements, context, by_lines, bool(body.get("escape", True)))
+    elif fmt == "md":
+        chunks = iter_md(text, replacements, context, by_lines)
+    else:
+        raise BadRequest("'format' must be 'html' or 'md'")
+    return {"output": "".join(chunks)}
+
+
+ROUTES = {
+    "/v1/text2diff": _text2diff,
+    "/v1/apply": _apply,
+    "/v1/render": _render,
+}
+
+
+class Text2DiffHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "text2diff"
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _client(self) -> str:
+        return self.headers.get("X-Client-Id") or self.client_address[0]
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/readyz":
+            ready = service.ready()
+            self._send_json(200 if ready else 503, {"ready": ready, "queued": service.jobs.qsize()})
+        elif self.path == "/metrics":
+            data = export_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        handler = ROUTES.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.max_body_bytes:
+            self.close_connection = True
+            self._send_json(413, {"error": "request body too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise BadRequest("request body must be a JSON object")
+            payload = handler(self.server.service, self._client(), body)
+        except (BadRequest, ValueError) as e:
+            # json.JSONDecodeError 和 apply_diff 的区间重叠都是 ValueError
+            self._send_json(400, {"error": str(e)})
+        except UpstreamError as e:
+            self._send_json(502, {"error": str(e)})
+        except ServiceBusy as e:
+            self._send_json(429, {"error": str(e)}, {"Retry-After": "1"})
+        except TimeoutError as e:
+            self._send_json(504, {"error": str(e)})
+        except Exception as e:
+            self._send_json(502, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send_json(200, payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000, service: Optional[Text2DiffService] = None,
+                max_body_bytes: int = 16 * 1024 * 1024, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    创建 HTTP 服务（不启动），service 未提供时使用默认参数创建并启动工作线程。
+    port 为 0 时由系统分配端口，实际端口见 server.server_address。
+    """
+    server = ThreadingHTTPServer((host, port), Text2DiffHandler)
+    server.daemon_threads = True
+    server.service = service or Text2DiffService().start()
+    server.max_body_bytes = max_body_bytes
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="text2diff HTTP service")
+    parser.add_argument("--host", default=os.getenv("TEXT2DIFF_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("TEXT2DIFF_SERVER_PORT", "8000")))
+    for name, (env, default) in ENV_DEFAULTS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(default), default=type(default)(os.getenv(env, default)))
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    service = Text2DiffService(args.workers, args.queue_size, args.client_limit, args.timeout).start()
+    server = make_server(args.host, args.port, service, args.max_body_bytes, args.verbose)
+    print(f"text2diff service listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
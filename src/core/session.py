@@ -0,0 +1,280 @@
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+import hashlib
+import sys
+import threading
+import time
+import uuid
+
+from src.core.document import Document
+from src.core.replacements import ReplacementSet
+
+
+class SnapshotPool:
+    """
+    按内容哈希去重的全文快照池，多个会话引用同一份文本时只保存一份，引用计数归零时释放。
+    """
+
+    def __init__(self):
+        self._texts = {}
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def acquire(self, text: str) -> str:
+        """
+        保存文本（已存在则只增加引用计数），返回内容哈希。
+        """
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        entry = self._texts.get(key)
+        if entry is None:
+            self._texts[key] = [text, 1]
+            self.bytes += sys.getsizeof(text)
+        else:
+            entry[1] += 1
+        return key
+
+    def release(self, key: str) -> None:
+        entry = self._texts[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._texts[key]
+            self.bytes -= sys.getsizeof(entry[0])
+
+    def get(self, key: str) -> str:
+        return self._texts[key][0]
+
+
+def _diff_bytes(replacements: ReplacementSet) -> int:
+    # 两个 8 字节整数列加内容字符串的近似占用
+    return 16 * len(replacements) + sum(sys.getsizeof(c) for c in replacements.contents)
+
+
+class Session:
+    """
+    一个文档的编辑历史。每个版本要么是快照（快照池中的哈希），要么是相对上一版本的替换列表。
+    current 指向当前版本，之后的版本用于重做，新的修改会丢弃它们。
+    """
+
+    def __init__(self, session_id: str, snapshot_key: str, now: float):
+        self.id = session_id
+        # 每个元素为 ("snapshot", 哈希) 或 ("diff", ReplacementSet)
+        self.versions: List[Tuple[str, Union[str, ReplacementSet]]] = [("snapshot", snapshot_key)]
+        self.current = 0
+        self.last_access = now
+        self.bytes = 0
+
+    @property
+    def can_undo(self) -> bool:
+        return self.current > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self.current < len(self.versions) - 1
+
+
+class SessionStore:
+    """
+    服务端的多轮编辑会话存储。
+
+    - 每个版本保存为基础快照 + 替换列表链，连续 snapshot_every 个替换版本后重新生成快照，限制重建文本的开销
+    - 快照按内容哈希在所有会话间去重
+    - 每个会话最多保留 max_history 个版本，超出时丢弃最早的版本
+    - 超过 ttl 秒未访问的会话过期；总内存超过 max_bytes 时按最近访问时间淘汰会话
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = 3600.0, snapshot_every: int = 8,
+                 max_history: int = 50, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.snapshot_every = snapshot_every
+        self.max_history = max_history
+        self.clock = clock
+        self.snapshots = SnapshotPool()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._diff_bytes = 0
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    @property
+    def bytes(self) -> int:
+        """
+        快照和替换列表的近似内存占用。
+        """
+        return self.snapshots.bytes + self._diff_bytes
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            self._expire()
+            return session_id in self._sessions
+
+    def create(self, text: str) -> str:
+        """
+        用初始文本创建会话，返回会话 ID。
+        """
+        with self._lock:
+            session_id = uuid.uuid4().hex
+            session = Session(session_id, self.snapshots.acquire(text), self.clock())
+            self._sessions[session_id] = session
+            self._evict(keep=session_id)
+            return session_id
+
+    def _get(self, session_id: str) -> Session:
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        session.last_access = self.clock()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _text_at(self, session: Session, version: int) -> str:
+        # 从最近的快照开始依次应用替换列表
+        base = version
+        while session.versions[base][0] != "snapshot":
+            base -= 1
+        text = self.snapshots.get(session.versions[base][1])
+        if base == version:
+            return text
+        doc = Document(text)
+        for _, replacements in session.versions[base + 1:version + 1]:
+            doc.apply(replacements)
+        return str(doc)
+
+    def text(self, session_id: str) -> str:
+        """
+        当前版本的全文。
+        """
+        with self._lock:
+            session = self._get(session_id)
+            return self._text_at(session, session.current)
+
+    def version(self, session_id: str) -> Tuple[int, bool, bool]:
+        """
+        返回 (当前版本号, 能否撤销, 能否重做)。
+        """
+        with self._lock:
+            session = self._get(session_id)
+            return session.current, session.can_undo, session.can_redo
+
+    def apply(self, session_id: str, replacements: Iterable[Tuple[int, int, str]]) -> str:
+        """
+        在当前版本上应用一轮修改，丢弃可重做的版本，返回新版本的全文。
+        """
+        with self._lock:
+            session = self._get(session_id)
+            replacements = replacements if isinstance(replacements, ReplacementSet) else ReplacementSet(replacements)
+            text = self._text_at(session, session.current)
+            self._truncate(session, session.current + 1)
+
+            since_snapshot = 0
+            for kind, _ in reversed(session.versions):
+                if kind == "snapshot":
+                    break
+                since_snapshot += 1
+
+            doc = Document(text).apply(replacements)
+            new_text = str(doc)
+            if since_snapshot + 1 >= self.snapshot_every:
+                self._append(session, ("snapshot", self.snapshots.acquire(new_text)))
+            else:
+                self._append(session, ("diff", replacements))
+            session.current = len(session.versions) - 1
+            self._trim(session)
+            self._evict(keep=session_id)
+            return new_text
+
+    def undo(self, session_id: str) -> str:
+        with self._lock:
+            session = self._get(session_id)
+            if session.can_undo:
+                session.current -= 1
+            return self._text_at(session, session.current)
+
+    def redo(self, session_id: str) -> str:
+        with self._lock:
+            session = self._get(session_id)
+            if session.can_redo:
+                session.current += 1
+            return self._text_at(session, session.current)
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._drop(session)
+
+    def _append(self, session: Session, version) -> None:
+        session.versions.append(version)
+        if version[0] == "diff":
+            size = _diff_bytes(version[1])
+            session.bytes += size
+            self._diff_bytes += size
+
+    def _release(self, session: Session, version) -> None:
+        kind, value = version
+        if kind == "snapshot":
+            self.snapshots.release(value)
+        else:
+            size = _diff_bytes(value)
+            session.bytes -= size
+            self._diff_bytes -= size
+
+    def _truncate(self, session: Session, end: int) -> None:
+        # 丢弃 end 之后（可重做）的版本
+        for version in session.versions[end:]:
+            self._release(session, version)
+        del session.versions[end:]
+
+    def _trim(self, session: Session) -> None:
+        # 版本数超出上限时丢弃最早的版本，新的第一个版本必须是快照
+        excess = len(session.versions) - self.max_history
+        if excess <= 0:
+            return
+        first = self._text_at(session, excess)
+        key = self.snapshots.acquire(first)
+        for version in session.versions[:excess + 1]:
+            self._release(session, version)
+        session.versions[:excess + 1] = [("snapshot", key)]
+        session.current -= excess
+
+    def _drop(self, session: Session) -> None:
+        for version in session.versions:
+            self._release(session, version)
+        session.versions = []
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        deadline = self.clock() - self.ttl
+        # OrderedDict 按最近访问排序，最旧的在前
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_access > deadline:
+                break
+            del self._sessions[session.id]
+            self._drop(session)
+            self.evictions += 1
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        self._expire()
+        for session_id in list(self._sessions):
+            if self.bytes <= self.max_bytes:
+                break
+            if session_id == keep:
+                continue
+            self._drop(self._sessions.pop(session_id))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "snapshots": len(self.snapshots),
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+            }
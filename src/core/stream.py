@@ -0,0 +1,204 @@
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+import json
+
+from src.core.diff import (
+    _cache_key,
+    _prepare,
+    _repair_call,
+    _repair_call_async,
+    cache_response,
+    get_llm_cache,
+    text2diff_llm_stream,
+    text2diff_llm_stream_async,
+)
+from src.core.index import SentenceIndex
+from src.core.metrics import incr, stage
+from src.core.repair import REPAIR_ATTEMPTS, repair_revisions, repair_revisions_async, validate_revisions
+
+
+class JsonArrayStreamParser:
+    """
+    增量 JSON 数组解析器：逐段喂入大模型的输出，每当数组中的一个对象完整时就把它解析出来。
+    数组外的内容（如 ```json 代码块标记）和对象之间的逗号会被忽略。
+    格式错误的对象会被跳过，传入 malformed 列表时其原文追加到其中。
+    """
+
+    def __init__(self, malformed: Optional[list] = None):
+        self.malformed = malformed
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[dict]:
+        """
+        喂入一段文本，返回这段文本中完成的对象。
+        """
+        objects = []
+        for ch in text:
+            if self._depth == 0:
+                # 对象外只关心对象的开始
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = "".join(self._buffer)
+                    self._buffer = []
+                    try:
+                        objects.append(json.loads(raw))
+                    except ValueError:
+                        # 单个对象出错不影响后续对象
+                        if self.malformed is not None:
+                            self.malformed.append(raw)
+        return objects
+
+
+def iter_json_objects(chunks: Iterable[str], malformed: Optional[list] = None) -> Iterator[dict]:
+    """
+    从文本片段流中逐个产出 JSON 数组里的对象，格式错误的对象追加到 malformed。
+    """
+    parser = JsonArrayStreamParser(malformed)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+async def aiter_json_objects(chunks, malformed: Optional[list] = None) -> AsyncIterator[dict]:
+    """
+    iter_json_objects 的异步版本。
+    """
+    parser = JsonArrayStreamParser(malformed)
+    async for chunk in chunks:
+        for obj in parser.feed(chunk):
+            yield obj
+
+
+def _lookup_cache(text_with_pos: str, revision_text: str, use_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+    # 与 text2diff_llm_cached 相同的缓存键和命中统计，返回 (key, 缓存的结果)，不使用缓存时 key 为 None
+    llm_cache = get_llm_cache()
+    if not use_cache or not llm_cache.enabled:
+        return None, None
+    key = _cache_key(llm_cache, text_with_pos, revision_text, None)
+    cached = llm_cache.get(key)
+    incr("cache_hits" if cached is not None else "cache_misses")
+    return key, cached
+
+
+def _resolve(index: SentenceIndex, revisions: list, failed: list) -> List[Tuple[int, int, str]]:
+    with stage("resolve"):
+        return index.resolve(revisions, failed)
+
+
+def text2diff_stream(origin_text: str, revision_text: str, use_cache: bool = True, use_rules: bool = True,
+                     repair_attempts: int = REPAIR_ATTEMPTS, stats: dict = None) -> Iterator[Tuple[int, int, str]]:
+    """
+    流式版本的 text2diff，大模型每输出一个完整的修改就立即定位并产出。
+    格式错误或缺少字段的修改被跳过，不会中断输出；无法定位或 sentence_start 无效的修改在输出结束后修复并最后产出。
+    各阶段耗时和缓存命中与 text2diff 一样记录到 METRICS。
+
+    Args:
+        origin_text (str): 原始文本
+        revision_text (str): 修改建议
+        use_cache (bool): 是否使用大模型结果缓存，命中时一次性产出全部修改
+        use_rules (bool): 是否先用规则处理能识别的指令，规则生成的修改最先产出
+        repair_attempts (int): 修复时最多请求大模型的次数，0 表示不修复
+        stats (dict): 可选，写入 repair_attempts / repaired / unrepaired
+
+    Yields:
+        Tuple[int, int, str]: (start, end, content)
+    """
+    index, revisions, text_with_pos, revision_text = _prepare(origin_text, revision_text, None, use_rules, None)
+
+    failed = []
+    accepted = []
+    for replacement in _resolve(index, revisions, failed):
+        accepted.append(replacement)
+        yield replacement
+    if text_with_pos is None:
+        return
+
+    key, cached = _lookup_cache(text_with_pos, revision_text, use_cache)
+    received = []
+
+    def chunks():
+        if cached is not None:
+            yield cached
+            return
+        for chunk in text2diff_llm_stream(text_with_pos, revision_text):
+            received.append(chunk)
+            yield chunk
+
+    malformed = []
+    for rev in iter_json_objects(chunks(), malformed):
+        for replacement in _resolve(index, validate_revisions([rev], failed), failed):
+            accepted.append(replacement)
+            yield replacement
+    if malformed:
+        incr("invalid_revisions", len(malformed))
+
+    if key and cached is None:
+        cache_response(key, "".join(received))
+
+    if failed:
+        with stage("repair"):
+            repaired = repair_revisions(index, failed, accepted, _repair_call, repair_attempts, stats)
+        yield from repaired
+
+
+async def text2diff_stream_async(origin_text: str, revision_text: str, use_cache: bool = True, use_rules: bool = True,
+                                 repair_attempts: int = REPAIR_ATTEMPTS, stats: dict = None) -> AsyncIterator[Tuple[int, int, str]]:
+    """
+    text2diff_stream 的异步版本。
+    """
+    index, revisions, text_with_pos, revision_text = _prepare(origin_text, revision_text, None, use_rules, None)
+
+    failed = []
+    accepted = []
+    for replacement in _resolve(index, revisions, failed):
+        accepted.append(replacement)
+        yield replacement
+    if text_with_pos is None:
+        return
+
+    key, cached = _lookup_cache(text_with_pos, revision_text, use_cache)
+    received = []
+
+    async def chunks():
+        if cached is not None:
+            yield cached
+            return
+        async for chunk in text2diff_llm_stream_async(text_with_pos, revision_text):
+            received.append(chunk)
+            yield chunk
+
+    malformed = []
+    async for rev in aiter_json_objects(chunks(), malformed):
+        for replacement in _resolve(index, validate_revisions([rev], failed), failed):
+            accepted.append(replacement)
+            yield replacement
+    if malformed:
+        incr("invalid_revisions", len(malformed))
+
+    if key and cached is None:
+        cache_response(key, "".join(received))
+
+    if failed:
+        with stage("repair"):
+            repaired = await repair_revisions_async(index, failed, accepted, _repair_call_async, repair_attempts, stats)
+        for replacement in repaired:
+            yield replacement
@@ -0,0 +1,416 @@
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+import re
+
+from src.core.diff import split_text_by_sentences, text2diff
+from src.core.dispatch import split_instructions
+from src.core.merge import merge_replacements
+from src.core.prompt import QUOTED_PATTERN
+
+# 只由空白组成的行
+BLANK_LINE = re.compile(r"^[ \t]*$")
+# 围栏代码块的开始行，结束行需要使用相同字符且长度不小于开始行
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+HEADING = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+|$)")
+LIST_ITEM = re.compile(r"^ {0,3}(?:[-*+]|\d{1,9}[.)])[ \t]+\S")
+TABLE_SEPARATOR = re.compile(r"^ {0,3}\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$")
+THEMATIC_BREAK = re.compile(r"^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+
+# 不发送给大模型的块
+EXCLUDED_KINDS = ("front_matter", "code")
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_EN_ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10, "last": -1,
+}
+
+# 序数："第3" "第十二"，或者 "最后一" "倒数第二"
+_ORDINAL = r"(?:第(\d+|[零一二两三四五六七八九十百]+)|(最后一|倒数第[\d一二三四五六七八九十]+))"
+_EN_UNITS = ("paragraph", "line", "sentence", "section")
+_EN_UNIT = r"(paragraph|line|sentence|section)"
+# 结构引用，按顺序尝试；替换后的指令中引用被改写为"本段"等，英文引用改写为 "this paragraph" 等
+REFERENCES = [
+    (re.compile(rf"{_ORDINAL}段(?:的|中的|里的)?{_ORDINAL}句"), "paragraph_sentence", "本句"),
+    (re.compile(rf"{_ORDINAL}段"), "paragraph", "本段"),
+    (re.compile(rf"{_ORDINAL}行"), "line", "本行"),
+    (re.compile(rf"{_ORDINAL}句"), "sentence", "本句"),
+    (re.compile(rf"{_ORDINAL}(?:节|章|个标题下)"), "section", "本节"),
+    (re.compile(r"[\"“]([^\"”]+)[\"”](?:一节|这一节|小节|章节|部分|标题下)"), "section_title", "本节"),
+    (re.compile(r"(?<![A-Za-z])(?:the\s+)?(?:(\d+)(?:st|nd|rd|th)|(first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|last))"
+                rf"\s+{_EN_UNIT}(?![A-Za-z])", re.I), "en_ordinal", None),
+    (re.compile(rf"(?<![A-Za-z]){_EN_UNIT}\s+(\d+)(?![\d])", re.I), "en_number", None),
+    (re.compile(r"(?<![A-Za-z])(?:the\s+)?(section|heading)\s+[\"“']([^\"”']+)[\"”']", re.I), "en_section_title", None),
+]
+
+
+def _parse_number(value: str) -> int:
+    """
+    解析阿拉伯数字、"十二"这样的中文数字以及"最后一""倒数第二"，倒数返回负数。
+    """
+    if value == "最后一":
+        return -1
+    if value.startswith("倒数第"):
+        return -_parse_number(value[3:])
+    if value.isdigit():
+        return int(value)
+    total, current = 0, 0
+    for ch in value:
+        if ch == "百":
+            total += (current or 1) * 100
+            current = 0
+        elif ch == "十":
+            total += (current or 1) * 10
+            current = 0
+        else:
+            current = _CN_DIGITS[ch]
+    return total + current
+
+
+class Block:
+    """
+    Markdown 文档中的一个块。
+
+    kind 为 front_matter / code / heading / paragraph / list_item / table / thematic_break，
+    [start, end) 为块的字符范围（不含最后一行的换行符），level 为标题级别，其他块为 0。
+    """
+    __slots__ = ("kind", "start", "end", "level")
+
+    def __init__(self, kind: str, start: int, end: int, level: int = 0):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.level = level
+
+    def __repr__(self) -> str:
+        return f"Block({self.kind!r}, {self.start}, {self.end}, {self.level})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Block) and (self.kind, self.start, self.end, self.level) == \
+            (other.kind, other.start, other.end, other.level)
+
+
+class StructureIndex:
+    """
+    Markdown 文档的结构索引：块（标题、段落、列表项、表格、代码块、front matter）、
+    章节层级、行和句子，全部带字符位置。
+
+    - 代码块和 front matter 不参与分句，sentences 可以直接传给 text2diff，提示词中不包含这些内容
+    - 表格每一行作为一个"句子"，不会在单元格中间被切开
+    - 行、段落、句子按序号 O(1) 查找，按位置查找块、行和所在章节均为二分查找
+    - line_paragraphs 为 True 时每个非空的正文行算一段（中文纯文本常见的写法），
+      默认在全文没有空行时自动启用
+    """
+
+    def __init__(self, text: str, line_paragraphs: Optional[bool] = None):
+        self.text = text
+        if line_paragraphs is None:
+            line_paragraphs = not re.search(r"\n[ \t]*\n", text)
+        self.line_paragraphs = line_paragraphs
+
+        # 每行的起始位置，最后追加一个哨兵 len(text) + 1，使第 i 行的结束位置为 line_starts[i + 1] - 1
+        self.line_starts = array("q", [0])
+        for match in re.finditer("\n", text):
+            self.line_starts.append(match.end())
+        self.line_starts.append(len(text) + 1)
+
+        self.blocks: List[Block] = []
+        self._parse()
+        self.block_starts = array("q", (b.start for b in self.blocks))
+        self.paragraphs = [i for i, b in enumerate(self.blocks) if b.kind == "paragraph"]
+        self.headings = [i for i, b in enumerate(self.blocks) if b.kind == "heading"]
+        self.heading_starts = array("q", (self.blocks[i].start for i in self.headings))
+        self.titles: Dict[str, List[int]] = {}
+        for k, i in enumerate(self.headings):
+            self.titles.setdefault(self.heading_title(i), []).append(k)
+        self.section_ends = self._section_ends()
+        self.sentences = self._sentences()
+        self.sentence_starts = array("q", (start for start, _ in self.sentences))
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_starts) - 1
+
+    def line_range(self, i: int) -> Tuple[int, int]:
+        """
+        第 i 行（从 0 开始）的范围，不含换行符。
+        """
+        return self.line_starts[i], self.line_starts[i + 1] - 1
+
+    def line_at(self, pos: int) -> int:
+        """
+        包含 pos 的行号（从 0 开始）。
+        """
+        return bisect_right(self.line_starts, pos) - 1
+
+    def _line(self, i: int) -> str:
+        start, end = self.line_range(i)
+        return self.text[start:end]
+
+    def _parse(self) -> None:
+        count = self.line_count
+        i = 0
+        # front matter 只能出现在文档开头
+        if count and self._line(0).rstrip() in ("---", "+++"):
+            marker = self._line(0).rstrip()
+            for j in range(1, count):
+                if self._line(j).rstrip() in (marker, "..."):
+                    self._add("front_matter", 0, j)
+                    i = j + 1
+                    break
+
+        while i < count:
+            line = self._line(i)
+            if BLANK_LINE.match(line):
+                i += 1
+                continue
+
+            fence = FENCE.match(line)
+            if fence:
+                marker = fence.group(1)
+                j = i + 1
+                while j < count and not re.match(rf"^ {{0,3}}{re.escape(marker[0])}{{{len(marker)},}}[ \t]*$", self._line(j)):
+                    j += 1
+                # 没有结束行的代码块延续到文末
+                self._add("code", i, min(j, count - 1))
+                i = j + 1
+                continue
+
+            heading = HEADING.match(line)
+            if heading:
+                self._add("heading", i, i, len(heading.group(1)))
+                i += 1
+                continue
+
+            if THEMATIC_BREAK.match(line):
+                self._add("thematic_break", i, i)
+                i += 1
+                continue
+
+            if "|" in line and i + 1 < count and TABLE_SEPARATOR.match(self._line(i + 1)) and "-" in self._line(i + 1):
+                j = i + 2
+                while j < count and "|" in self._line(j) and not BLANK_LINE.match(self._line(j)):
+                    j += 1
+                self._add("table", i, j - 1)
+                i = j
+                continue
+
+            if LIST_ITEM.match(line):
+                # 缩进的后续行属于同一个列表项
+                j = i + 1
+                while j < count:
+                    next_line = self._line(j)
+                    if BLANK_LINE.match(next_line) or LIST_ITEM.match(next_line) or not next_line[:1].isspace():
+                        break
+                    j += 1
+                self._add("list_item", i, j - 1)
+                i = j
+                continue
+
+            j = i + 1
+            if not self.line_paragraphs:
+                while j < count and not self._interrupts(self._line(j)):
+                    j += 1
+            self._add("paragraph", i, j - 1)
+            i = j
+
+    @staticmethod
+    def _interrupts(line: str) -> bool:
+        # 能够打断段落的行
+        return bool(BLANK_LINE.match(line) or FENCE.match(line) or HEADING.match(line)
+                    or LIST_ITEM.match(line) or THEMATIC_BREAK.match(line))
+
+    def _add(self, kind: str, first_line: int, last_line: int, level: int = 0) -> None:
+        self.blocks.append(Block(kind, self.line_starts[first_line], self.line_range(last_line)[1], level))
+
+    def _section_ends(self) -> array:
+        # 每个标题的章节延续到下一个级别不低于它的标题之前
+        ends = array("q", [len(self.text)] * len(self.headings))
+        stack = []
+        for k, i in enumerate(self.headings):
+            level = self.blocks[i].level
+            while stack and self.blocks[self.headings[stack[-1]]].level >= level:
+                ends[stack.pop()] = self.blocks[i].start
+            stack.append(k)
+        return ends
+
+    def _sentences(self) -> List[Tuple[int, str]]:
+        # 每个块的区域延续到下一个块之前（包含其间的空行），被排除的块不产生句子
+        sentences = []
+        for n, block in enumerate(self.blocks):
+            if block.kind in EXCLUDED_KINDS:
+                continue
+            end = self.blocks[n + 1].start if n + 1 < len(self.blocks) else len(self.text)
+            if block.kind == "table":
+                first, last = self.line_at(block.start), self.line_at(block.end)
+                for i in range(first, last + 1):
+                    row_end = end if i == last else self.line_starts[i + 1]
+                    sentences.append((self.line_starts[i], self.text[self.line_starts[i]:row_end]))
+                continue
+            for start, chunk in split_text_by_sentences(self.text[block.start:end]):
+                if chunk:
+                    sentences.append((block.start + start, chunk))
+        return sentences
+
+    def block_at(self, pos: int) -> Optional[Block]:
+        """
+        包含 pos 的块，pos 位于块之间的空行时返回 None。
+        """
+        i = bisect_right(self.block_starts, pos) - 1
+        if i >= 0 and pos < self.blocks[i].end:
+            return self.blocks[i]
+        return None
+
+    def heading_title(self, i: int) -> str:
+        block = self.blocks[i]
+        return self.text[block.start:block.end].strip().strip("#").strip()
+
+    def section_at(self, pos: int) -> Optional[Tuple[int, int]]:
+        """
+        包含 pos 的最内层章节（从标题开始）的范围。
+        """
+        k = bisect_right(self.heading_starts, pos) - 1
+        while k >= 0:
+            if pos < self.section_ends[k]:
+                return self.heading_starts[k], self.section_ends[k]
+            k -= 1
+        return None
+
+    @staticmethod
+    def _pick(items, n: int):
+        # n 从 1 开始，负数表示倒数，越界返回 None
+        if n == 0 or abs(n) > len(items):
+            return None
+        return items[n - 1] if n > 0 else items[n]
+
+    def paragraph(self, n: int) -> Optional[Tuple[int, int]]:
+        """
+        第 n 段的范围，n 从 1 开始，负数表示倒数。
+        """
+        i = self._pick(self.paragraphs, n)
+        return None if i is None else (self.blocks[i].start, self.blocks[i].end)
+
+    def line(self, n: int) -> Optional[Tuple[int, int]]:
+        """
+        第 n 行的范围，n 从 1 开始，负数表示倒数。
+        """
+        i = self._pick(range(self.line_count), n)
+        return None if i is None else self.line_range(i)
+
+    def sentence(self, n: int, within: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int]]:
+        """
+        第 n 个句子的范围（不含句末空白），within 给出时只在该范围内计数。
+        """
+        lo, hi = 0, len(self.sentences)
+        if within is not None:
+            lo = bisect_right(self.sentence_starts, within[0] - 1)
+            hi = bisect_right(self.sentence_starts, within[1] - 1)
+        i = self._pick(range(lo, hi), n)
+        if i is None:
+            return None
+        start, chunk = self.sentences[i]
+        return start, start + len(chunk.rstrip())
+
+    def section(self, n: int) -> Optional[Tuple[int, int]]:
+        """
+        第 n 个标题所在章节的范围（包含子章节）。
+        """
+        k = self._pick(range(len(self.headings)), n)
+        return None if k is None else (self.heading_starts[k], self.section_ends[k])
+
+    def section_by_title(self, title: str) -> Optional[Tuple[int, int]]:
+        """
+        标题为 title 的第一个章节的范围。
+        """
+        found = self.titles.get(title.strip())
+        return None if not found else (self.heading_starts[found[0]], self.section_ends[found[0]])
+
+    def resolve_reference(self, instruction: str) -> Optional[Tuple[int, int, str]]:
+        """
+        在本地解析指令中的结构引用（"第3段"、"第12行"、"第2段第1句"、"“安装”一节"、"paragraph 3" 等）。
+
+        Args:
+            instruction (str): 单条修改指令
+
+        Returns:
+            Optional[Tuple[int, int, str]]: (start, end, 改写后的指令)，引用被改写为"本段"等；
+                没有结构引用或引用越界时返回 None
+        """
+        # 引号里是要修改的原文（如 把"第二行"改成"第三行"），其中的"第二行"不是结构引用
+        quoted = [(m.start() + 1, m.end() - 1) for m in QUOTED_PATTERN.finditer(instruction)]
+        for pattern, kind, replacement in REFERENCES:
+            match = next((m for m in pattern.finditer(instruction)
+                          if not any(start <= m.start() < end or start < m.end() <= end for start, end in quoted)), None)
+            if not match:
+                continue
+            target = self._resolve_match(kind, match)
+            if target is None:
+                return None
+            if replacement is None:
+                unit = next(g.lower() for g in match.groups() if g and g.lower() in _EN_UNITS + ("heading",))
+                replacement = "this " + ("section" if unit == "heading" else unit)
+            rewritten = instruction[:match.start()] + replacement + instruction[match.end():]
+            return target[0], target[1], rewritten
+        return None
+
+    def _resolve_match(self, kind: str, match: re.Match) -> Optional[Tuple[int, int]]:
+        groups = [g for g in match.groups() if g is not None]
+        if kind == "paragraph_sentence":
+            paragraph = self.paragraph(_parse_number(groups[0]))
+            return None if paragraph is None else self.sentence(_parse_number(groups[1]), paragraph)
+        if kind in ("paragraph", "line", "sentence", "section"):
+            return getattr(self, kind)(_parse_number(groups[0]))
+        if kind == "section_title":
+            return self.section_by_title(groups[0])
+        if kind == "en_section_title":
+            return self.section_by_title(groups[1])
+        if kind == "en_ordinal":
+            value, unit = groups[0].lower(), groups[1].lower()
+            n = int(value) if value.isdigit() else _EN_ORDINALS[value]
+            return getattr(self, unit)(n)
+        unit, value = groups[0].lower(), groups[1]
+        return getattr(self, unit)(int(value))
+
+
+def text2diff_structured(origin_text: str, revision_text: str, use_cache: bool = True, use_rules: bool = True,
+                         index: Optional[StructureIndex] = None, conflicts: Optional[list] = None,
+                         stats: dict = None) -> List[Tuple[int, int, str]]:
+    """
+    结构感知的 text2diff：带有结构引用的指令（"第3段"、"第12行"、"“安装”一节"等）在本地定位，
+    只把目标块发送给大模型；其余指令发送全文，但不包含代码块和 front matter。
+
+    Args:
+        origin_text (str): 原始文本（Markdown 或纯文本）
+        revision_text (str): 修改建议
+        use_cache (bool): 是否使用大模型结果缓存
+        use_rules (bool): 是否先用规则处理能识别的指令
+        index (StructureIndex): 可选，预先构建好的结构索引
+        conflicts (Optional[list]): 传入时追加相互重叠而被丢弃的替换，格式见 merge_replacements
+        stats (dict): 可选，写入 scoped_instructions / global_instructions
+
+    Returns:
+        List[Tuple[int, int, str]]: 按 (start, end) 升序排列、互不重叠的替换列表
+    """
+    if index is None:
+        index = StructureIndex(origin_text)
+    groups = []
+    rest = []
+    for instruction in split_instructions(revision_text):
+        target = index.resolve_reference(instruction)
+        if target is None:
+            rest.append(instruction)
+            continue
+        start, end, rewritten = target
+        replacements = text2diff(origin_text[start:end], rewritten, use_cache, None, use_rules)
+        groups.append([(s + start, e + start, content) for s, e, content in replacements])
+    if rest:
+        groups.append(text2diff(origin_text, "\n".join(rest), use_cache, index.sentences, use_rules))
+    if stats is not None:
+        stats["scoped_instructions"] = len(groups) - (1 if rest else 0)
+        stats["global_instructions"] = len(rest)
+
+    merged, found = merge_replacements(groups)
+    if conflicts is not None:
+        conflicts.extend(found)
+    return merged
@@ -0,0 +1,30 @@
+import pytest
+from src.core import diff
+from src.core.metrics import METRICS
+from src.core.providers import StubProvider, register_provider, use_provider
+
+
+@pytest.fixture
+def use_stub():
+    """
+    注册并启用测试用的后端，测试结束后恢复默认后端，并丢弃这些后端的模型对应的结果缓存。
+
+    返回 install(provider=None, responder=None, response=None, model="stub", name="test-stub")：
+    未传入 provider 时用 responder 或固定的 response 构造 StubProvider，返回启用的后端。
+    """
+    METRICS.reset()
+    models = []
+
+    def install(provider=None, responder=None, response=None, model="stub", name="test-stub"):
+        if provider is None:
+            provider = StubProvider(model=model, settings={"response": response} if response is not None else None,
+                                    responder=responder)
+        register_provider(name, provider)
+        use_provider(name)
+        models.append(provider.model)
+        return provider
+
+    yield install
+    use_provider(None)
+    for model in models:
+        diff._llm_caches.pop(model, None)
@@ -0,0 +1,15 @@
+def random_replacements(rng, length, count, alphabet="甲乙丙xyz", max_content=4, insert_rate=0.0):
+    """
+    生成互不重叠、顺序打乱的随机替换列表。
+    文本太短时替换数少于 count；insert_rate 为把替换变成纯插入（start == end）的概率。
+    """
+    points = sorted(rng.sample(range(length + 1), min(count * 2, length + 1)))
+    replacements = []
+    for i in range(0, len(points) - 1, 2):
+        start, end = points[i], points[i + 1]
+        if rng.random() < insert_rate:
+            end = start
+        content = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_content)))
+        replacements.append((start, end, content))
+    rng.shuffle(replacements)
+    return replacements
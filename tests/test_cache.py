@@ -0,0 +1,50 @@
+from src.core.cache import DiffCache
+
+
+def make_cache(tmp_path, model_name="model-a", **kwargs):
+    return DiffCache(cache_dir=str(tmp_path), model_name=model_name, prompt_version=1, **kwargs)
+
+
+def test_key_depends_on_model_and_inputs(tmp_path):
+    a = make_cache(tmp_path, "model-a")
+    b = make_cache(tmp_path, "model-b")
+    assert a.key("‖start:0‖原文", "修改") == a.key("‖start:0‖原文", "修改")
+    assert a.key("‖start:0‖原文", "修改") != b.key("‖start:0‖原文", "修改")
+    assert a.key("‖start:0‖原文", "修改") != a.key("‖start:0‖原文", "修改2")
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key("原文", "修改")
+    assert cache.get(key) is None
+    cache.set(key, "[]")
+    assert cache.get(key) == "[]"
+    assert cache.stats()["memory_hits"] == 1
+
+    # 另一个实例（模拟另一个进程）从磁盘读取
+    other = make_cache(tmp_path)
+    assert other.get(key) == "[]"
+    assert other.stats() == {"hits": 1, "misses": 0, "memory_hits": 0, "disk_hits": 1, "evictions": 0}
+    assert cache.stats()["misses"] == 1
+
+
+def test_eviction_keeps_size_under_limit(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1000, memory_items=2)
+    keys = [cache.key(str(i), "修改") for i in range(20)]
+    for key in keys:
+        cache.set(key, "x" * 100)
+
+    assert cache._disk_usage() <= 1000
+    assert cache.stats()["evictions"] > 0
+
+
+def test_invalidate(tmp_path):
+    a = make_cache(tmp_path, "model-a")
+    b = make_cache(tmp_path, "model-b")
+    key_a, key_b = a.key("原文", "修改"), b.key("原文", "修改")
+    a.set(key_a, "[]")
+    b.set(key_b, "[]")
+
+    a.invalidate()
+    assert a.get(key_a) is None
+    assert b.get(key_b) == "[]"
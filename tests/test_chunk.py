@@ -0,0 +1,71 @@
+import json
+import re
+
+import pytest
+from src.core import diff
+from src.core.chunk import estimate_tokens, split_windows, text2diff_chunked
+from src.core.diff import split_text_by_sentences
+
+
+def fake_text2diff_llm(text_with_pos, revision_text):
+    """按 把"X"改成"Y" 指令在带位置标记的文本中定位，模拟大模型输出。"""
+    items = []
+    for original, content in re.findall(r'把"(.+?)"改成"(.+?)"', revision_text):
+        for match in re.finditer(r"‖start:(\d+)‖([^‖]*)", text_with_pos):
+            if original in match.group(2):
+                items.append({"sentence_start": int(match.group(1)), "original": original, "content": content})
+    return json.dumps(items, ensure_ascii=False)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("中文") == 2
+    assert estimate_tokens("abcdefgh") == 2
+
+
+@pytest.mark.parametrize("max_tokens, overlap", [(5, 0), (5, 1), (12, 2), (1000, 1)])
+def test_split_windows_covers_all_sentences(max_tokens, overlap):
+    sentences = split_text_by_sentences("第一句。第二句。第三句。第四句。第五句。")
+    windows = split_windows(sentences, max_tokens=max_tokens, overlap=overlap)
+
+    # 所有句子都被覆盖，且窗口内句子连续
+    covered = {s for window in windows for s in window}
+    assert covered == set(sentences)
+    for window in windows:
+        starts = [start for start, _ in window]
+        assert starts == sorted(starts)
+
+
+def test_text2diff_chunked(monkeypatch):
+    monkeypatch.setattr(diff, "text2diff_llm", fake_text2diff_llm)
+    text = "".join(f"这是第{i}句话。" for i in range(50)) + "目标词在这里。"
+    replacements = text2diff_chunked(text, '把"目标词"改成"新词"', max_tokens=20, overlap=1, use_cache=False)
+
+    start = text.find("目标词")
+    assert replacements == [(start, start + 3, "新词")]
+
+
+def test_text2diff_chunked_dedup_overlap(monkeypatch):
+    monkeypatch.setattr(diff, "text2diff_llm", fake_text2diff_llm)
+    text = "甲句。乙句有关键词。丙句。丁句。"
+    replacements = text2diff_chunked(text, '把"关键词"改成"替换词"', max_tokens=12, overlap=1, use_cache=False)
+
+    start = text.find("关键词")
+    assert replacements == [(start, start + 3, "替换词")]
+
+
+def test_text2diff_chunked_keeps_other_windows(monkeypatch):
+    def flaky(text_with_pos, revision_text, prompt_fn=None):
+        # 一个窗口的输出无法解析，不影响其他窗口
+        if "坏窗口" in text_with_pos:
+            return "抱歉，我无法完成"
+        return fake_text2diff_llm(text_with_pos, revision_text)
+
+    monkeypatch.setattr(diff, "text2diff_llm", flaky)
+    text = "甲目标词。坏窗口目标词。乙目标词。"
+    stats = {}
+    replacements = text2diff_chunked(text, '把"目标词"改成"新词"', max_tokens=5, overlap=0, use_cache=False, stats=stats)
+
+    assert [text[start:end] for start, end, _ in replacements] == ["目标词", "目标词"]
+    assert replacements[1][0] == text.index("乙目标词") + 1
+    assert stats["failed_windows"] == 1
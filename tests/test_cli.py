@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+
+import pytest
+from src.core.cli import RateLimiter, iter_jobs, main, prepare_job
+from src.core.diff import get_llm_cache
+from src.core.repair import text2diff_repair_prompt
+
+DOCS = {
+    "a.txt": "改变我们的世界。带来了一些挑战。",
+    "b.txt": "我们需要确保AI的使用是负责任的。",
+    "c.txt": "专家们认为，AI应该服务于人类。",
+}
+
+
+def respond_with_first_word(system, user):
+    # 把原文中出现的"我们"或"AI"改为大写标记
+    text = user.split("原文：\n", 1)[1]
+    for original in ("我们", "AI"):
+        pos = text.find(original)
+        if pos != -1:
+            return json.dumps([{"sentence_start": 0, "original": original, "content": f"[{original}]"}],
+                              ensure_ascii=False)
+    return "[]"
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    for name, text in DOCS.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    jobs = [
+        {"id": "a", "path": "a.txt", "instruction": "修改一下"},
+        {"path": "b.txt", "instruction": "修改一下"},
+        # 规则能处理，不调用大模型
+        {"id": "c", "path": "c.txt", "instruction": '删除"，"'},
+    ]
+    (tmp_path / "jobs.jsonl").write_text("\n".join(json.dumps(j, ensure_ascii=False) for j in jobs) + "\n",
+                                         encoding="utf-8")
+    return tmp_path
+
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_iter_jobs(workspace):
+    jobs = list(iter_jobs(str(workspace)))
+    assert [job["id"] for job in jobs] == ["a", "jobs.jsonl:2", "c"]
+    assert jobs[0]["path"] == str(workspace / "a.txt")
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_bulk_run(workspace, workers, use_stub):
+    provider = use_stub(responder=respond_with_first_word, name="test-cli")
+    output = workspace / "results.jsonl"
+    code = main([str(workspace / "jobs.jsonl"), "-o", str(output), "--output-dir", str(workspace / "out"),
+                 "--render", "html", "--workers", str(workers), "--provider", "test-cli", "--no-cache"])
+    assert code == 0
+    assert provider.calls == 2
+
+    results = {r["id"]: r for r in read_results(output)}
+    assert results["a"]["replacements"] == [[2, 4, "[我们]"]]
+    assert (workspace / "out" / "a.txt").read_text(encoding="utf-8") == "改变[我们]的世界。带来了一些挑战。"
+    assert "color:green" in (workspace / "out" / "a.html").read_text(encoding="utf-8")
+    assert results["c"]["replacements"] == [[5, 6, ""]]
+    assert results["c"]["stats"]["hit_rate"] == 1.0
+
+
+def test_resume_after_failure(workspace, use_stub):
+    output = workspace / "results.jsonl"
+    args = [str(workspace / "jobs.jsonl"), "-o", str(output), "--workers", "0", "--provider", "test-cli", "--no-cache"]
+
+    def flaky(system, user):
+        if "负责任" in user:
+            raise ConnectionError("network down")
+        return respond_with_first_word(system, user)
+
+    use_stub(responder=flaky, name="test-cli")
+    assert main(args) == 1
+    results = {r["id"]: r for r in read_results(output)}
+    assert "ConnectionError" in results["jobs.jsonl:2"]["error"]
+
+    # 再次运行只重试失败的任务
+    provider = use_stub(responder=respond_with_first_word, name="test-cli")
+    assert main(args) == 0
+    assert provider.calls == 1
+    results = read_results(output)
+    assert sorted(r["id"] for r in results if "error" not in r) == ["a", "c", "jobs.jsonl:2"]
+
+
+def test_checkpoint_reuses_paid_calls(workspace, use_stub):
+    output = workspace / "results.jsonl"
+    args = [str(workspace / "jobs.jsonl"), "-o", str(output), "--workers", "0", "--provider", "test-cli", "--no-cache"]
+    use_stub(responder=respond_with_first_word, name="test-cli")
+    assert main(args) == 0
+
+    # 模拟写结果时崩溃：结果文件只剩一行和一行不完整的内容，检查点完整
+    lines = output.read_text(encoding="utf-8").splitlines()
+    output.write_text(lines[0] + "\n" + lines[1][:10], encoding="utf-8")
+    provider = use_stub(responder=respond_with_first_word, name="test-cli")
+    assert main(args) == 0
+    assert provider.calls == 0
+    results = read_results(output)
+    assert sorted(r["id"] for r in results) == ["a", "c", "jobs.jsonl:2"]
+
+
+def test_unparseable_response_is_not_checkpointed(workspace, use_stub):
+    output = workspace / "results.jsonl"
+    args = [str(workspace / "jobs.jsonl"), "-o", str(output), "--workers", "0", "--provider", "test-cli", "--no-cache"]
+
+    def garbage(system, user):
+        return "garbage" if "负责任" in user else respond_with_first_word(system, user)
+
+    use_stub(responder=garbage, name="test-cli")
+    assert main(args) == 1
+    # 旧版本写入检查点的错误输出也不会被重放
+    prepared = prepare_job({"path": str(workspace / "b.txt"), "instruction": "修改一下"}, True)
+    key = get_llm_cache().key(prepared["text_with_pos"], prepared["leftover"])
+    with open(str(output) + ".ckpt", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "jobs.jsonl:2", "key": key, "response": "garbage"}) + "\n")
+
+    provider = use_stub(responder=respond_with_first_word, name="test-cli")
+    assert main(args) == 0
+    assert provider.calls == 1
+    results = {r["id"]: r for r in read_results(output) if "error" not in r}
+    assert results["jobs.jsonl:2"]["replacements"] == [[0, 2, "[我们]"]]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_unlocated_revisions_are_repaired(workspace, workers, use_stub):
+    output = workspace / "results.jsonl"
+    args = [str(workspace / "jobs.jsonl"), "-o", str(output), "--workers", str(workers), "--provider", "test-cli",
+            "--no-cache"]
+
+    def misquote(system, user):
+        # 首次调用给出原文中不存在的 original，修复请求给出正确的
+        if system == text2diff_repair_prompt.__doc__:
+            return respond_with_first_word(system, "原文：\n" + user)
+        if "负责任" in user:
+            return json.dumps([{"sentence_start": 0, "original": "我门", "content": "[我们]"}], ensure_ascii=False)
+        return respond_with_first_word(system, user)
+
+    provider = use_stub(responder=misquote, name="test-cli")
+    assert main(args) == 0
+    assert provider.calls == 3
+    results = {r["id"]: r for r in read_results(output)}
+    assert results["jobs.jsonl:2"]["replacements"] == [[0, 2, "[我们]"]]
+    assert results["jobs.jsonl:2"]["unresolved"] == 0
+    assert results["jobs.jsonl:2"]["stats"]["repaired"] == 1
+
+    # 不修复时保留为无法定位
+    output.unlink()
+    use_stub(responder=misquote, name="test-cli")
+    assert main(args + ["--repair-attempts", "0"]) == 0
+    results = {r["id"]: r for r in read_results(output)}
+    assert results["jobs.jsonl:2"]["replacements"] == []
+    assert results["jobs.jsonl:2"]["unresolved"] == 1
+
+
+def test_rate_limiter():
+    async def run():
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    # 5 次请求至少间隔 4 个 1/50 秒
+    assert asyncio.run(run()) >= 0.075
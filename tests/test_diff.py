@@ -1,5 +1,11 @@
+import asyncio
+import io
+import json
+import time
+
 import pytest
-from src.core.diff import split_text_by_sentences, text2diff, apply_diff
+from src.core import diff
+from src.core.diff import split_text_by_sentences, iter_sentences, text2diff, text2diff_async, apply_diff
 
 # 测试用例数据
 TEST_CASES_SPLIT = [
@@ -57,6 +63,37 @@ def test_split_text_by_sentences(input_text, expected):
     reconstructed_text = ''.join([chunk for _, chunk in result])
     assert reconstructed_text == input_text, f"重新拼接不匹配：\n原文: {input_text}\n拼接: {reconstructed_text}"
 
+@pytest.mark.parametrize("input_text, expected", TEST_CASES_SPLIT)
+@pytest.mark.parametrize("buffer_size", [1, 2, 5, 4096])
+def test_iter_sentences(input_text, expected, buffer_size):
+    # 句子跨越缓冲区边界时，输出仍与 split_text_by_sentences 一致
+    assert list(iter_sentences(io.StringIO(input_text), buffer_size)) == expected
+
+
+def test_iter_sentences_max_len():
+    text = "x" * 25 + "。短句。"
+    result = list(iter_sentences(iter([text[:7], text[7:]]), buffer_size=7, max_sentence_len=10))
+    assert result == [(0, "x" * 10), (10, "x" * 10), (20, "xxxxx。"), (26, "短句。")]
+
+
+@pytest.mark.parametrize("text", ["Hi. 'a.' b!?. 。c", "ab!!!!!!!c. d", ".'..' . 。a。b. 。b", "x" * 30])
+@pytest.mark.parametrize("buffer_size", [1, 3, 64])
+def test_iter_sentences_max_len_matches_split(text, buffer_size):
+    # 设置最大长度时，结果等于把整句分句的结果按最大长度切开，与缓冲区大小无关
+    expected = [(start + i, chunk[i:i + 3]) for start, chunk in split_text_by_sentences(text)
+                for i in range(0, len(chunk), 3)]
+    assert list(iter_sentences(text, buffer_size, max_sentence_len=3)) == expected
+
+
+@pytest.mark.parametrize("max_sentence_len", [None, 1000])
+def test_iter_sentences_dotted_text_is_linear(max_sentence_len):
+    # 日志、代码中大量不构成句末的句点不会让分句退化成平方复杂度
+    text = "a.b_" * 50_000
+    start = time.perf_counter()
+    result = list(iter_sentences(text, 1024, max_sentence_len))
+    assert time.perf_counter() - start < 1.0
+    assert "".join(chunk for _, chunk in result) == text
+
 TEST_CASES_DIFF = [
     (
         # 输入原文
@@ -93,6 +130,23 @@ def test_text2diff_and_apply_diff(text, instructions, expected_replacements, exp
     revision = apply_diff(text, replacements)
     assert revision == expected_revision
 
+def test_text2diff_async(use_stub):
+    text = "这是第一句。这是第二个句子。"
+    calls = []
+
+    def responder(system, user):
+        calls.append((system, user))
+        return json.dumps([{"sentence_start": 6, "original": "第二个", "content": "第三个"}], ensure_ascii=False)
+
+    use_stub(responder=responder)
+    replacements = asyncio.run(text2diff_async(text, '把"第二个"改为"第三个"', use_cache=False, use_rules=False))
+    assert replacements == [(8, 11, "第三个")]
+
+    # 系统提示词与同步版本一致，用户提示词包含位置标记
+    system, user = calls[0]
+    assert system == diff.text2diff_prompt.__doc__
+    assert "‖start:6‖" in user
+
 # 添加单独运行的功能
 if __name__ == "__main__":
     # 运行所有测试
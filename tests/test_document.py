@@ -0,0 +1,52 @@
+import random
+
+import pytest
+from src.core.diff import apply_diff, diff2html, diff2md
+from src.core.document import Document
+
+from helpers import random_replacements
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_document_matches_string_apply(seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice("这是一段测试文本abc。") for _ in range(200))
+    doc = Document(text)
+
+    # 多轮修改，每轮都基于上一轮的结果
+    for _ in range(5):
+        replacements = random_replacements(rng, len(text), 10)
+        text = apply_diff(text, replacements)
+        assert apply_diff(doc, replacements) is doc
+        assert str(doc) == text
+        assert len(doc) == len(text)
+
+    assert doc.version == 5
+
+
+def test_document_insert_delete():
+    doc = Document("AI正在改变我们的世界。")
+    doc.splice(6, 9, "大家的")
+    doc.splice(0, 0, "如今，")
+    doc.splice(len(doc) - 1, len(doc), "")
+    assert doc.text == "如今，AI正在改变大家的世界"
+
+
+def test_map_offset():
+    doc = Document("0123456789")
+    doc.apply([(2, 4, "ab"), (6, 6, "xyz")])  # 01ab45xyz6789
+    doc.splice(0, 1, "")                      # 1ab45xyz6789
+
+    assert doc.map_offset(0) == 0
+    assert doc.map_offset(5) == 4
+    assert doc.map_offset(6) == 8
+    assert doc.map_offset(9) == 11
+    assert doc.map_offset(6, from_version=1) == 5
+    assert doc.text[doc.map_offset(7)] == "7"
+
+
+def test_renderers_accept_document():
+    text = "AI正在改变我们的世界。"
+    replacements = [(6, 9, "大家的")]
+    assert diff2md(Document(text), replacements) == diff2md(text, replacements)
+    assert diff2html(Document(text), replacements) == diff2html(text, replacements)
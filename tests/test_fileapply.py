@@ -0,0 +1,70 @@
+import os
+import random
+import stat
+
+import pytest
+from src.core.diff import apply_diff
+from src.core.fileapply import CodePointIndex, apply_diff_file
+from src.core.replacements import ReplacementSet
+
+TEXT = "AI正在深刻改变我们的世界。😀 Emoji and ASCII mixed.\n第二行，带来了一些挑战。"
+
+
+def test_code_point_index():
+    data = TEXT.encode("utf-8")
+    # 很小的块确保检查点落在多字节字符附近
+    index = CodePointIndex(data, block_size=3)
+    assert len(index) == len(TEXT)
+    for pos in range(len(TEXT) + 1):
+        assert index.byte_offset(pos) == len(TEXT[:pos].encode("utf-8"))
+    with pytest.raises(ValueError):
+        index.byte_offset(len(TEXT) + 1)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_apply_diff_file_matches_apply_diff(tmp_path, seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice("ab中文😀\n ") for _ in range(3000))
+    points = sorted(rng.sample(range(len(text) + 1), 40))
+    replacements = [(points[k], points[k + 1], rng.choice(["", "新", "é😀"])) for k in range(0, 40, 2)]
+
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+    src.write_text(text, encoding="utf-8")
+    written = apply_diff_file(str(src), str(dst), replacements, block_size=64)
+
+    expected = apply_diff(text, replacements)
+    assert dst.read_text(encoding="utf-8") == expected
+    assert written == len(expected.encode("utf-8"))
+
+
+def test_apply_diff_file_in_place_and_empty(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text(TEXT, encoding="utf-8")
+    apply_diff_file(str(path), str(path), ReplacementSet([(8, 11, "大家的")]))
+    assert path.read_text(encoding="utf-8") == TEXT.replace("我们的", "大家的")
+
+    empty = tmp_path / "empty.txt"
+    empty.write_text("", encoding="utf-8")
+    apply_diff_file(str(empty), str(tmp_path / "out.txt"), [(0, 0, "开头")])
+    assert (tmp_path / "out.txt").read_text(encoding="utf-8") == "开头"
+
+    # 位置越界时不留下输出文件和临时文件
+    with pytest.raises(ValueError):
+        apply_diff_file(str(path), str(tmp_path / "bad.txt"), [(0, 10 ** 6, "")])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["doc.txt", "empty.txt", "out.txt"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file modes")
+def test_apply_diff_file_keeps_permissions(tmp_path):
+    src = tmp_path / "doc.txt"
+    src.write_text(TEXT, encoding="utf-8")
+    src.chmod(0o644)
+    # 输出文件不存在时沿用原文件的权限
+    apply_diff_file(str(src), str(tmp_path / "new.txt"), [(0, 2, "")])
+    assert stat.S_IMODE((tmp_path / "new.txt").stat().st_mode) == 0o644
+
+    # 覆盖已有文件时保留其权限
+    src.chmod(0o755)
+    apply_diff_file(str(src), str(src), [(0, 2, "")])
+    assert stat.S_IMODE(src.stat().st_mode) == 0o755
@@ -0,0 +1,51 @@
+import pytest
+from src.core.diff import exact_revision, split_text_by_sentences
+from src.core.index import SentenceIndex
+
+TEXT = "第一句有目标。第二句普通。第三句普通。第四句普通。第五句也有目标。"
+
+
+def make_index(text, radius=1):
+    return SentenceIndex(text, split_text_by_sentences(text), radius=radius)
+
+
+def test_locate():
+    index = make_index(TEXT)
+    assert len(index) == 5
+    assert index.locate(0) == 0
+    assert index.locate(6) == 0
+    assert index.locate(7) == 1
+    assert index.locate(len(TEXT)) == 4
+
+
+@pytest.mark.parametrize("sentence_start, expected", [
+    # 准确的位置标记
+    (0, TEXT.find("目标")),
+    (26, TEXT.rfind("目标")),
+    # 位置标记落在目标之后，但仍在相邻句子内
+    (7, TEXT.find("目标")),
+    # 位置标记偏差过大，不再匹配远处的同名文本
+    (14, -1),
+])
+def test_find_bounded(sentence_start, expected):
+    assert make_index(TEXT).find("目标", sentence_start) == expected
+
+
+def test_find_spanning_sentences():
+    index = make_index(TEXT)
+    original = "普通。第四句"
+    assert index.find(original, 7) == TEXT.find(original)
+
+
+def test_exact_revision_bulk():
+    revisions = [
+        {"sentence_start": 0, "original": "目标", "content": "终点"},
+        {"sentence_start": 26, "original": "目标", "content": "终点"},
+        {"sentence_start": 14, "original": "不存在", "content": "x"},
+    ]
+    index = make_index(TEXT)
+    assert exact_revision(TEXT, revisions) == exact_revision(TEXT, revisions, index)
+    assert index.resolve(revisions) == [
+        (TEXT.find("目标"), TEXT.find("目标") + 2, "终点"),
+        (TEXT.rfind("目标"), TEXT.rfind("目标") + 2, "终点"),
+    ]
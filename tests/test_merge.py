@@ -0,0 +1,83 @@
+import json
+import random
+import re
+
+import pytest
+from src.core import diff
+from src.core.diff import apply_diff, diff2html
+from src.core.dispatch import split_instructions, text2diff_parallel
+from src.core.merge import IntervalTree, check_overlaps, merge_replacements
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_interval_tree_matches_brute_force(seed):
+    rng = random.Random(seed)
+    intervals = []
+    tree = IntervalTree()
+    for i in range(200):
+        start = rng.randint(0, 500)
+        end = start + rng.randint(0, 20)
+        intervals.append((start, end, i))
+        tree.add(start, end, i)
+
+    assert len(tree) == 200
+    assert [x[:2] for x in tree] == sorted(x[:2] for x in intervals)
+    for _ in range(100):
+        start = rng.randint(0, 520)
+        end = start + rng.randint(0, 30)
+        expected = sorted((s, e, v) for s, e, v in intervals if s < end and start < e)
+        assert sorted(tree.overlap(start, end)) == expected
+
+
+def test_merge_replacements_conflicts():
+    groups = [
+        [(0, 5, "a"), (10, 10, "x")],
+        [(0, 5, "a"), (3, 8, "b"), (20, 22, "c")],
+        [(10, 10, "y"), (5, 6, "d")],
+    ]
+    merged, conflicts = merge_replacements(groups)
+    assert merged == [(0, 5, "a"), (5, 6, "d"), (10, 10, "x"), (20, 22, "c")]
+    assert [(c["replacement"], c["group"]) for c in conflicts] == [((3, 8, "b"), 1), ((10, 10, "y"), 2)]
+    assert conflicts[0]["conflicts_with"] == [((0, 5, "a"), 0)]
+
+
+def test_overlapping_replacements_are_rejected():
+    with pytest.raises(ValueError):
+        check_overlaps([(0, 5, "a"), (3, 8, "b")])
+    with pytest.raises(ValueError):
+        apply_diff("0123456789", [(3, 8, "b"), (0, 5, "a")])
+    with pytest.raises(ValueError):
+        diff2html("0123456789", [(0, 5, "a"), (2, 2, "b")])
+    # 相邻区间和区间端点上的插入不算重叠
+    assert apply_diff("0123456789", [(0, 5, "a"), (5, 5, "+"), (5, 6, "b")]) == "a+b6789"
+
+
+def test_split_instructions():
+    text = """
+    1. 把"我们的"改成"大家的"
+    2. 润色下面这段：
+       要求更正式
+    3) 删除"一些"
+    """
+    assert split_instructions(text) == ['1. 把"我们的"改成"大家的"', "2. 润色下面这段：\n要求更正式", '3) 删除"一些"']
+    assert split_instructions("第一条\n\n第二条") == ["第一条", "第二条"]
+
+
+def test_text2diff_parallel(monkeypatch):
+    text = "改变我们的世界。带来了一些挑战。"
+    calls = []
+
+    def fake_text2diff_llm(text_with_pos, revision_text):
+        calls.append(revision_text)
+        original = re.search(r"“(.+?)”", revision_text).group(1)
+        start = text.index(original)
+        return json.dumps([{"sentence_start": 0 if start < 8 else 8, "original": original, "content": "X"}], ensure_ascii=False)
+
+    monkeypatch.setattr(diff, "text2diff_llm", fake_text2diff_llm)
+    conflicts = []
+    replacements = text2diff_parallel(text, "1. 改写“我们的”\n2. 改写“一些”\n3. 改写“们的世”", use_cache=False, conflicts=conflicts)
+
+    # 每条指令单独请求，第三条与第一条重叠被丢弃
+    assert sorted(calls) == ["1. 改写“我们的”", "2. 改写“一些”", "3. 改写“们的世”"]
+    assert replacements == [(2, 5, "X"), (11, 13, "X")]
+    assert conflicts[0]["replacement"] == (3, 6, "X")
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from src.core.diff import text2diff, text2diff_prompt
+from src.core.stream import text2diff_stream, text2diff_stream_async
+from src.core.metrics import METRICS, Metrics, estimate_tokens
+from src.core.providers import OpenAIProvider
+
+TEXT = "改变我们的世界。带来了一些挑战。"
+
+
+def test_metrics_stage_and_hooks():
+    metrics = Metrics()
+    events = []
+    metrics.add_hook(lambda kind, name, value: events.append((kind, name)))
+    with metrics.stage("split"):
+        pass
+    metrics.incr("cache_hits", 2)
+
+    assert events == [("timing", "split"), ("counter", "cache_hits")]
+    assert metrics.snapshot()["stages"]["split"]["count"] == 1
+    text = metrics.export_prometheus()
+    assert "text2diff_cache_hits_total 2" in text
+    assert 'text2diff_stage_seconds_count{stage="split"} 1' in text
+    assert 'text2diff_stage_seconds_bucket{stage="split",le="+Inf"} 1' in text
+
+
+def test_text2diff_records_stages(use_stub):
+    resp = json.dumps([
+        {"sentence_start": 0, "original": "我们的", "content": "大家的"},
+        {"sentence_start": 0, "original": "不存在", "content": "x"},
+    ], ensure_ascii=False)
+    use_stub(response=resp)
+    # 关闭修复阶段，只统计一次调用
+    assert text2diff(TEXT, "改一下", use_cache=False, repair_attempts=0) == [(2, 5, "大家的")]
+
+    snapshot = METRICS.snapshot()
+    assert set(snapshot["stages"]) >= {"split", "rules", "prompt", "llm", "parse", "resolve"}
+    counters = snapshot["counters"]
+    assert counters["llm_calls"] == 1
+    assert counters["dropped_revisions"] == 1
+    assert counters["completion_tokens_estimated"] == estimate_tokens(resp)
+    assert counters["prompt_tokens_estimated"] > estimate_tokens(text2diff_prompt.__doc__)
+    # 桩后端不返回真实用量
+    assert "prompt_tokens" not in counters
+
+
+def test_parse_failures_are_counted(use_stub):
+    use_stub(response="not json")
+    with pytest.raises(ValueError):
+        text2diff(TEXT, "改一下", use_cache=False)
+    assert METRICS.snapshot()["counters"]["parse_failures"] == 1
+
+
+@pytest.mark.parametrize("rate, tracked", [(0.0, False), (1.0, True)])
+def test_ell_sample_rate(monkeypatch, rate, tracked):
+    monkeypatch.setenv("TEXT2DIFF_TEST_API_KEY", "test")
+    provider = OpenAIProvider("sampled", "stub-model", {
+        "api_key_env": "TEXT2DIFF_TEST_API_KEY",
+        "ell_store": None,
+        "ell_verbose": False,
+        "ell_sample_rate": rate,
+    })
+    provider._lmp(text2diff_prompt)
+    assert list(provider._lmps) == [(text2diff_prompt, tracked)]
+
+
+def test_stream_records_llm_metrics(use_stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("TEXT2DIFF_CACHE_DIR", str(tmp_path))
+    resp = json.dumps([{"sentence_start": 0, "original": "我们的", "content": "大家的"}], ensure_ascii=False)
+    use_stub(response=resp, model="test-metrics-stream")
+    # 第二次命中缓存，不再调用大模型
+    for _ in range(2):
+        assert list(text2diff_stream(TEXT, "改一下")) == [(2, 5, "大家的")]
+
+    snapshot = METRICS.snapshot()
+    assert snapshot["stages"]["llm"]["count"] == 1
+    assert snapshot["counters"]["llm_calls"] == 1
+    assert snapshot["counters"]["completion_tokens_estimated"] == estimate_tokens(resp)
+    assert snapshot["counters"]["cache_misses"] == 1
+    assert snapshot["counters"]["cache_hits"] == 1
+    for name in ("split", "prompt", "resolve"):
+        assert snapshot["stages"][name]["count"] >= 2
+
+
+class FakeCompletions:
+    """按 OpenAI 客户端的格式返回固定结果和 usage。"""
+
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+        if not kwargs.get("stream"):
+            message = SimpleNamespace(content=self.content)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        async def chunks():
+            for part in (self.content[:10], self.content[10:]):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+        return chunks()
+
+
+@pytest.mark.parametrize("stream_usage", [False, True])
+def test_openai_provider_records_real_usage(use_stub, stream_usage):
+    resp = json.dumps([{"sentence_start": 0, "original": "我们的", "content": "大家的"}], ensure_ascii=False)
+    provider = OpenAIProvider("usage", "stub-model", {"stream_usage": stream_usage})
+    completions = FakeCompletions(resp)
+    provider._async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    use_stub(provider)
+
+    async def run():
+        return [r async for r in text2diff_stream_async(TEXT, "改一下", use_cache=False)]
+
+    assert asyncio.run(run()) == [(2, 5, "大家的")]
+    counters = METRICS.snapshot()["counters"]
+    assert counters["prompt_tokens"] == 120 and counters["completion_tokens"] == 30
+    assert counters["llm_calls"] == 1
+    assert ("stream_options" in completions.requests[0]) == stream_usage
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from src.core.diff import text2diff_async, text2diff_prompt
+from src.core.metrics import METRICS
+from src.core.providers import (BackendHealth, OpenAIProvider, PoolProvider, StubProvider, get_provider,
+                                register_provider)
+
+TEXT = "改变我们的世界。带来了一些挑战。"
+RESP = json.dumps([{"sentence_start": 0, "original": "我们的", "content": "大家的"}], ensure_ascii=False)
+
+
+@pytest.fixture
+def pool(use_stub):
+    def make(*backends, **settings):
+        names = []
+        for i, backend in enumerate(backends):
+            name = f"test-pool-{i}"
+            register_provider(name, backend)
+            names.append(name)
+        provider = PoolProvider("test-pool", settings={"backends": names, "hedge_delay": 0.05, **settings})
+        return use_stub(provider, name="test-pool")
+
+    return make
+
+
+def stub(resp=RESP, delay=0.0, responder=None):
+    return StubProvider(settings={"response": resp, "delay": delay}, responder=responder)
+
+
+def test_fast_primary_is_not_hedged(pool):
+    primary, secondary = stub(), stub()
+    provider = pool(primary, secondary)
+    assert provider.call(text2diff_prompt, TEXT, "改一下") == RESP
+    assert (primary.calls, secondary.calls) == (1, 0)
+    assert "hedged_requests" not in METRICS.snapshot()["counters"]
+
+
+def test_slow_primary_is_hedged(pool):
+    primary, secondary = stub(resp="[1]", delay=0.5), stub()
+    provider = pool(primary, secondary)
+    start = time.perf_counter()
+    assert provider.call(text2diff_prompt, TEXT, "改一下") == RESP
+    assert time.perf_counter() - start < 0.4
+    counters = METRICS.snapshot()["counters"]
+    assert counters["hedged_requests"] == 1 and counters["hedge_wins"] == 1
+
+
+def test_async_loser_is_cancelled(pool):
+    primary, secondary = stub(delay=0.5), stub()
+    provider = pool(primary, secondary)
+    assert asyncio.run(provider.acall(text2diff_prompt, TEXT, "改一下")) == RESP
+    # 主后端的请求在返回前被取消
+    assert (primary.calls, secondary.calls) == (0, 1)
+
+
+def test_invalid_response_fails_over(pool):
+    primary, secondary = stub(resp="not json"), stub()
+    provider = pool(primary, secondary)
+    assert provider.call(text2diff_prompt, TEXT, "改一下") == RESP
+    assert provider.stats()["test-pool-0"]["failures"] == 1
+
+    # 所有后端都无效时返回无效的输出，交给后续的修复阶段
+    provider = pool(stub(resp="not json"), stub(resp="still not json"))
+    assert provider.call(text2diff_prompt, TEXT, "改一下") in ("not json", "still not json")
+
+
+def test_fenced_response_is_a_success(pool):
+    # 代码块包裹的输出解析阶段可以处理，不算后端失败，也不会触发补发
+    fenced = "```json\n" + RESP + "\n```"
+    primary, secondary = stub(resp=fenced), stub()
+    provider = pool(primary, secondary, failure_threshold=1)
+    for _ in range(3):
+        assert provider.call(text2diff_prompt, TEXT, "改一下") == fenced
+    assert "".join(provider.stream(text2diff_prompt, TEXT, "改一下")) == fenced
+    assert (primary.calls, secondary.calls) == (4, 0)
+    assert provider.stats()["test-pool-0"]["state"] == "closed"
+    assert "backend_failures" not in METRICS.snapshot()["counters"]
+
+
+def test_all_backends_raise(pool):
+    def fail(system, user):
+        raise ConnectionError("down")
+
+    provider = pool(stub(responder=fail), stub(responder=fail))
+    with pytest.raises(ConnectionError):
+        provider.call(text2diff_prompt, TEXT, "改一下")
+
+
+def test_circuit_breaker(pool):
+    state = {"up": False}
+
+    def flaky(system, user):
+        if not state["up"]:
+            raise ConnectionError("down")
+        return RESP
+
+    primary, secondary = stub(responder=flaky), stub()
+    provider = pool(primary, secondary, failure_threshold=2, cooldown=0.1)
+    for _ in range(2):
+        assert provider.call(text2diff_prompt, TEXT, "改一下") == RESP
+    assert provider.stats()["test-pool-0"]["state"] == "open"
+
+    # 熔断期间不再请求主后端
+    provider.call(text2diff_prompt, TEXT, "改一下")
+    assert primary.calls == 2
+
+    # 冷却后放行一次试探请求，成功则恢复
+    time.sleep(0.12)
+    state["up"] = True
+    provider.call(text2diff_prompt, TEXT, "改一下")
+    assert primary.calls == 3
+    assert provider.stats()["test-pool-0"]["state"] == "closed"
+
+
+class BrokenStream(StubProvider):
+    """产出第一段之后中断的流式后端。"""
+
+    def stream(self, prompt_fn, *args):
+        self.calls += 1
+        yield RESP[:5]
+        raise ConnectionError("stream reset")
+
+
+def test_stream_fails_over_before_first_chunk(pool):
+    def fail(system, user):
+        raise ConnectionError("down")
+
+    primary, secondary = stub(responder=fail), stub()
+    provider = pool(primary, secondary)
+    assert "".join(provider.stream(text2diff_prompt, TEXT, "改一下")) == RESP
+    stats = provider.stats()
+    assert stats["test-pool-0"]["failures"] == 1
+    assert stats["test-pool-1"]["p50"] is not None
+
+    # 异步版本同样改用下一个后端，并计入熔断状态
+    primary, secondary = stub(responder=fail), stub()
+    provider = pool(primary, secondary, failure_threshold=1)
+
+    async def collect():
+        return "".join([chunk async for chunk in provider.astream(text2diff_prompt, TEXT, "改一下")])
+
+    assert asyncio.run(collect()) == RESP
+    assert provider.stats()["test-pool-0"]["state"] == "open"
+
+
+def test_stream_error_after_first_chunk(pool):
+    primary, secondary = BrokenStream(), stub()
+    provider = pool(primary, secondary)
+    chunks = []
+    with pytest.raises(ConnectionError):
+        for chunk in provider.stream(text2diff_prompt, TEXT, "改一下"):
+            chunks.append(chunk)
+    # 已经产出内容，不能再换后端
+    assert chunks == [RESP[:5]] and secondary.calls == 0
+    assert provider.stats()["test-pool-0"]["failures"] == 1
+
+
+def test_stream_closed_early_is_not_a_failure(pool):
+    provider = pool(stub(), stub(), failure_threshold=1)
+    chunks = provider.stream(text2diff_prompt, TEXT, "改一下")
+    next(chunks)
+    chunks.close()
+    assert provider.stats()["test-pool-0"] == {"state": "closed", "failures": 0, "p50": None, "p95": None}
+
+
+def test_backend_health_percentile():
+    health = BackendHealth(failure_threshold=1, cooldown=10, clock=lambda: 0.0)
+    assert health.percentile(0.95) is None
+    for i in range(1, 101):
+        health.record_success(i / 100)
+    assert health.percentile(0.5) == 0.51
+    assert health.percentile(0.95) == 0.96
+    health.record_failure()
+    assert health.state == "open" and not health.available()
+
+
+def test_hedge_delay_follows_percentile(pool):
+    provider = pool(stub(), stub(), hedge_min_samples=5, hedge_percentile=0.9)
+    primary = provider.backends[0]
+    assert provider.hedge_delay(primary) == 0.05
+    for latency in (0.01, 0.02, 0.03, 0.04, 0.2):
+        provider.health_of(primary).record_success(latency)
+    assert provider.hedge_delay(primary) == 0.2
+
+
+def test_pool_from_config(monkeypatch, tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "provider": "test-config-pool",
+        "providers": {"test-config-pool": {"type": "pool", "backends": "stub, stub"}},
+    }))
+    monkeypatch.setenv("TEXT2DIFF_CONFIG", str(path))
+    provider = get_provider("test-config-pool")
+    assert isinstance(provider, PoolProvider)
+    assert provider.backend_names == ["stub", "stub"] and provider.model == "pool(stub,stub)"
+    with pytest.raises(ValueError):
+        PoolProvider("empty", settings={"backends": []})
+
+
+class DelayedLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的本地桩大模型服务，按 server.delay 延迟返回。"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.delay)
+        data = json.dumps({
+            "id": "stub", "created": 0, "model": body["model"], "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": RESP}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except OSError:
+            # 对冲请求被取消后客户端已经断开
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_against_delayed_stub_servers(pool, monkeypatch):
+    monkeypatch.setenv("TEXT2DIFF_TEST_API_KEY", "test")
+    servers = []
+    for delay in (1.0, 0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), DelayedLLMHandler)
+        server.daemon_threads = True
+        server.delay = delay
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    try:
+        backends = [
+            OpenAIProvider(f"delayed-{i}", "stub-model", {
+                "base_url": f"http://127.0.0.1:{server.server_address[1]}/v1",
+                "api_key_env": "TEXT2DIFF_TEST_API_KEY",
+                "max_connections": 10, "max_keepalive_connections": 5, "keepalive_expiry": 5,
+            })
+            for i, server in enumerate(servers)
+        ]
+        pool(*backends, hedge_delay=0.1)
+        start = time.perf_counter()
+        result = asyncio.run(text2diff_async(TEXT, "改一下", use_cache=False, use_rules=False))
+        assert result == [(2, 5, "大家的")]
+        assert time.perf_counter() - start < 0.9
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from src.core.diff import split_text_by_sentences
+from src.core.prompt import (
+    extract_quoted,
+    prefilter_sentences,
+    rebuild_text_with_ids,
+    text2diff_compact,
+    text2diff_compact_prompt,
+)
+from src.core.repair import text2diff_repair_prompt
+
+TEXT = "第一句话。第二句话。第三句中有目标词。第四句话。第五句话。第六句话。"
+
+
+@pytest.fixture
+def stub(use_stub):
+    calls = []
+
+    def install(items):
+        def responder(system, user):
+            calls.append((system, user))
+            return json.dumps(items, ensure_ascii=False)
+        use_stub(responder=responder)
+        return calls
+
+    return install
+
+
+def test_extract_quoted():
+    assert extract_quoted('把"我们的"改成“大家的”，删除「一些」') == ["我们的", "大家的", "一些"]
+    assert extract_quoted("没有引号") == []
+
+
+def test_rebuild_text_with_ids_gap():
+    sentences = split_text_by_sentences(TEXT)
+    text_with_ids, starts = rebuild_text_with_ids(sentences, [0, 1, 4])
+    assert text_with_ids == "‖0‖第一句话。‖1‖第二句话。\n…\n‖2‖第五句话。"
+    assert starts == [0, 5, sentences[4][0]]
+
+
+def test_prefilter_sentences():
+    sentences = split_text_by_sentences(TEXT)
+    assert prefilter_sentences(TEXT, sentences, '删除"目标词"') == [1, 2, 3]
+    # 引号内容不在原文中时发送全文
+    assert prefilter_sentences(TEXT, sentences, '删除"不存在"') is None
+
+
+def test_text2diff_compact(stub):
+    calls = stub([
+        {"sentence_id": 1, "original": "目标词", "content": "关键词"},
+        {"sentence_id": 9, "original": "第一", "content": "首"},
+    ])
+    stats = {}
+    replacements = text2diff_compact(TEXT, '把"目标词"改为"关键词"', prefilter=True, use_cache=False, stats=stats)
+
+    # 编号 1 是预筛选后的第二个句子，即原文第三句；无效编号被丢弃
+    start = TEXT.index("目标词")
+    assert replacements == [(start, start + 3, "关键词")]
+
+    system, user = calls[0]
+    assert system == text2diff_compact_prompt.__doc__
+    assert "‖start:" not in user and "第一句话" not in user
+    assert stats["sent_sentences"] == 3 and stats["sentences"] == 6
+    assert stats["compact_tokens"] < stats["full_tokens"]
+
+
+def test_text2diff_compact_repairs_invalid_id(use_stub):
+    def responder(system, user):
+        if system == text2diff_repair_prompt.__doc__:
+            assert "‖start:" in user
+            return json.dumps([{"sentence_start": TEXT.index("第五"), "original": "第五", "content": "第5"}],
+                              ensure_ascii=False)
+        # 编号越界，original 和 content 可用，交给修复
+        return json.dumps([{"sentence_id": 9, "original": "第五", "content": "第5"}], ensure_ascii=False)
+
+    use_stub(responder=responder)
+    stats = {}
+    replacements = text2diff_compact(TEXT, '把"第五"改为"第5"', use_cache=False, stats=stats)
+
+    start = TEXT.index("第五")
+    assert replacements == [(start, start + 2, "第5")]
+    assert stats["repaired"] == 1
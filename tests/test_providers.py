@@ -0,0 +1,79 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from src.core import providers
+from src.core.providers import OpenAIProvider, StubProvider, get_provider
+
+
+@pytest.fixture
+def clean_registry(monkeypatch):
+    """每个测试使用独立的后端注册表和环境变量。"""
+    monkeypatch.setattr(providers, "_providers", {})
+    monkeypatch.setattr(providers, "_default_name", None)
+    for env in list(providers.ENV_OVERRIDES) + ["TEXT2DIFF_CONFIG"]:
+        monkeypatch.delenv(env, raising=False)
+
+
+def test_import_is_side_effect_free():
+    code = (
+        "import sys\n"
+        "from src.core.diff import apply_diff, split_text_by_sentences\n"
+        "assert 'openai' not in sys.modules and 'ell' not in sys.modules, sorted(sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ""
+
+
+def test_default_provider_is_lazy(clean_registry):
+    provider = get_provider()
+    assert isinstance(provider, OpenAIProvider)
+    assert provider.model == "glm-4-flash"
+    assert provider._client is None and provider._async_client is None
+    assert get_provider() is provider
+
+
+def test_env_override(clean_registry, monkeypatch):
+    monkeypatch.setenv("TEXT2DIFF_PROVIDER", "deepseek")
+    monkeypatch.setenv("TEXT2DIFF_MODEL", "deepseek-reasoner")
+    assert get_provider().model == "deepseek-reasoner"
+    # 顶层的模型配置不影响其他后端
+    assert get_provider("zhipu").model == "glm-4-flash"
+
+
+def test_config_file(clean_registry, monkeypatch, tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "provider": "local",
+        "providers": {"local": {"model": "qwen2.5", "base_url": "http://127.0.0.1:8000/v1"}},
+        "max_connections": 8,
+    }))
+    monkeypatch.setenv("TEXT2DIFF_CONFIG", str(path))
+
+    provider = get_provider()
+    assert provider.name == "local"
+    assert provider.model == "qwen2.5"
+    assert provider.settings["base_url"] == "http://127.0.0.1:8000/v1"
+    assert provider.settings["max_connections"] == 8
+
+    with pytest.raises(ValueError):
+        get_provider("unknown")
+
+
+def test_stub_provider(clean_registry, monkeypatch):
+    monkeypatch.setenv("TEXT2DIFF_PROVIDER", "stub")
+    monkeypatch.setenv("TEXT2DIFF_STUB_RESPONSE", '[{"a": 1}]')
+    provider = get_provider()
+    assert isinstance(provider, StubProvider)
+
+    def prompt(x):
+        """系统提示词"""
+        return f"用户提示词{x}"
+
+    assert provider.call(prompt, 1) == '[{"a": 1}]'
+    assert "".join(provider.stream(prompt, 1)) == '[{"a": 1}]'
+
+    echo = StubProvider(responder=lambda system, user: system + "|" + user)
+    assert echo.call(prompt, 1) == "系统提示词|用户提示词1"
@@ -0,0 +1,37 @@
+import io
+
+from src.core.render import iter_hunks, iter_html, iter_md, render_html
+
+TEXT = "".join(f"第{i}行。\n" for i in range(100))
+
+
+def test_iter_html_escapes():
+    text = "a<b>&c"
+    html = "".join(iter_html(text, [(1, 4, "<i>")]))
+    assert html == ("a<span style='color:red;text-decoration:line-through'>&lt;b&gt;</span> → "
+                    "<span style='color:green;font-weight:bold'>&lt;i&gt;</span>&amp;c")
+
+
+def test_iter_hunks_merges_nearby():
+    a = TEXT.index("第10行")
+    b = TEXT.index("第12行")
+    c = TEXT.index("第80行")
+    hunks = list(iter_hunks(TEXT, [(c, c + 1, "x"), (a, a + 1, "x"), (b, b + 1, "x")], context=1, by_lines=True))
+    assert [len(h[2]) for h in hunks] == [2, 1]
+    # 按行计算的上下文从行首开始、到行尾结束
+    assert TEXT[hunks[0][0]:hunks[0][1]] == "".join(f"第{i}行。\n" for i in range(9, 14))
+
+
+def test_hunk_output_is_small():
+    text = "x" * 5_000_000
+    replacements = [(i * 400_000, i * 400_000 + 1, "y") for i in range(10)]
+    sink = io.StringIO()
+    written = render_html(text, replacements, sink, context=20)
+    assert written == len(sink.getvalue()) < 4096
+    assert "省略" in sink.getvalue()
+
+
+def test_iter_md_context_chars():
+    text = "0123456789" * 3
+    md = "".join(iter_md(text, [(15, 16, "X")], context=2))
+    assert md == "\n⋯ 省略 13 个字符 ⋯\n34~~5~~ → **X**67\n⋯ 省略 12 个字符 ⋯\n"
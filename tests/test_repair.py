@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import pytest
+from src.core.diff import build_sentence_index, text2diff, text2diff_async
+from src.core.metrics import METRICS
+from src.core.repair import build_repair_context, salvage_json, text2diff_repair_prompt, validate_revisions
+
+TEXT = ("AI正在深刻改变我们的世界。从医疗诊断到自动驾驶，AI技术正在各个领域发挥重要作用。"
+        "在交通领域，自动驾驶技术有望减少交通事故。然而，AI的发展也带来了一些挑战。"
+        "专家们认为，AI应该服务于人类。")
+
+
+@pytest.mark.parametrize("resp, expected", [
+    ('[{"a": 1}]', [{"a": 1}]),
+    ('```json\n[{"a": 1}]\n```', [{"a": 1}]),
+    ('{"revisions": [{"a": 1}]}', [{"a": 1}]),
+    # 尾逗号和截断
+    ('[{"a": 1}, {"b": 2},]', [{"a": 1}, {"b": 2}]),
+    ('[{"a": 1}, {"b": {"c": 2}}, {"d": "截', [{"a": 1}, {"b": {"c": 2}}]),
+    ('结果如下：{"a": 1} 以及 {"b": 2}', [{"a": 1}, {"b": 2}]),
+])
+def test_salvage_json(resp, expected):
+    assert salvage_json(resp) == expected
+
+
+def test_salvage_json_nothing():
+    with pytest.raises(ValueError):
+        salvage_json("not json")
+
+
+def test_validate_revisions():
+    failed = []
+    valid = validate_revisions([
+        {"sentence_start": "3", "original": "a", "content": "b"},
+        {"sentence_start": None, "original": "c", "content": "d"},
+        {"sentence_start": 0, "original": "", "content": "e"},
+        {"original": "f"},
+        "g",
+    ], failed)
+    assert valid == [{"sentence_start": 3, "original": "a", "content": "b"}]
+    assert failed == [{"sentence_start": None, "original": "c", "content": "d"}]
+
+
+def test_build_repair_context():
+    index = build_sentence_index(TEXT)
+    context = build_repair_context(index, [{"sentence_start": None, "original": "专家认为", "content": "x"}])
+    # 只包含 original 片段出现的句子及其相邻句子，并保留绝对位置
+    start = TEXT.index("然而")
+    assert context.startswith(f"‖start:{start}‖然而")
+    assert "专家们认为" in context
+    assert "医疗诊断" not in context
+    assert build_repair_context(index, [{"sentence_start": None, "original": "完全无关", "content": "x"}]) is None
+
+
+@pytest.fixture
+def responder(use_stub):
+    prompts = []
+
+    def install(first, repairs):
+        def respond(system, user):
+            prompts.append((system, user))
+            if system == text2diff_repair_prompt.__doc__:
+                return repairs.pop(0)
+            return first
+
+        use_stub(responder=respond)
+        return prompts
+
+    return install
+
+
+FIRST = json.dumps([
+    {"sentence_start": 0, "original": "我们的", "content": "大家的"},
+    {"sentence_start": TEXT.index("然而"), "original": "专家认为", "content": "专家们普遍认为"},
+], ensure_ascii=False)
+OURS = (TEXT.index("我们的"), TEXT.index("我们的") + 3, "大家的")
+
+
+def test_text2diff_repairs_failed_items(responder):
+    pos = TEXT.index("专家们认为")
+    repaired = json.dumps([{"sentence_start": pos, "original": "专家们认为", "content": "专家们普遍认为"}],
+                          ensure_ascii=False)
+    prompts = responder(FIRST, [repaired])
+    stats = {}
+    result = text2diff(TEXT, "改一下", use_cache=False, stats=stats)
+    assert result == [OURS, (pos, pos + 5, "专家们普遍认为")]
+    assert stats["repair_attempts"] == 1
+    assert stats["repaired"] == 1 and stats["unrepaired"] == 0
+
+    # 修复请求只包含失败的修改和相关句子
+    _, user = prompts[1]
+    assert "专家认为" in user and "我们的" not in user
+    assert "医疗诊断" not in user
+    assert METRICS.snapshot()["counters"]["repaired_revisions"] == 1
+
+
+def test_text2diff_repair_budget(responder):
+    responder(FIRST, ["[]", "not json", "[]"])
+    stats = {}
+    assert text2diff(TEXT, "改一下", use_cache=False, stats=stats) == [OURS]
+    assert stats["repair_attempts"] == 2
+    assert stats["unrepaired"] == 1
+    assert METRICS.snapshot()["counters"]["dropped_revisions"] == 1
+
+
+def test_text2diff_salvages_truncated_response(responder):
+    truncated = FIRST[:FIRST.index('"original": "专家')] + '"orig'
+    responder(truncated, [])
+    assert text2diff(TEXT, "改一下", use_cache=False) == [OURS]
+
+
+def test_repaired_overlap_is_dropped(responder):
+    repaired = json.dumps([{"sentence_start": 0, "original": "改变我们", "content": "y"}], ensure_ascii=False)
+    responder(FIRST, [repaired, "[]"])
+    assert text2diff(TEXT, "改一下", use_cache=False) == [OURS]
+
+
+def test_text2diff_async_repairs(responder):
+    pos = TEXT.index("专家们认为")
+    repaired = json.dumps([{"sentence_start": pos, "original": "专家们认为", "content": "专家们普遍认为"}],
+                          ensure_ascii=False)
+    responder(FIRST, [repaired])
+    result = asyncio.run(text2diff_async(TEXT, "改一下", use_cache=False, use_rules=False))
+    assert result == [OURS, (pos, pos + 5, "专家们普遍认为")]
+
+
+def test_fenced_response_is_cached(use_stub, tmp_path, monkeypatch):
+    # 被代码块包裹的输出能被解析，应当和普通输出一样缓存
+    monkeypatch.setenv("TEXT2DIFF_CACHE_DIR", str(tmp_path))
+    provider = use_stub(response="```json\n" + FIRST + "\n```", model="test-repair-fenced")
+    for _ in range(3):
+        assert text2diff(TEXT, "改一下", use_rules=False, repair_attempts=0) == [OURS]
+    assert provider.calls == 1
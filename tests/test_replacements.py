@@ -0,0 +1,55 @@
+import random
+
+import pytest
+from src.core.diff import apply_diff, diff2html
+from src.core.document import Document
+from src.core.replacements import ReplacementSet
+
+from helpers import random_replacements
+
+
+def test_sorted_and_validated():
+    rs = ReplacementSet([(5, 6, "b"), (0, 2, "a"), (2, 2, "+")])
+    assert rs == [(0, 2, "a"), (2, 2, "+"), (5, 6, "b")]
+    assert rs[1] == (2, 2, "+") and len(rs) == 3
+    assert rs.delta == 0
+    with pytest.raises(ValueError):
+        ReplacementSet([(0, 5, "a"), (3, 8, "b")])
+
+
+def test_apply_and_render_accept_replacement_set():
+    text = "0123456789"
+    replacements = [(7, 9, "x"), (0, 1, "")]
+    rs = ReplacementSet(replacements)
+    assert apply_diff(text, rs) == apply_diff(text, replacements)
+    assert diff2html(text, rs) == diff2html(text, replacements)
+    assert str(Document(text).apply(rs)) == apply_diff(text, replacements)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_map_positions_matches_document(seed):
+    rng = random.Random(seed)
+    text = "x" * 200
+    replacements = random_replacements(rng, len(text), 15, alphabet="新", insert_rate=0.3)
+    rs = ReplacementSet(replacements)
+    doc = Document(text).apply(replacements)
+
+    positions = list(range(len(text) + 1))
+    expected = [doc.map_offset(pos) for pos in positions]
+    assert list(rs.map_positions(positions)) == expected
+    # 无序输入走逐个二分查找的路径
+    shuffled = positions[:]
+    rng.shuffle(shuffled)
+    assert list(rs.map_positions(shuffled)) == [doc.map_offset(pos) for pos in shuffled]
+
+
+@pytest.mark.parametrize("offset", [0, 2 ** 40])
+def test_binary_round_trip(offset):
+    rs = ReplacementSet([(offset + 1, offset + 3, "中文"), (offset + 5, offset + 5, ""), (offset + 9, offset + 12, "abc")])
+    data = rs.to_bytes()
+    assert ReplacementSet.from_bytes(data) == rs
+    assert ReplacementSet.from_bytes(ReplacementSet().to_bytes()) == []
+    with pytest.raises(ValueError):
+        ReplacementSet.from_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        ReplacementSet.from_bytes(b"XXXX" + data[4:])
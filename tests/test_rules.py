@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from src.core import diff
+from src.core.diff import split_text_by_sentences, text2diff
+from src.core.index import SentenceIndex
+from src.core.rules import match_rules, parse_instruction
+
+TEXT = """AI正在深刻改变我们的世界。从医疗诊断到自动驾驶，AI技术正在各个领域发挥重要作用。
+在医疗领域，AI可以帮助医生更准确地诊断疾病。在交通领域，自动驾驶技术有望减少交通事故。
+然而，AI的发展也带来了一些挑战。"""
+
+INSTRUCTIONS = """
+1. 把"我们的"改成"大家的"
+2. 在"医疗诊断"前添加"先进的"
+3. 在"交通事故"后添加"，提高道路安全"
+4. 删除"一些"
+"""
+
+
+@pytest.mark.parametrize("line, expected", [
+    ('1. 把"我们的"改成"大家的"', ("replace", "我们的", "大家的")),
+    ("将“旧”替换为“新”。", ("replace", "旧", "新")),
+    ('在"医疗诊断"前添加"先进的"', ("insert_before", "医疗诊断", "先进的医疗诊断")),
+    ('在"交通事故"之后加上"，提高道路安全"', ("insert_after", "交通事故", "交通事故，提高道路安全")),
+    ('- 删除"一些"', ("delete", "一些", "")),
+    ('Change "our" to "the"', ("replace_en", "our", "the")),
+    ('Add "advanced" before "medical diagnosis"', ("insert_before_en", "medical diagnosis", "advanced medical diagnosis")),
+    ('Add ", improving road safety" after "traffic accidents"', ("insert_after_en", "traffic accidents", "traffic accidents, improving road safety")),
+    ('4. Delete "some"', ("delete_en", "some", "")),
+    ("把第二段写得更正式一些", None),
+])
+def test_parse_instruction(line, expected):
+    assert parse_instruction(line) == expected
+
+
+def test_match_rules_leftover():
+    sentences = split_text_by_sentences(TEXT)
+    stats = {}
+    revisions, leftover = match_rules(TEXT, INSTRUCTIONS + '润色全文\n删除"不存在"\n', SentenceIndex(TEXT, sentences), stats)
+    assert len(revisions) == 4
+    assert leftover == '润色全文\n删除"不存在"'
+    assert stats == {"rule_lines": 6, "rule_hits": 4, "hit_rate": 4 / 6}
+
+
+def test_text2diff_skips_llm(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("不应调用大模型")
+
+    monkeypatch.setattr(diff, "text2diff_llm", fail)
+    assert text2diff(TEXT, INSTRUCTIONS, use_cache=False) == [
+        (8, 11, "大家的"), (15, 19, "先进的医疗诊断"), (82, 86, "交通事故，提高道路安全"), (100, 102, "")]
+
+
+def test_text2diff_sends_leftover(monkeypatch):
+    calls = []
+
+    def fake_text2diff_llm(text_with_pos, revision_text):
+        calls.append(revision_text)
+        return json.dumps([{"sentence_start": 0, "original": "深刻", "content": ""}], ensure_ascii=False)
+
+    monkeypatch.setattr(diff, "text2diff_llm", fake_text2diff_llm)
+    replacements = text2diff(TEXT, '删除"一些"\n去掉形容词', use_cache=False)
+    assert calls == ["去掉形容词"]
+    assert replacements == [(100, 102, ""), (4, 6, "")]
+
+
+def test_match_rules_ambiguous_target():
+    # "AI" 出现多次，规则不能只改第一处，交给大模型决定
+    sentences = split_text_by_sentences(TEXT)
+    stats = {}
+    revisions, leftover = match_rules(TEXT, '把"AI"改成"人工智能"\n删除"一些"', SentenceIndex(TEXT, sentences), stats)
+    assert revisions == [{"sentence_start": TEXT.index("然而"), "original": "一些", "content": ""}]
+    assert leftover == '把"AI"改成"人工智能"'
+    assert stats["rule_hits"] == 1
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+from src.core.diff import apply_diff, split_text_by_sentences
+from src.core.segmenter import IncrementalSegmenter
+
+from helpers import random_replacements
+
+ALPHABET = ["这", "是", "a", "b", " ", "\n", ".", "。", "!", "？", '"', "'", "1"]
+
+
+def random_text(rng, length):
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_incremental_matches_full_split(seed):
+    rng = random.Random(seed)
+    text = random_text(rng, rng.randint(0, 120))
+    segmenter = IncrementalSegmenter(text)
+
+    for _ in range(10):
+        replacements = random_replacements(rng, len(text), rng.randint(1, 4), ALPHABET, 5, insert_rate=0.3)
+        text = apply_diff(text, replacements)
+        segmenter.apply(replacements)
+
+        assert segmenter.text == text
+        assert segmenter.sentences() == split_text_by_sentences(text)
+
+
+def test_only_touched_sentences_change():
+    text = "".join(f"第{i}句。" for i in range(100))
+    segmenter = IncrementalSegmenter(text)
+    before = segmenter.sentences()
+
+    start = text.find("第50句")
+    segmenter.apply([(start, start + 4, "第五十句！新句")])
+
+    after = segmenter.sentences()
+    assert after[:50] == before[:50]
+    assert after[50] == (start, "第五十句！")
+    assert after[51] == (start + 5, "新句。")
+    assert [chunk for _, chunk in after[52:]] == [chunk for _, chunk in before[51:]]
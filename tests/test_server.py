@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from src.core.providers import OpenAIProvider, StubProvider
+from src.core.server import ServiceBusy, Text2DiffService, make_server
+
+TEXT = "改变我们的世界。带来了一些挑战。"
+RESP = json.dumps([{"sentence_start": 0, "original": "我们的", "content": "大家的"}], ensure_ascii=False)
+
+
+def request(base, path, body=None, client=None):
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base + path, data=data, headers={"X-Client-Id": client} if client else {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def serve(use_stub):
+    servers = []
+
+    def start(provider, **kwargs):
+        use_stub(provider)
+        service = Text2DiffService(**kwargs).start()
+        server = make_server("127.0.0.1", 0, service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+        server.service.stop()
+
+
+def test_endpoints(serve):
+    base = serve(StubProvider(settings={"response": RESP}))
+
+    assert request(base, "/healthz") == (200, {"status": "ok"})
+    assert request(base, "/readyz")[0] == 200
+
+    status, payload = request(base, "/v1/text2diff", {"text": TEXT, "revision": "改一下", "use_cache": False})
+    assert status == 200 and payload["replacements"] == [[2, 5, "大家的"]]
+
+    # 规则能处理的指令不经过大模型
+    status, payload = request(base, "/v1/text2diff", {"text": TEXT, "revision": '删除"一些"', "use_cache": False})
+    assert payload["replacements"] == [[11, 13, ""]] and payload["stats"]["hit_rate"] == 1.0
+
+    assert request(base, "/v1/apply", {"text": TEXT, "replacements": [[2, 5, "大家的"]]}) == (200, {"text": "改变大家的世界。带来了一些挑战。"})
+    status, payload = request(base, "/v1/render", {"text": "a<b", "replacements": [[1, 2, ""]]})
+    assert payload["output"] == "a<span style='color:red;text-decoration:line-through'>&lt;</span>b"
+
+    assert request(base, "/v1/apply", {"text": TEXT, "replacements": [[0, 5, "x"], [3, 6, "y"]]})[0] == 400
+    assert request(base, "/v1/text2diff", {"text": TEXT})[0] == 400
+    assert request(base, "/v1/render", {"text": TEXT, "replacements": [], "context": -1})[0] == 400
+    assert request(base, "/v1/unknown", {})[0] == 404
+
+
+def test_unparseable_llm_output_is_502(serve):
+    base = serve(StubProvider(settings={"response": "抱歉，我无法完成"}))
+    status, payload = request(base, "/v1/text2diff", {"text": TEXT, "revision": "改一下", "use_cache": False})
+    # 大模型输出无法解析是上游错误，不是请求错误
+    assert status == 502 and "invalid LLM output" in payload["error"]
+    assert request(base, "/v1/text2diff", {"text": TEXT, "revision": "改一下", "use_cache": "no"})[0] == 400
+
+
+def test_backpressure(serve):
+    started = threading.Event()
+    release = threading.Event()
+
+    def responder(system, user):
+        started.set()
+        release.wait(10)
+        return RESP
+
+    base = serve(StubProvider(responder=responder), workers=1, queue_size=1, client_limit=1)
+    body = {"text": TEXT, "revision": "改一下", "use_cache": False}
+    results = []
+
+    def call(client):
+        results.append((client, request(base, "/v1/text2diff", body, client)[0]))
+
+    # a 占用唯一的工作线程，b 在队列中等待
+    threads = [threading.Thread(target=call, args=(c,)) for c in ("a", "b")]
+    threads[0].start()
+    assert started.wait(10)
+    threads[1].start()
+    for _ in range(1000):
+        if request(base, "/readyz")[1]["queued"] == 1:
+            break
+        time.sleep(0.01)
+
+    # 同一客户端超过并发上限；队列已满时其他客户端也被拒绝
+    assert request(base, "/v1/text2diff", body, "a")[0] == 429
+    assert request(base, "/v1/text2diff", body, "c")[0] == 429
+    assert request(base, "/readyz")[0] == 503
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [("a", 200), ("b", 200)]
+    assert request(base, "/readyz")[0] == 200
+
+
+def test_stop_with_full_queue():
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(10)
+        return "a"
+
+    service = Text2DiffService(workers=1, queue_size=1).start()
+    results = {}
+
+    def call(name, fn):
+        try:
+            results[name] = service.submit(name, fn)
+        except ServiceBusy as e:
+            results[name] = e
+
+    running = threading.Thread(target=call, args=("a", block))
+    running.start()
+    assert started.wait(10)
+    queued = threading.Thread(target=call, args=("b", lambda: "b"))
+    queued.start()
+    for _ in range(1000):
+        if service.jobs.full():
+            break
+        time.sleep(0.01)
+
+    # 队列已满时 stop 不会阻塞在放入停止标记上，排队的任务以 ServiceBusy 结束
+    stopper = threading.Thread(target=service.stop)
+    stopper.start()
+    queued.join(10)
+    assert isinstance(results["b"], ServiceBusy)
+    release.set()
+    stopper.join(10)
+    running.join(10)
+    assert not stopper.is_alive()
+    assert results["a"] == "a"
+    with pytest.raises(ServiceBusy):
+        service.submit("c", block)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的本地桩大模型服务，返回固定的修改。"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        base = {"id": "stub", "created": 0, "model": body["model"]}
+        if body.get("stream"):
+            # ell 以流式方式调用，按 SSE 格式分两段返回
+            chunks = [
+                {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"role": "assistant", "content": RESP[:10]}}]},
+                {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": RESP[10:]}, "finish_reason": "stop"}]},
+                {**base, "object": "chat.completion.chunk", "choices": [], "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}},
+            ]
+            data = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            data = json.dumps({
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": RESP}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+            content_type = "application/json"
+        data = data.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_against_stub_llm_server(serve, monkeypatch):
+    llm = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    llm.requests = []
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+    monkeypatch.setenv("TEXT2DIFF_TEST_API_KEY", "test")
+    try:
+        provider = OpenAIProvider("stub-llm", "stub-model", {
+            "base_url": f"http://127.0.0.1:{llm.server_address[1]}/v1",
+            "api_key_env": "TEXT2DIFF_TEST_API_KEY",
+            "ell_store": None,
+            "ell_verbose": False,
+        })
+        base = serve(provider)
+        status, payload = request(base, "/v1/text2diff", {"text": TEXT, "revision": "改一下", "use_cache": False})
+    finally:
+        llm.shutdown()
+        llm.server_close()
+
+    assert status == 200 and payload["replacements"] == [[2, 5, "大家的"]]
+    assert llm.requests[0]["model"] == "stub-model"
+    assert "‖start:8‖" in json.dumps(llm.requests[0]["messages"], ensure_ascii=False)
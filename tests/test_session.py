@@ -0,0 +1,121 @@
+import random
+
+import pytest
+from src.core.diff import apply_diff
+from src.core.session import SessionStore
+
+TEXT = "AI正在深刻改变我们的世界。从医疗诊断到自动驾驶，AI技术正在各个领域发挥重要作用。"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_apply_undo_redo():
+    store = SessionStore()
+    sid = store.create(TEXT)
+    v1 = store.apply(sid, [(7, 10, "大家的")])
+    assert v1 == apply_diff(TEXT, [(7, 10, "大家的")])
+    v2 = store.apply(sid, [(0, 2, "人工智能")])
+    assert store.text(sid) == v2
+    assert store.version(sid) == (2, True, False)
+
+    assert store.undo(sid) == v1
+    assert store.undo(sid) == TEXT
+    # 已经是最早的版本
+    assert store.undo(sid) == TEXT
+    assert store.redo(sid) == v1
+    assert store.version(sid) == (1, True, True)
+
+    # 撤销后的新修改丢弃可重做的版本
+    v2b = store.apply(sid, [(0, 0, "【注】")])
+    assert v2b == "【注】" + v1
+    assert store.version(sid) == (2, True, False)
+    assert store.redo(sid) == v2b
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_history_matches_full_copies(seed):
+    rng = random.Random(seed)
+    store = SessionStore(snapshot_every=3, max_history=6)
+    text = "".join(rng.choice("ab中文\n") for _ in range(200))
+    sid = store.create(text)
+    versions = [text]
+    for _ in range(15):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.randrange(5))
+        text = store.apply(sid, [(start, end, rng.choice(["", "x", "新内容"]))])
+        versions.append(text)
+        # 每次都能撤销回保留的所有版本
+        current, _, _ = store.version(sid)
+        assert current == min(len(versions), 6) - 1
+
+    for expected in reversed(versions[-6:-1]):
+        assert store.undo(sid) == expected
+    assert store.version(sid)[1] is False
+    # 快照之间最多 snapshot_every - 1 个替换版本
+    session = store._sessions[sid]
+    run = 0
+    for kind, _ in session.versions:
+        run = 0 if kind == "snapshot" else run + 1
+        assert run < 3
+
+
+def test_snapshots_deduplicated_across_sessions():
+    store = SessionStore()
+    sessions = [store.create(TEXT) for _ in range(100)]
+    assert store.stats()["snapshots"] == 1
+    single = store.bytes
+
+    store.apply(sessions[0], [(0, 2, "人工智能")])
+    assert store.stats()["snapshots"] == 1
+    assert store.bytes < 2 * single
+
+    for sid in sessions:
+        store.close(sid)
+    assert store.stats() == {"sessions": 0, "snapshots": 0, "bytes": 0, "evictions": 0}
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    store = SessionStore(ttl=10, clock=clock)
+    old = store.create(TEXT)
+    clock.now = 6
+    fresh = store.create("另一篇文档")
+    clock.now = 12
+    assert old not in store
+    assert fresh in store
+    with pytest.raises(KeyError):
+        store.text(old)
+    assert store.stats()["snapshots"] == 1
+
+
+def test_lru_eviction_under_memory_cap():
+    clock = FakeClock()
+    size = 2000
+    store = SessionStore(max_bytes=3 * size + 1000, ttl=None, clock=clock)
+    ids = []
+    for i in range(3):
+        clock.now += 1
+        ids.append(store.create(str(i) * size))
+    assert len(store) == 3
+
+    # 访问第一个会话后它变为最近使用，淘汰的是第二个
+    clock.now += 1
+    store.text(ids[0])
+    clock.now += 1
+    ids.append(store.create("3" * size))
+    assert ids[1] not in store
+    assert ids[0] in store and ids[2] in store and ids[3] in store
+    assert store.bytes <= store.max_bytes
+    assert store.stats()["evictions"] == 1
+
+
+def test_oversized_session_is_kept():
+    store = SessionStore(max_bytes=10, ttl=None)
+    sid = store.create(TEXT)
+    assert store.text(sid) == TEXT
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from src.core import stream
+from src.core.stream import JsonArrayStreamParser, iter_json_objects, text2diff_stream, text2diff_stream_async
+
+ITEMS = [
+    {"sentence_start": 0, "original": "我们的", "content": "大家的"},
+    {"sentence_start": 7, "original": "一些", "content": ""},
+    {"sentence_start": 7, "original": "{引号\\\"}", "content": "[]"},
+]
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_iter_json_objects(size):
+    resp = "```json\n" + json.dumps(ITEMS, ensure_ascii=False, indent=4) + "\n```"
+    assert list(iter_json_objects(split_every(resp, size))) == ITEMS
+
+
+def test_parser_yields_as_soon_as_object_completes():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"a": 1}, {"b": "}') == [{"a": 1}]
+    assert parser.feed('"}') == [{"b": "}"}]
+    assert parser.feed("]") == []
+
+
+TEXT = "改变我们的世界。带来了一些挑战。"
+RESP = json.dumps(ITEMS[:2], ensure_ascii=False)
+
+
+def fake_stream(text_with_pos, revision_text):
+    assert "‖start:8‖" in text_with_pos
+    yield from split_every(RESP, 5)
+
+
+async def fake_stream_async(text_with_pos, revision_text):
+    for chunk in split_every(RESP, 5):
+        yield chunk
+
+
+def test_text2diff_stream(monkeypatch):
+    monkeypatch.setattr(stream, "text2diff_llm_stream", fake_stream)
+    replacements = list(text2diff_stream(TEXT, "修改", use_cache=False))
+    assert replacements == [(2, 5, "大家的"), (11, 13, "")]
+
+
+def test_text2diff_stream_async(monkeypatch):
+    monkeypatch.setattr(stream, "text2diff_llm_stream_async", fake_stream_async)
+
+    async def collect():
+        return [r async for r in text2diff_stream_async(TEXT, "修改", use_cache=False)]
+
+    assert asyncio.run(collect()) == [(2, 5, "大家的"), (11, 13, "")]
+
+
+def test_parser_skips_malformed_objects():
+    malformed = []
+    parser = JsonArrayStreamParser(malformed)
+    assert parser.feed('[{"a": 1}, {"b": 1,}, {"c": 2}]') == [{"a": 1}, {"c": 2}]
+    assert malformed == ['{"b": 1,}']
+
+
+BAD_RESP = ('[{"sentence_start": 0, "original": "我们的", "content": "大家的"},'
+            ' {"sentence_start": 0, "original": "世界", "content": },'
+            ' {"sentence_start": 0, "content": "缺少 original"},'
+            ' {"sentence_start": "x", "original": "挑战", "content": "困难"},'
+            ' {"sentence_start": 8, "original": "一些", "content": ""}]')
+
+
+@pytest.fixture
+def repair_stub(use_stub):
+    prompts = []
+
+    def respond(system, user):
+        prompts.append(user)
+        return json.dumps([{"sentence_start": 8, "original": "挑战", "content": "困难"}], ensure_ascii=False)
+
+    use_stub(responder=respond)
+    return prompts
+
+
+def test_text2diff_stream_skips_bad_items(monkeypatch, repair_stub):
+    monkeypatch.setattr(stream, "text2diff_llm_stream", lambda *args: iter(split_every(BAD_RESP, 4)))
+    stats = {}
+    replacements = list(text2diff_stream(TEXT, "修改", use_cache=False, stats=stats))
+    # sentence_start 无效的修改在输出结束后修复
+    assert replacements == [(2, 5, "大家的"), (11, 13, ""), (13, 15, "困难")]
+    assert len(repair_stub) == 1 and "挑战" in repair_stub[0]
+    assert stats == {"repair_attempts": 1, "repaired": 1, "unrepaired": 0}
+
+
+def test_text2diff_stream_async_skips_bad_items(monkeypatch):
+    async def chunks(*args):
+        for chunk in split_every(BAD_RESP, 4):
+            yield chunk
+
+    monkeypatch.setattr(stream, "text2diff_llm_stream_async", chunks)
+
+    stats = {}
+
+    async def collect():
+        return [r async for r in text2diff_stream_async(TEXT, "修改", use_cache=False, repair_attempts=0, stats=stats)]
+
+    assert asyncio.run(collect()) == [(2, 5, "大家的"), (11, 13, "")]
+    assert stats["unrepaired"] == 1
@@ -0,0 +1,153 @@
+import json
+
+import pytest
+from src.core.structure import Block, StructureIndex, _parse_number, text2diff_structured
+
+DOC = """---
+title: 示例
+---
+# 安装
+
+第一段第一句。第一段第二句。
+继续第一段。
+
+```python
+print("代码。不分句")
+```
+
+| 名称 | 说明 |
+| --- | --- |
+| a | 这是。一个单元格 |
+
+- 列表项一
+  续行
+- 列表项二
+
+## 使用
+
+第二段。
+
+# 其他
+结尾段落。"""
+
+
+def span(doc, target):
+    return doc[target[0]:target[1]]
+
+
+def test_blocks():
+    index = StructureIndex(DOC)
+    kinds = [(b.kind, span(DOC, (b.start, b.end))) for b in index.blocks]
+    assert kinds == [
+        ("front_matter", "---\ntitle: 示例\n---"),
+        ("heading", "# 安装"),
+        ("paragraph", "第一段第一句。第一段第二句。\n继续第一段。"),
+        ("code", '```python\nprint("代码。不分句")\n```'),
+        ("table", "| 名称 | 说明 |\n| --- | --- |\n| a | 这是。一个单元格 |"),
+        ("list_item", "- 列表项一\n  续行"),
+        ("list_item", "- 列表项二"),
+        ("heading", "## 使用"),
+        ("paragraph", "第二段。"),
+        ("heading", "# 其他"),
+        ("paragraph", "结尾段落。"),
+    ]
+    assert index.blocks[7] == Block("heading", DOC.index("## 使用"), DOC.index("## 使用") + 5, 2)
+    assert index.block_at(DOC.index("续行")).kind == "list_item"
+    assert index.block_at(DOC.index("\n\n```")) is None
+
+
+def test_sentences_skip_code_and_front_matter():
+    index = StructureIndex(DOC)
+    chunks = [chunk for _, chunk in index.sentences]
+    text = "".join(chunks)
+    assert "title" not in text and "print" not in text
+    # 表格按行切分，单元格中的句号不会切开
+    assert "| a | 这是。一个单元格 |\n\n" in chunks
+    assert all(DOC[start:start + len(chunk)] == chunk for start, chunk in index.sentences)
+
+
+def test_sections():
+    index = StructureIndex(DOC)
+    install = index.section_by_title("安装")
+    assert span(DOC, install).startswith("# 安装") and span(DOC, install).endswith("第二段。\n\n")
+    assert span(DOC, index.section(2)) == "## 使用\n\n第二段。\n\n"
+    assert span(DOC, index.section(-1)) == "# 其他\n结尾段落。"
+    assert index.section_at(DOC.index("第二段")) == index.section(2)
+    assert index.section_at(0) is None
+
+
+@pytest.mark.parametrize("instruction, expected, rewritten", [
+    ("删除第2段", "第二段。", "删除本段"),
+    ("把第1段第2句改短", "第一段第二句。", "把本句改短"),
+    ("修改最后一段", "结尾段落。", "修改本段"),
+    ("倒数第二段加粗", "第二段。", "本段加粗"),
+    ("把第4行翻译成英文", "# 安装", "把本行翻译成英文"),
+    ("把“使用”一节改写", "## 使用\n\n第二段。\n\n", "把本节改写"),
+    ("rewrite paragraph 2", "第二段。", "rewrite this paragraph"),
+    ("shorten the last paragraph", "结尾段落。", "shorten this paragraph"),
+    ('fix the section "其他"', "# 其他\n结尾段落。", "fix this section"),
+])
+def test_resolve_reference(instruction, expected, rewritten):
+    start, end, result = StructureIndex(DOC).resolve_reference(instruction)
+    assert DOC[start:end] == expected
+    assert result == rewritten
+
+
+def test_resolve_reference_misses():
+    index = StructureIndex(DOC)
+    assert index.resolve_reference('把"我们"改为"他们"') is None
+    assert index.resolve_reference("删除第十二段") is None
+    # 引号中的是要修改的原文，不是结构引用
+    assert index.resolve_reference('把"第二行"改成"第三行"') is None
+    assert index.resolve_reference('Change "the first line" to "x"') is None
+    assert index.resolve_reference("把「第1段第2句」删掉") is None
+
+
+def test_resolve_reference_after_quoted_text():
+    start, end, rewritten = StructureIndex(DOC).resolve_reference('把"第一行"改成"首行"，只改第2段')
+    assert DOC[start:end] == "第二段。"
+    assert rewritten == '把"第一行"改成"首行"，只改本段'
+
+
+def test_line_paragraphs():
+    text = "第一行。\n第二行。\n第三行。"
+    index = StructureIndex(text)
+    assert index.line_paragraphs
+    assert span(text, index.paragraph(2)) == "第二行。"
+    assert span(text, index.line(-1)) == "第三行。"
+    assert index.line(4) is None
+    assert not StructureIndex(text, line_paragraphs=False).line_paragraphs
+    assert span(text, StructureIndex(text, line_paragraphs=False).paragraph(1)) == text
+
+
+def test_parse_number():
+    assert [_parse_number(v) for v in ("3", "十", "十二", "二十", "一百零五", "最后一", "倒数第二")] == [3, 10, 12, 20, 105, -1, -2]
+
+
+@pytest.fixture
+def prompts(use_stub):
+    seen = []
+
+    def respond(system, user):
+        seen.append(user)
+        if "第二段" in user and "第一段" not in user:
+            return json.dumps([{"sentence_start": 0, "original": "第二段", "content": "第2段"}], ensure_ascii=False)
+        return json.dumps([{"sentence_start": DOC.index("结尾"), "original": "结尾", "content": "最后的"}],
+                          ensure_ascii=False)
+
+    use_stub(responder=respond)
+    return seen
+
+
+def test_text2diff_structured(prompts):
+    stats = {}
+    result = text2diff_structured(DOC, "1. 把第2段改成数字\n2. 改一下结尾", use_cache=False, stats=stats)
+    pos = DOC.index("第二段")
+    assert result == [(pos, pos + 3, "第2段"), (DOC.index("结尾"), DOC.index("结尾") + 2, "最后的")]
+    assert stats == {"scoped_instructions": 1, "global_instructions": 1}
+
+    scoped, full = prompts
+    # 带结构引用的指令只发送目标段落
+    assert "‖start:0‖第二段。" in scoped and "结尾" not in scoped and "把本段改成数字" in scoped
+    # 其余指令发送全文，但不包含代码块和 front matter
+    assert "结尾段落" in full and "print" not in full and "title" not in full